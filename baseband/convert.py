@@ -0,0 +1,433 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+"""Conversion of baseband files between formats, using multiple processes.
+
+The input is split in ranges that start and end at frame boundaries for
+both the input and the output format, and each range is read, decoded,
+encoded and written by a separate worker process.  Output goes either to
+one output file, with each worker writing at its own offset, or to one
+file per range, which the parent can merge into a single file at the end.
+
+For instance, to convert a VDIF file to Mark 5B, using four processes::
+
+    >>> from baseband import convert                      # doctest: +SKIP
+    >>> convert.convert('in.vdif', 'out.m5b', 'vdif', 'mark5b',
+    ...                 writer_kwargs=dict(nchan=8, bps=2),
+    ...                 nproc=4)                          # doctest: +SKIP
+    ['out.m5b']
+
+Where the payload bit layout of the two formats is the same, frames can
+instead be rewrapped with `rewrap`, which only translates the headers and
+reuses the payload words as is, so that throughput is limited by disk speed
+rather than by decoding and encoding.  This is possible for Mark 5B to
+VDIF EDV=0xab (Mark 5B over VDIF) and back, and for legacy VDIF to VDIF
+with an extended header.  The same is available from the command line as
+``baseband-convert``.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import io
+import multiprocessing
+import os
+import shutil
+
+import numpy as np
+from astropy import units as u
+
+from . import vdif, mark5b, mark4, dada
+
+try:
+    from math import gcd
+except ImportError:  # pragma: no cover
+    from fractions import gcd
+
+
+__all__ = ['READ_FORMATS', 'WRITE_FORMATS', 'REWRAP_FORMATS',
+           'convert', 'rewrap', 'main']
+
+READ_FORMATS = {'vdif': vdif, 'mark5b': mark5b, 'mark4': mark4,
+                'dada': dada}
+"""Formats that can be read, with the module providing their ``open``."""
+
+WRITE_FORMATS = {'vdif': vdif, 'mark5b': mark5b, 'mark4': mark4}
+"""Formats that can be written (all with fixed-size frames)."""
+
+
+def _get_module(fmt, formats, mode):
+    try:
+        return formats[fmt]
+    except KeyError:
+        raise ValueError("cannot {0} format '{1}'; should be one of {2}."
+                         .format(mode, fmt, sorted(formats.keys())))
+
+
+def _output_frame_info(outformat, writer_kwargs, sample):
+    """Get samples per frame and bytes per frame of the output stream.
+
+    This is done by writing a single frame to memory, filled with zeros
+    shaped and typed like the input ``sample`` (with any dimensions of
+    unity removed, like for data read with ``squeeze=True``).
+    """
+    module = WRITE_FORMATS[outformat]
+    s = io.BytesIO()
+    fw = module.open(s, 'ws', **writer_kwargs)
+    try:
+        samples_per_frame = fw.samples_per_frame
+        sample_shape = tuple(n for n in sample.shape[1:] if n > 1)
+        fw.write(np.zeros((samples_per_frame,) + sample_shape, sample.dtype))
+        fw.fh_raw.flush()
+        bytes_per_frame = len(s.getvalue())
+    finally:
+        fw.close()
+    return samples_per_frame, bytes_per_frame
+
+
+class _CountingFileIO(io.FileIO):
+    """Raw file that keeps track of the number of bytes written to it."""
+    nbytes = 0
+
+    def write(self, b):
+        count = super(_CountingFileIO, self).write(b)
+        self.nbytes += count
+        return count
+
+
+def _convert_range(task):
+    """Convert samples ``start`` to ``stop`` of the input stream.
+
+    Run in worker processes;  see `convert` for the meaning of the
+    items of ``task``.  Returns the number of samples and the number of
+    bytes actually written.
+    """
+    (infile, informat, reader_kwargs, outfile, outformat, writer_kwargs,
+     start, stop, byte_offset, blocksize) = task
+    with READ_FORMATS[informat].open(infile, 'rs', **reader_kwargs) as fr:
+        if byte_offset is None:
+            fh = _CountingFileIO(outfile, 'wb')
+        else:
+            fh = _CountingFileIO(outfile, 'r+b')
+            fh.seek(byte_offset)
+        with WRITE_FORMATS[outformat].open(fh, 'ws', **writer_kwargs) as fw:
+            # Headers are calculated from the offset, so setting it ensures
+            # times and frame numbers are those for the full stream.
+            fw.offset = start
+            fr.seek(start)
+            while fr.tell() < stop:
+                fw.write(fr.read(min(blocksize, stop - fr.tell())))
+            nsample = fw.tell() - start
+    return nsample, fh.nbytes
+
+
+def convert(infile, outfile, informat, outformat, reader_kwargs=None,
+            writer_kwargs=None, nproc=None, samples_per_range=None,
+            split=False, merge=None, blocksize=None):
+    """Convert a baseband file to another format (or bit depth, etc.).
+
+    The input is split in ranges, which are converted in parallel by a pool
+    of worker processes, each using the regular stream readers and writers.
+
+    Parameters
+    ----------
+    infile : str
+        Name of the input file.
+    outfile : str
+        Name of the output file.  If ``split`` is `True`, should be a
+        template, which will be formatted with ``part`` (the range number).
+    informat : str
+        Format of the input file; one of the keys of `READ_FORMATS`.
+    outformat : str
+        Format of the output file; one of the keys of `WRITE_FORMATS`.
+    reader_kwargs : dict, optional
+        Further arguments needed to open the input as a stream.
+    writer_kwargs : dict, optional
+        Arguments with which to open the output stream.  These should
+        describe the start of the full output stream.  If no ``header`` or
+        ``time`` is given, the start time of the input is used, and if no
+        ``frames_per_second`` or ``sample_rate``, the input sample rate.
+    nproc : int, optional
+        Number of worker processes.  Default: number of CPUs.  If 1, the
+        conversion is done in the calling process.
+    samples_per_range : int, optional
+        Number of samples converted by each worker in one go.  Will be
+        rounded up to a whole number of input and output frames.  By default,
+        the input is divided evenly over the workers.
+    split : bool, optional
+        Whether to write a separate output file for each range.  If `False`
+        (default), a single output file is created, of the right size, to
+        which each worker writes its range at the appropriate offset.
+        If `True`, each worker writes its own file;  unless ``merge`` is
+        given, the list of files returned can be opened as a single stream,
+        e.g., with ``vdif.open(outfiles, 'rs')`` (which uses
+        `~baseband.helpers.sequentialfile` to read them as one file).
+    merge : str, optional
+        Only used if ``split`` is `True`.  Name of a file into which the
+        parent concatenates the parts once all workers are done, after
+        which the parts are removed.  Useful where the output file system
+        does not support writing at offsets from different processes.
+    blocksize : int, optional
+        Maximum number of samples read and written at a time.  Default: as
+        many frames as fit in about 1 million samples.
+
+    Returns
+    -------
+    outfiles : list of str
+        Names of the files written (``[merge]`` if the parts were merged).
+
+    Raises
+    ------
+    IOError
+        If any of the workers did not write the expected number of samples
+        or bytes.
+    """
+    in_module = _get_module(informat, READ_FORMATS, 'read')
+    _get_module(outformat, WRITE_FORMATS, 'write')
+    if merge is not None and not split:
+        raise ValueError("can only merge output files if split=True.")
+    reader_kwargs = {} if reader_kwargs is None else reader_kwargs
+    writer_kwargs = {} if writer_kwargs is None else dict(writer_kwargs)
+
+    with in_module.open(infile, 'rs', **reader_kwargs) as fr:
+        nsample = fr.size
+        in_samples_per_frame = fr.samples_per_frame
+        sample = fr.read(1, squeeze=False)
+        if 'header' not in writer_kwargs:
+            writer_kwargs.setdefault('time', fr.time0)
+        if('frames_per_second' not in writer_kwargs and
+           'sample_rate' not in writer_kwargs):
+            writer_kwargs['sample_rate'] = (fr.samples_per_frame *
+                                            fr.frames_per_second * u.Hz)
+
+    out_samples_per_frame, out_bytes_per_frame = _output_frame_info(
+        outformat, writer_kwargs, sample)
+    # Ranges should consist of whole frames in both input and output.
+    unit = (in_samples_per_frame * out_samples_per_frame //
+            gcd(in_samples_per_frame, out_samples_per_frame))
+    nunit = -(-nsample // unit)
+    if nproc is None:
+        nproc = multiprocessing.cpu_count()
+    if samples_per_range is None:
+        units_per_range = -(-nunit // nproc)
+    else:
+        units_per_range = -(-samples_per_range // unit)
+    samples_per_range = units_per_range * unit
+    if blocksize is None:
+        blocksize = max(1, 2**20 // unit) * unit
+
+    starts = list(range(0, nsample, samples_per_range))
+    stops = starts[1:] + [nsample]
+    if split:
+        outfiles = [outfile.format(part=part) for part in range(len(starts))]
+        byte_offsets = [None] * len(starts)
+    else:
+        # Pre-size the output file, so that all workers can write into it.
+        nframe = -(-nsample // out_samples_per_frame)
+        with io.open(outfile, 'wb') as fh:
+            fh.truncate(nframe * out_bytes_per_frame)
+        outfiles = [outfile]
+        byte_offsets = [start // out_samples_per_frame * out_bytes_per_frame
+                        for start in starts]
+
+    tasks = [(infile, informat, reader_kwargs,
+              outfiles[part if split else 0], outformat, writer_kwargs,
+              start, stop, byte_offset, blocksize)
+             for part, (start, stop, byte_offset) in enumerate(
+                 zip(starts, stops, byte_offsets))]
+
+    if nproc == 1:
+        written = [_convert_range(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(min(nproc, len(tasks)))
+        try:
+            written = pool.map(_convert_range, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    for start, stop, (nsample_written, nbytes_written) in zip(
+            starts, stops, written):
+        nbytes = (-(-(stop - start) // out_samples_per_frame) *
+                  out_bytes_per_frame)
+        if nsample_written != stop - start or nbytes_written != nbytes:
+            raise IOError("conversion of samples {0} to {1} wrote {2} "
+                          "samples and {3} bytes, instead of {4} samples "
+                          "and {5} bytes.".format(
+                              start, stop, nsample_written, nbytes_written,
+                              stop - start, nbytes))
+
+    if merge is not None:
+        with io.open(merge, 'wb') as fw:
+            for part_file in outfiles:
+                with io.open(part_file, 'rb') as fh:
+                    shutil.copyfileobj(fh, fw)
+        for part_file in outfiles:
+            os.remove(part_file)
+        outfiles = [merge]
+
+    return outfiles
+
+
+def _mark5b_to_vdif(frame, **kwargs):
+    """Rewrap a Mark 5B frame as a Mark 5B over VDIF (EDV=0xab) frame."""
+    return vdif.VDIFFrame.from_mark5b_frame(frame, **kwargs)
+
+
+def _vdif_to_mark5b(frame, **kwargs):
+    """Unwrap a Mark 5B over VDIF (EDV=0xab) frame to a Mark 5B frame."""
+    header = frame.header
+    if header.edv != 0xab:
+        raise ValueError("can only rewrap VDIF frames with EDV=0xab as "
+                         "Mark 5B, not EDV={0}.".format(header.edv))
+    m5h = mark5b.Mark5BHeader(header.words[4:], verify=False, **kwargs)
+    payload = mark5b.Mark5BPayload(frame.payload.words, nchan=header.nchan,
+                                   bps=header.bps)
+    return mark5b.Mark5BFrame(m5h, payload, valid=frame.valid)
+
+
+def _vdif_to_vdif(frame, edv=0, **kwargs):
+    """Rewrap a legacy VDIF frame as one with an extended header."""
+    header = frame.header
+    if header.edv is not False:
+        raise ValueError("can only add an extended header to legacy VDIF "
+                         "frames, not to ones with EDV={0}."
+                         .format(header.edv))
+    values = dict(header)
+    values.pop('legacy_mode')
+    # frame_length is in units of 8 bytes and includes the header, which
+    # grows from 16 to 32 bytes.
+    values['frame_length'] += 2
+    values.update(kwargs)
+    new_header = vdif.VDIFHeader.fromvalues(edv=edv, **values)
+    payload = vdif.VDIFPayload(frame.payload.words, new_header)
+    return vdif.VDIFFrame(new_header, payload)
+
+
+REWRAP_FORMATS = {('mark5b', 'vdif'): _mark5b_to_vdif,
+                  ('vdif', 'mark5b'): _vdif_to_mark5b,
+                  ('vdif', 'vdif'): _vdif_to_vdif}
+"""Pairs of formats between which frames can be rewrapped without decoding,
+with the function that translates a single frame."""
+
+
+def rewrap(infile, outfile, informat, outformat, reader_kwargs=None,
+           header_kwargs=None):
+    """Convert a baseband file to another format without decoding the data.
+
+    Frames are read one by one, their headers are translated, and they are
+    written out with the original payload words.  This only works for
+    formats with the same payload bit layout, as listed in `REWRAP_FORMATS`:
+
+    - ``mark5b`` to ``vdif``: Mark 5B frames become Mark 5B over VDIF
+      (EDV=0xab) frames.  Since the Mark 5B header does not contain the
+      number of channels and bits per sample, ``reader_kwargs`` should hold
+      ``nchan`` and ``bps``, as well as ``ref_mjd`` to determine the time.
+    - ``vdif`` to ``mark5b``: Mark 5B over VDIF frames become Mark 5B frames.
+    - ``vdif`` to ``vdif``: legacy VDIF frames get an extended header, by
+      default with EDV=0 (which can be changed by passing ``edv`` in
+      ``header_kwargs``).
+
+    Parameters
+    ----------
+    infile : str
+        Name of the input file.
+    outfile : str
+        Name of the output file.
+    informat : str
+        Format of the input file.
+    outformat : str
+        Format of the output file.
+    reader_kwargs : dict, optional
+        Further arguments needed to read a frame from the input file (as
+        passed on to the ``read_frame`` method of the binary file reader).
+    header_kwargs : dict, optional
+        Further header values for the output frames, e.g., ``station`` for
+        VDIF.
+
+    Returns
+    -------
+    nframes : int
+        Number of frames written.
+    """
+    try:
+        translate = REWRAP_FORMATS[informat, outformat]
+    except KeyError:
+        raise ValueError("cannot rewrap format '{0}' as '{1}'; should be one "
+                         "of {2}.".format(informat, outformat,
+                                          sorted(REWRAP_FORMATS.keys())))
+    reader_kwargs = {} if reader_kwargs is None else reader_kwargs
+    header_kwargs = {} if header_kwargs is None else header_kwargs
+
+    nframes = 0
+    with READ_FORMATS[informat].open(infile, 'rb') as fr, \
+            WRITE_FORMATS[outformat].open(outfile, 'wb') as fw:
+        while True:
+            try:
+                frame = fr.read_frame(**reader_kwargs)
+            except EOFError:
+                break
+            translate(frame, **header_kwargs).tofile(fw)
+            nframes += 1
+
+    return nframes
+
+
+def main(args=None):
+    """Command-line interface to rewrap baseband files (``baseband-convert``).
+
+    Parameters
+    ----------
+    args : list of str, optional
+        Command-line arguments.  Default: taken from `sys.argv`.
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert a baseband file to another format by rewrapping "
+        "its frames, i.e., translating only the headers and reusing the "
+        "payloads without decoding.  Supported are Mark 5B to VDIF EDV=0xab "
+        "and back, and legacy VDIF to VDIF with an extended header.")
+    parser.add_argument('infile', help="name of the input file")
+    parser.add_argument('outfile', help="name of the output file")
+    parser.add_argument('-f', '--from', dest='informat', required=True,
+                        choices=sorted(set(f for f, _ in REWRAP_FORMATS)),
+                        help="format of the input file")
+    parser.add_argument('-t', '--to', dest='outformat', required=True,
+                        choices=sorted(set(f for _, f in REWRAP_FORMATS)),
+                        help="format of the output file")
+    parser.add_argument('--nchan', type=int,
+                        help="number of channels (for Mark 5B input)")
+    parser.add_argument('--bps', type=int, default=2,
+                        help="bits per sample (for Mark 5B input; "
+                        "default: 2)")
+    parser.add_argument('--ref-mjd', type=float,
+                        help="reference MJD to determine the time (for "
+                        "Mark 5B input)")
+    parser.add_argument('--edv', type=int, default=0,
+                        help="EDV of the extended header (for legacy VDIF "
+                        "input; default: 0)")
+    parser.add_argument('--station',
+                        help="station ID to put in the VDIF header")
+    args = parser.parse_args(args)
+
+    reader_kwargs = {}
+    header_kwargs = {}
+    if args.informat == 'mark5b':
+        if args.nchan is None or args.ref_mjd is None:
+            parser.error("--nchan and --ref-mjd are required for Mark 5B "
+                         "input.")
+        reader_kwargs = dict(nchan=args.nchan, bps=args.bps,
+                             ref_mjd=args.ref_mjd)
+    elif args.outformat == 'vdif':
+        header_kwargs['edv'] = args.edv
+    if args.station is not None:
+        if args.outformat != 'vdif':
+            parser.error("--station can only be set for VDIF output.")
+        header_kwargs['station'] = args.station
+
+    try:
+        nframes = rewrap(args.infile, args.outfile, args.informat,
+                         args.outformat, reader_kwargs=reader_kwargs,
+                         header_kwargs=header_kwargs)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    print("Rewrapped {0} frames from {1} to {2}."
+          .format(nframes, args.infile, args.outfile))
@@ -9,6 +9,7 @@ from astropy.utils import lazyproperty
 
 from ..vlbi_base.base import (VLBIStreamBase, VLBIStreamReaderBase,
                               VLBIStreamWriterBase)
+from ..helpers.sequentialfile import FileCache
 from .header import DADAHeader
 from .payload import DADAPayload
 from .frame import DADAFrame
@@ -27,7 +28,11 @@ class DADAFileNameSequencer:
     calculated using ``header['OBS_OFFSET'] + file_nr * header['FILE_SIZE']``.
 
     The length of the instance will be the number of files that exist that
-    match the template for increasing values of the file fumber.
+    match the template for increasing values of the file fumber.  It is
+    determined by scanning the directory once, and cached.  On later calls,
+    only the existence of the next file is checked, and the directory is
+    rescanned if it has appeared (as for a growing observation).  To force
+    a rescan, e.g., if files have been removed, use `refresh`.
 
     Parameters
     ----------
@@ -72,6 +77,7 @@ class DADAFileNameSequencer:
         if self._has_obs_offset:
             self._obs_offset0 = self.items['OBS_OFFSET']
             self._file_size = header['FILE_SIZE']
+        self._nfiles = None
 
     def __getitem__(self, frame_nr):
         if frame_nr < 0:
@@ -86,11 +92,27 @@ class DADAFileNameSequencer:
         return self.template.format(**self.items)
 
     def __len__(self):
+        if self._nfiles is None or os.path.isfile(self[self._nfiles]):
+            self.refresh()
+
+        return self._nfiles
+
+    def refresh(self):
+        """Determine the number of files by scanning their directory."""
+        listings = {}
         frame_nr = 0
-        while os.path.isfile(self[frame_nr]):
+        while True:
+            dirname, basename = os.path.split(self[frame_nr])
+            if dirname not in listings:
+                try:
+                    listings[dirname] = set(os.listdir(dirname or os.curdir))
+                except OSError:
+                    listings[dirname] = set()
+            if basename not in listings[dirname]:
+                break
             frame_nr += 1
 
-        return frame_nr
+        self._nfiles = frame_nr
 
 
 class DADAFileReader(io.BufferedReader):
@@ -251,16 +273,25 @@ class DADAStreamReader(DADAStreamBase, VLBIStreamReaderBase):
         and other header keywords.  Many series of dada files can be read with
         something like '2013-07-02-01:37:40_{obs_offset:016d}.000000.dada'.
         For details, see :class:`~baseband.dada.base.DADAFileNameSequencer`.
+    max_open_files : int, optional
+        For multiple files, the maximum number kept open (with their payloads
+        mapped), so that going back and forth between files does not require
+        reopening them.  Default: 8.
     """
-    def __init__(self, raw, thread_ids=None, files=None, template=None):
+    def __init__(self, raw, thread_ids=None, files=None, template=None,
+                 max_open_files=8):
         header = DADAHeader.fromfile(raw)
         super(DADAStreamReader, self).__init__(raw, header, thread_ids,
                                                files=files, template=template)
         if self.files is None:
+            self._file_cache = None
             self._frame = DADAFrame(header, DADAPayload.fromfile(raw, header,
                                                                  memmap=True))
             self._frame_nr = 0
         else:
+            self._file_cache = FileCache(self._read_file, max_open_files,
+                                         closer=lambda item: item[0].close())
+            self.fh_raw.close()
             self._get_frame(0)
 
     @lazyproperty
@@ -270,7 +301,17 @@ class DADAStreamReader(DADAStreamBase, VLBIStreamReaderBase):
             self._get_frame(len(self.files) - 1)
         return self._frame.header
 
-    def read(self, count=None, squeeze=True, out=None):
+    @property
+    def raw_offset(self):
+        """Level offset of raw values (see ``raw`` argument of `read`)."""
+        return self._frame.payload.raw_offset
+
+    @property
+    def raw_scale(self):
+        """Scale of raw values (see ``raw`` argument of `read`)."""
+        return self._frame.payload.raw_scale
+
+    def read(self, count=None, squeeze=True, out=None, raw=False):
         """Read count samples.
 
         Parameters
@@ -284,6 +325,15 @@ class DADAStreamReader(DADAStreamBase, VLBIStreamReaderBase):
         out : `None` or array
             Array to store the data in. If given, ``count`` will be inferred.
             If ``squeeze`` is `True`, unity dimensions can be absent.
+            Cannot be used with ``raw``.
+        raw : bool
+            If `True`, return the encoded integer values rather than decoded
+            ones, with for complex data an extra trailing dimension of length
+            2 for the real and imaginary parts.  If the requested samples are
+            all in one file and all threads are read, the result is a view
+            into the memory-mapped file, i.e., no data are copied.  To convert
+            to decoded values, use ``(raw - raw_offset) * raw_scale``.
+            Only possible for 8 and 16 bits per sample.  Default: `False`.
 
         Returns
         -------
@@ -292,6 +342,12 @@ class DADAStreamReader(DADAStreamBase, VLBIStreamReaderBase):
             length unity possibly removed (if ``squeeze`` is `True`, or if they
             were not present in the ``out`` array passed in).
         """
+        if raw:
+            if out is not None:
+                raise ValueError("cannot read raw values into an output "
+                                 "array.")
+            return self._read_raw(count, squeeze)
+
         if out is None:
             if count is None or count < 0:
                 count = self.size - self.offset
@@ -325,12 +381,58 @@ class DADAStreamReader(DADAStreamBase, VLBIStreamReaderBase):
 
         return out
 
-    def _get_frame(self, frame_nr):
-        self._open_file(frame_nr, 'rb')
-        self._frame = self.fh_raw.read_frame(memmap=True)
-        assert (self._frame.header['OBS_OFFSET'] ==
+    def _read_raw(self, count, squeeze):
+        if count is None or count < 0:
+            count = self.size - self.offset
+
+        all_threads = (self.thread_ids ==
+                       list(range(self._frame.payload.sample_shape[0])))
+        parts = []
+        while count > 0:
+            frame_nr, sample_offset = self._frame_info()
+            if frame_nr != self._frame_nr:
+                self._get_frame(frame_nr)
+
+            nsample = min(count, self.samples_per_frame - sample_offset)
+            part = self._frame.payload.raw[sample_offset:
+                                           sample_offset + nsample]
+            if not all_threads:
+                part = part[:, self.thread_ids]
+            parts.append(part)
+            self.offset += nsample
+            count -= nsample
+
+        if len(parts) == 1:
+            result = parts[0]
+        elif parts:
+            result = np.concatenate(parts)
+        else:
+            result = self._frame.payload.raw[:0, self.thread_ids]
+        if squeeze:
+            # Only remove thread and channel dimensions; sample and complex
+            # dimensions are kept.
+            result = result.reshape(
+                result.shape[:1] +
+                tuple(n for n in result.shape[1:3] if n > 1) +
+                result.shape[3:])
+        return result
+
+    def _read_file(self, frame_nr):
+        fh = open(self.files[frame_nr], 'rb')
+        frame = fh.read_frame(memmap=True)
+        assert (frame.header['OBS_OFFSET'] ==
                 self.header0['OBS_OFFSET'] + frame_nr *
                 self.header0.payloadsize)
+        return fh, frame
+
+    def _get_frame(self, frame_nr):
+        self.fh_raw, self._frame = self._file_cache.get(frame_nr)
+        self._frame_nr = frame_nr
+
+    def close(self):
+        if self._file_cache is not None:
+            self._file_cache.close()
+        return super(DADAStreamReader, self).close()
 
 
 class DADAStreamWriter(DADAStreamBase, VLBIStreamWriterBase):
@@ -7,7 +7,59 @@ import numpy as np
 from ..vlbi_base.payload import VLBIPayloadBase
 
 
-__all__ = ['DADAPayload']
+__all__ = ['init_luts', 'decode_2bit', 'encode_2bit', 'decode_4bit',
+           'encode_4bit', 'decode_8bit', 'encode_8bit', 'decode_16bit',
+           'encode_16bit', 'DADAPayload']
+
+
+def init_luts():
+    """Set up the look-up tables for levels as a function of input byte.
+
+    As for 8 and 16 bits, samples are taken to be signed (two's complement)
+    integers, with the first sample in the least significant bits.
+    """
+    b = np.arange(256)[:, np.newaxis]
+    # 2-bit mode
+    i = np.arange(0, 8, 2)
+    lut2bit = (((b >> i) & 3) ^ 2) - 2
+    # 4-bit mode
+    i = np.arange(0, 8, 4)
+    lut4bit = (((b >> i) & 0xf) ^ 8) - 8
+    return lut2bit.astype(np.float32), lut4bit.astype(np.float32)
+
+lut2bit, lut4bit = init_luts()
+
+
+def decode_2bit(words):
+    b = words.view(np.uint8, np.ndarray)
+    return lut2bit.take(b, axis=0)
+
+
+shift2bit = np.arange(0, 8, 2).astype(np.uint8)
+
+
+def encode_2bit(values):
+    bitvalues = (np.clip(np.rint(values), -2, 1).astype(np.int8)
+                 .view(np.uint8).reshape(-1, 4))
+    bitvalues &= 3
+    bitvalues <<= shift2bit
+    return np.bitwise_or.reduce(bitvalues, axis=-1)
+
+
+def decode_4bit(words):
+    b = words.view(np.uint8, np.ndarray)
+    return lut4bit.take(b, axis=0)
+
+
+shift04 = np.array([0, 4], np.uint8)
+
+
+def encode_4bit(values):
+    b = (np.clip(np.rint(values), -8, 7).astype(np.int8)
+         .view(np.uint8).reshape(-1, 2))
+    b &= 0xf
+    b <<= shift04
+    return b[:, 0] | b[:, 1]
 
 
 def decode_8bit(words):
@@ -18,6 +70,14 @@ def encode_8bit(values):
     return np.clip(np.rint(values), -128, 127).astype(np.int8)
 
 
+def decode_16bit(words):
+    return words.view('<i2', np.ndarray).astype(np.float32)
+
+
+def encode_16bit(values):
+    return np.clip(np.rint(values), -32768, 32767).astype('<i2')
+
+
 class DADAPayload(VLBIPayloadBase):
     """Container for decoding and encoding DADA payloads.
 
@@ -31,16 +91,31 @@ class DADAPayload(VLBIPayloadBase):
         If not give, the following arguments have to be passed in.
     bps : int
         Number of bits per sample part (i.e., per channel and per real or
-        imaginary component).  Default: 8.
+        imaginary component).  Can be 2, 4, 8, or 16; in all cases, values
+        are stored as signed integers.  Default: 8.
     sample_shape : tuple
         Shape of the samples; e.g., (nchan,).  Default: ().
     complex_data : bool
         Whether data is complex or float.  Default: False.
     """
     _decoders = {
-        8: decode_8bit}
+        2: decode_2bit,
+        4: decode_4bit,
+        8: decode_8bit,
+        16: decode_16bit}
     _encoders = {
-        8: encode_8bit}
+        2: encode_2bit,
+        4: encode_4bit,
+        8: encode_8bit,
+        16: encode_16bit}
+    _raw_dtypes = {
+        8: np.dtype('i1'),
+        16: np.dtype('<i2')}
+    # Raw values are only available for bps for which each part of a sample
+    # is a whole, signed integer; 2 and 4 bit values are packed in bytes.
+    _raw_levels = {
+        8: (0., 1.),
+        16: (0., 1.)}
 
     def __init__(self, words, header=None, bps=8, sample_shape=(),
                  complex_data=False):
@@ -65,7 +140,10 @@ class DADAPayload(VLBIPayloadBase):
             and ``complex_data``.  If not given, those have to be passed in.
         memmap : bool, optional
             If `False` (default), read from file.  Otherwise, map the file in
-            memory (see `~numpy.memmap`).
+            memory (see `~numpy.memmap`).  If ``fh`` has its own ``memmap``
+            method, as for a
+            `~baseband.helpers.sequentialfile.SequentialFileReader`, that is
+            used, so that payloads can span multiple files.
         payloadsize : int, optional
             Number of bytes to read (default: as given in ``header``,
             ``cls._size``, or, for mapping, to the end of the file).
@@ -83,9 +161,46 @@ class DADAPayload(VLBIPayloadBase):
 
         mode = fh.mode.replace('b', '')
         offset = fh.tell()
-        words = np.memmap(fh, mode=mode, dtype=cls._dtype_word, offset=offset,
-                          shape=(None if payloadsize is None else
-                                 (payloadsize // cls._dtype_word.itemsize,)))
+        shape = (None if payloadsize is None else
+                 (payloadsize // cls._dtype_word.itemsize,))
+        if hasattr(fh, 'memmap'):
+            words = fh.memmap(dtype=cls._dtype_word, mode=mode, offset=offset,
+                              shape=shape)
+        else:
+            words = np.memmap(fh, mode=mode, dtype=cls._dtype_word,
+                              offset=offset, shape=shape)
         self = cls(words, header=header, **kwargs)
         fh.seek(offset + self.size)
         return self
+
+    @property
+    def raw(self):
+        """Encoded values, as an integer view of the words (no copy is made).
+
+        The shape is ``(nsample,) + sample_shape``, with for complex data an
+        additional trailing dimension of length 2 holding the real and
+        imaginary parts.  Decoded values equal ``(raw - raw_offset) *
+        raw_scale``.  Only available for 8 and 16 bits per sample.
+        """
+        self._check_raw()
+        return self.words.view(self._raw_dtypes[self.bps], np.ndarray).reshape(
+            self.shape + ((2,) if self.complex_data else ()))
+
+    @property
+    def raw_offset(self):
+        """Level offset to subtract from raw values to get decoded ones."""
+        self._check_raw()
+        return self._raw_levels[self.bps][0]
+
+    @property
+    def raw_scale(self):
+        """Scale by which to multiply offset raw values to get decoded ones."""
+        self._check_raw()
+        return self._raw_levels[self.bps][1]
+
+    def _check_raw(self):
+        if self.bps not in self._raw_dtypes:
+            raise ValueError("raw values are only available for {0} bits "
+                             "per sample, not for {1}, since those are "
+                             "packed; decode the data instead."
+                             .format(sorted(self._raw_dtypes), self.bps))
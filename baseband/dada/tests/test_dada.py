@@ -3,12 +3,14 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import io
+import os
 import copy
 import numpy as np
 import astropy.units as u
 from astropy.time import Time
 from astropy.tests.helper import pytest, catch_warnings
 from ... import dada
+from ...helpers import sequentialfile as sf
 from ..base import DADAFileNameSequencer
 from ...data import SAMPLE_DADA as SAMPLE_FILE
 
@@ -169,6 +171,35 @@ class TestDADA(object):
         assert not isinstance(payload.words, np.memmap)
         assert payload == payload4
 
+    @pytest.mark.parametrize('bps', (2, 4, 8, 16))
+    def test_payload_bps(self, bps, tmpdir):
+        low, high = -2**(bps-1), 2**(bps-1) - 1
+        data = np.arange(low, high + 1).astype(np.float32)
+        data = np.tile(data, 64 // data.size + 1)[:64]
+        data = (data + 1j * data[::-1]).astype(np.complex64).reshape(16, 2, 2)
+        payload = dada.DADAPayload.fromdata(data, bps=bps)
+        assert payload.size == 64 * 2 * bps // 8
+        assert np.all(payload.data == data)
+        assert np.all(payload[3:7] == data[3:7])
+        # Values out of range are clipped.
+        payload2 = dada.DADAPayload.fromdata(data * 2**bps, bps=bps)
+        assert np.all(payload2.data.real == np.where(data.real < 0,
+                                                     low, np.where(
+                                                         data.real > 0,
+                                                         high, 0)))
+        # Check that it works for mapped payloads too.
+        header = dada.DADAHeader.fromvalues(
+            time=self.header.time, bandwidth=self.header.bandwidth,
+            payloadsize=payload.size, bps=bps, complex_data=True,
+            sample_shape=(2, 2))
+        filename = str(tmpdir.join('a.dada'))
+        with dada.open(filename, 'wb') as fw:
+            fw.write_frame(data, header)
+        with dada.open(filename, 'rs') as fh:
+            assert fh.header0.bps == bps
+            assert isinstance(fh._frame.payload.words, np.memmap)
+            assert np.all(fh.read() == data)
+
     def test_frame(self):
         with dada.open(SAMPLE_FILE, 'rb') as fh:
             frame = fh.read_frame(memmap=False)
@@ -263,6 +294,28 @@ class TestDADA(object):
             frame9 = fh.read_frame()
         assert frame9 == frame
 
+    def test_frame_memmap_across_files(self, tmpdir):
+        # Split the sample file such that the payload straddles two files.
+        with open(SAMPLE_FILE, 'rb') as fh:
+            data = fh.read()
+        split = self.header.size + 1001
+        files = [str(tmpdir.join('part{0}.dada'.format(i))) for i in range(2)]
+        for name, part in zip(files, (data[:split], data[split:])):
+            with open(name, 'wb') as fw:
+                fw.write(part)
+
+        with sf.open(files) as fh:
+            frame = dada.DADAFrame.fromfile(fh, memmap=True)
+            assert fh.tell() == len(data)
+        assert isinstance(frame.payload.words, sf.SequentialMemmap)
+        assert frame.header == self.header
+        assert frame.payload == self.payload
+        assert np.all(frame.data == self.payload.data)
+        # Slices within one file and across the boundary.
+        for item in (slice(0, 10), slice(240, 260), slice(None, None, 7)):
+            assert np.all(frame[item] == self.payload[item])
+        assert np.all(frame.payload.raw == self.payload.raw)
+
     def test_filestreamer(self, tmpdir):
         time0 = self.header.time
         with dada.open(SAMPLE_FILE, 'rs') as fh:
@@ -322,6 +375,84 @@ class TestDADA(object):
             assert np.abs(fh.time1 - (time0 + 16000 / (16.*u.MHz))) < 1.*u.ns
         assert np.all(data == self.payload.data[:, 0, 0])
 
+    def test_raw_read(self, tmpdir):
+        assert self.payload.raw.shape == (16000, 2, 1, 2)
+        assert self.payload.raw.dtype == np.int8
+        decoded = ((self.payload.raw - self.payload.raw_offset) *
+                   self.payload.raw_scale).astype(np.float32)
+        assert np.all(decoded.view(np.complex64)[..., 0] == self.payload.data)
+        data = self.payload.data.squeeze()
+        with dada.open(SAMPLE_FILE, 'rs') as fh:
+            assert fh.raw_offset == 0. and fh.raw_scale == 1.
+            fh.seek(10)
+            raw = fh.read(100, raw=True)
+            assert fh.tell() == 110
+            assert raw.shape == (100, 2, 2)
+            assert raw.dtype == np.int8
+            # No copy is made.
+            assert np.may_share_memory(raw, fh._frame.payload.words)
+            assert np.all(raw.astype(np.float32).view(np.complex64)[..., 0] ==
+                          data[10:110])
+            with pytest.raises(ValueError):
+                fh.read(10, out=np.empty((10, 2, 2), np.int8), raw=True)
+
+        with dada.open(SAMPLE_FILE, 'rs', thread_ids=[1]) as fh:
+            raw = fh.read(10, raw=True)
+            assert raw.shape == (10, 2)
+            assert np.all(raw.astype(np.float32).view(np.complex64)[:, 0] ==
+                          data[:10, 1])
+
+        # Across files, the parts are concatenated.
+        header = self.header.copy()
+        header.payloadsize = self.header.payloadsize // 2
+        filenames = (str(tmpdir.join('a.dada')),
+                     str(tmpdir.join('b.dada')))
+        with dada.open(filenames, 'ws', header=header) as fw:
+            fw.write(data)
+        with dada.open(filenames, 'rs') as fh:
+            fh.seek(7990)
+            raw = fh.read(20, raw=True)
+            assert fh.tell() == 8010
+            assert np.all(raw.astype(np.float32).view(np.complex64)[..., 0] ==
+                          data[7990:8010])
+            assert fh.read(raw=True).shape == (7990, 2, 2)
+
+    @pytest.mark.parametrize('bps', (2, 4))
+    def test_raw_read_packed(self, tmpdir, bps):
+        # For 2 and 4 bits, values are packed in bytes, so raw values
+        # cannot be given.
+        data = self.payload.data.squeeze()
+        payload = dada.DADAPayload.fromdata(data, bps=bps)
+        for attr in ('raw', 'raw_offset', 'raw_scale'):
+            with pytest.raises(ValueError) as excinfo:
+                getattr(payload, attr)
+            assert 'bits per sample' in str(excinfo.value)
+
+        header = self.header.copy()
+        header.bps = bps
+        header.payloadsize = payload.size
+        filename = str(tmpdir.join('packed.dada'))
+        with dada.open(filename, 'ws', header=header) as fw:
+            fw.write(data)
+        with dada.open(filename, 'rs') as fh:
+            fh.seek(10)
+            with pytest.raises(ValueError):
+                fh.read(10, raw=True)
+            assert fh.tell() == 10
+            assert np.all(fh.read(10) == payload.data[10:20])
+
+    def test_iter_chunks(self):
+        with dada.open(SAMPLE_FILE, 'rs') as fh:
+            blocks = [block.copy() for block in
+                      fh.iter_chunks(6000, overlap=1000)]
+            assert fh.tell() == 16000
+
+        assert len(blocks) == 3
+        for i, block in enumerate(blocks):
+            assert block.shape == (6000, 2)
+            assert np.all(block == self.payload[i * 5000:
+                                                i * 5000 + 6000].squeeze())
+
     def test_incomplete_stream(self, tmpdir):
         filename = str(tmpdir.join('a.dada'))
         with catch_warnings(UserWarning) as w:
@@ -361,6 +492,37 @@ class TestDADA(object):
             assert fr.tell(unit='time') == fr.time1
         assert np.all(data2 == data)
 
+        # Going back and forth should not require reopening files.
+        with dada.open(filenames, 'rs', max_open_files=2) as fr:
+            for offset in (7990, 10, 8010, 20):
+                fr.seek(offset)
+                assert np.all(fr.read(20) == data[offset:offset+20])
+            assert len(fr._file_cache) == 2
+            fh_raws = [fr._file_cache.get(i)[0] for i in range(2)]
+        assert all(fh_raw.closed for fh_raw in fh_raws)
+
+    @pytest.mark.parametrize(('nsample', 'overlap'),
+                             ((4000, 0), (3000, 500), (5000, 4999)))
+    def test_iter_chunks(self, tmpdir, nsample, overlap):
+        # Write the sample data as four frames, so that blocks span files.
+        data = self.payload.data.squeeze()
+        header = self.header.copy()
+        header.payloadsize = self.header.payloadsize // 4
+        template = str(tmpdir.join('a{frame_nr}.dada'))
+        with dada.open(template, 'ws', header=header) as fw:
+            fw.write(data)
+
+        with dada.open(template, 'rs') as fr:
+            step = nsample - overlap
+            nblock = 0
+            for i, block in enumerate(fr.iter_chunks(nsample,
+                                                     overlap=overlap)):
+                assert block.shape == (nsample,) + data.shape[1:]
+                assert np.all(block == data[i * step:i * step + nsample])
+                nblock += 1
+            assert nblock == (len(data) - overlap) // step
+            assert fr.tell() == overlap + nblock * step
+
     def test_template_stream(self, tmpdir):
         time0 = self.header.time
         data = self.payload.data.squeeze()
@@ -485,3 +647,36 @@ class TestDADAFileNameSequencer(object):
         assert fns[-1].endswith('a4.dada')
         with pytest.raises(IndexError):
             fns[-10]
+
+    def test_len_cached(self, tmpdir, monkeypatch):
+        template = str(tmpdir.join('a{frame_nr}.dada'))
+        fns = DADAFileNameSequencer(template, {})
+        for i in range(20):
+            with open(fns[i], 'wb') as fh:
+                fh.write(b'bird')
+
+        listdir = os.listdir
+        scanned = []
+
+        def counting_listdir(path):
+            scanned.append(path)
+            return listdir(path)
+
+        monkeypatch.setattr(os, 'listdir', counting_listdir)
+        assert len(fns) == 20
+        assert scanned == [str(tmpdir)]
+        assert len(fns) == 20
+        assert fns[-1] == fns[19]
+        assert len(scanned) == 1
+        # A growing observation is noticed.
+        with open(fns[20], 'wb') as fh:
+            fh.write(b'bird')
+        assert len(fns) == 21
+        assert len(scanned) == 2
+        # Removed files are only noticed after a refresh.
+        os.remove(fns[15])
+        assert len(fns) == 21
+        fns.refresh()
+        assert len(fns) == 15
+        assert len(scanned) == 3
+
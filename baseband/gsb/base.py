@@ -2,6 +2,8 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 import io
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 from astropy.utils import lazyproperty
 import astropy.units as u
@@ -11,8 +13,102 @@ from .header import GSBHeader
 from .payload import GSBPayload
 from .frame import GSBFrame
 
-__all__ = ['GSBFileReader', 'GSBFileWriter', 'GSBStreamReader',
-           'GSBStreamWriter', 'open']
+__all__ = ['GSBTimeStampIndex', 'GSBFileReader', 'GSBFileWriter',
+           'GSBStreamReader', 'GSBStreamWriter', 'open']
+
+
+class GSBTimeStampIndex(object):
+    """Index of all entries in a GSB time stamp file.
+
+    The file is parsed in one go, with the numbers on all lines converted
+    to arrays, so that, e.g., the offset of any entry is found without
+    reading or parsing preceding ones.
+
+    Parameters
+    ----------
+    data : bytes
+        Contents of the time stamp file.
+    mode : {'rawdump', 'phased'}
+        Type of GSB data.
+
+    Attributes
+    ----------
+    offsets : `~numpy.ndarray`
+        Byte offsets of the entries in the file.
+    times : `~numpy.ndarray`
+        Times of the entries, as 64-bit integer nanoseconds since 1970 (of
+        the local time written in the file, i.e., not corrected to UTC).
+        For phased data, these are the GPS times, as for ``header.time``.
+    seq_nr, sub_int : `~numpy.ndarray` or `None`
+        Sequence and sub-integration numbers (only for phased data).
+    """
+    def __init__(self, data, mode):
+        data = data.rstrip()
+        newlines = np.flatnonzero(np.frombuffer(data, np.uint8) == ord('\n'))
+        self.offsets = np.hstack(([0], newlines + 1))
+        nentry = len(self.offsets)
+        nword = 7 if mode == 'rawdump' else 16
+        words = np.fromstring(data.decode('ascii'), sep=' ')
+        if words.size != nentry * nword:
+            raise ValueError("time stamp file does not consist of {0} "
+                             "entries with {1} numbers each."
+                             .format(nentry, nword))
+        words = words.reshape(nentry, nword)
+        self.times = self._times(words[:, :7] if mode == 'rawdump' else
+                                 words[:, 7:14])
+        if mode == 'rawdump':
+            self.seq_nr = self.sub_int = None
+        else:
+            self.seq_nr = words[:, 14].astype(np.int64)
+            self.sub_int = words[:, 15].astype(np.int64)
+
+    @staticmethod
+    def _times(words):
+        """Convert year, month, day, hour, minute, second, and fraction."""
+        ymdhms = words[:, :6].astype(np.int64)
+        months = (ymdhms[:, 0] - 1970) * 12 + ymdhms[:, 1] - 1
+        days = ((np.datetime64('1970-01', 'M') + months.astype('m8[M]'))
+                .astype('M8[D]') + (ymdhms[:, 2] - 1).astype('m8[D]'))
+        seconds = (days.astype('M8[s]').astype(np.int64) +
+                   ymdhms[:, 3] * 3600 + ymdhms[:, 4] * 60 + ymdhms[:, 5])
+        return seconds * 10**9 + np.rint(words[:, 6] * 1e9).astype(np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def frame_nrs(self, frames_per_second):
+        """Frame numbers of the entries, counting from the first one.
+
+        Parameters
+        ----------
+        frames_per_second : float
+            Expected rate of entries.
+
+        Returns
+        -------
+        frame_nr : `~numpy.ndarray`
+            Number of frames each entry is after the first, rounded to the
+            nearest integer.
+        """
+        return np.rint((self.times - self.times[0]) *
+                       (frames_per_second * 1e-9)).astype(np.int64)
+
+    def gaps(self, frames_per_second):
+        """Find entries preceded by missing ones.
+
+        Parameters
+        ----------
+        frames_per_second : float
+            Expected rate of entries.
+
+        Returns
+        -------
+        index : `~numpy.ndarray`
+            Indices of entries which are more than one frame later than
+            the preceding ones.
+        """
+        steps = np.diff(self.frame_nrs(frames_per_second))
+        return np.flatnonzero(steps > 1) + 1
 
 
 class GSBTimeStampIO(io.TextIOWrapper):
@@ -45,6 +141,27 @@ class GSBTimeStampIO(io.TextIOWrapper):
             header = GSBHeader.fromvalues(**kwargs)
         header.tofile(self)
 
+    def read_index(self, mode):
+        """Read and parse the whole time stamp file.
+
+        The file position is left unchanged.
+
+        Parameters
+        ----------
+        mode : {'rawdump', 'phased'}
+            Type of GSB data.
+
+        Returns
+        -------
+        index : `~baseband.gsb.base.GSBTimeStampIndex`
+        """
+        offset = self.tell()
+        # Read in binary, to ensure offsets are in bytes.
+        self.buffer.seek(0)
+        data = self.buffer.read()
+        self.seek(offset)
+        return GSBTimeStampIndex(data, mode)
+
 
 class GSBFileReader(io.BufferedReader):
     """Simple reader for GSB data files.
@@ -104,7 +221,7 @@ class GSBStreamBase(VLBIStreamBase):
     def __init__(self, fh_ts, fh_raw, header0, thread_ids=None,
                  nchan=None, bps=None, complex_data=None,
                  samples_per_frame=None, payloadsize=None,
-                 frames_per_second=None, sample_rate=None):
+                 frames_per_second=None, sample_rate=None, **kwargs):
         self.fh_ts = fh_ts
         rawdump = header0.mode == 'rawdump'
         complex_data = (complex_data if complex_data is not None else
@@ -126,7 +243,8 @@ class GSBStreamBase(VLBIStreamBase):
             fh_raw, header0=header0, nchan=nchan, bps=bps,
             complex_data=complex_data, thread_ids=thread_ids,
             samples_per_frame=samples_per_frame,
-            frames_per_second=frames_per_second, sample_rate=sample_rate)
+            frames_per_second=frames_per_second, sample_rate=sample_rate,
+            **kwargs)
         self._payloadsize = payloadsize
 
     def close(self):
@@ -140,10 +258,17 @@ class GSBStreamBase(VLBIStreamBase):
 
 
 class GSBStreamReader(GSBStreamBase, VLBIStreamReaderBase):
+    """GSB format stream reader.
+
+    For rawdump data, with ``memmap=True``, the raw file is mapped into
+    memory, and reads decode only the samples requested, instead of reading
+    and decoding full frames.  This makes random access cheap.  For other
+    parameters, see `~baseband.gsb.open`.
+    """
     def __init__(self, fh_ts, fh_raw, thread_ids=None,
                  nchan=None, bps=None, complex_data=None,
                  samples_per_frame=None, payloadsize=None,
-                 frames_per_second=None, sample_rate=None):
+                 frames_per_second=None, sample_rate=None, memmap=False):
         header0 = fh_ts.read_timestamp()
         self._header0_size = fh_ts.tell()
         if frames_per_second is None and sample_rate is None:
@@ -160,30 +285,88 @@ class GSBStreamReader(GSBStreamBase, VLBIStreamReaderBase):
             payloadsize=payloadsize,
             frames_per_second=frames_per_second, sample_rate=sample_rate)
         self._frame_nr = None
+        # For phased data, parts are read concurrently with this thread pool,
+        # created on first use.
+        self._read_pool = None
+        if memmap:
+            if header0.mode != 'rawdump':
+                raise ValueError("can only map rawdump data into memory.")
+            self._payload_map = GSBPayload(
+                np.memmap(fh_raw, GSBPayload._dtype_word, mode='r'),
+                bps=self.bps, sample_shape=(self.nchan,),
+                complex_data=self.complex_data)
+        else:
+            self._payload_map = None
+
+    @lazyproperty
+    def index(self):
+        """Index of all entries in the time stamp file.
+
+        See `~baseband.gsb.base.GSBTimeStampIndex`.  Used to find frames,
+        and to determine the size of the stream.  Missing frames can be
+        found with ``index.gaps(frames_per_second)``.
+        """
+        return self.fh_ts.read_index(self.header0.mode)
+
+    @lazyproperty
+    def _frame_nrs(self):
+        """Frame numbers of all entries in the time stamp file.
+
+        Frames for which there is no entry are missing; in reads, they are
+        replaced with ``fill_value``.
+        """
+        frame_nrs = self.index.frame_nrs(self.frames_per_second)
+        if np.any(np.diff(frame_nrs) < 1):
+            raise ValueError("time stamps are not strictly increasing at "
+                             "the frame rate of {0} Hz."
+                             .format(self.frames_per_second))
+        return frame_nrs
+
+    @lazyproperty
+    def _contiguous(self):
+        """Whether there is a time stamp entry for every frame."""
+        return len(self._frame_nrs) == self._frame_nrs[-1] + 1
+
+    def _entry(self, frame_nr):
+        """Index of the time stamp entry of a frame.
+
+        Returns `None` if the frame is missing, and raises `EOFError` if it
+        is outside of the stream.
+        """
+        if not 0 <= frame_nr <= self._frame_nrs[-1]:
+            raise EOFError("frame {0} is outside of the stream."
+                           .format(frame_nr))
+        if self._contiguous:
+            return frame_nr
+        entry = np.searchsorted(self._frame_nrs, frame_nr)
+        return entry if self._frame_nrs[entry] == frame_nr else None
 
     @lazyproperty
     def header1(self):
         """Last header of the timestamp file."""
-        fh_ts_offset = self.fh_ts.tell()
-        from_end = 3 * self._header0_size // 2
-        self.fh_ts.seek(0, 2)
-        if self.fh_ts.tell() < from_end:
-            # only one line in file
+        if len(self.index) == 1:
             return self.header0
 
-        # Read last bytes in binary, since cannot seek back from end in
-        # text files.
-        self.fh_ts.buffer.seek(-from_end, 2)
-        last_lines = self.fh_ts.buffer.read(from_end).strip().split(b'\n')
-        last_line = last_lines[-1].decode('ascii')
+        fh_ts_offset = self.fh_ts.tell()
+        self.fh_ts.seek(int(self.index.offsets[-1]))
+        header1 = self.fh_ts.read_timestamp()
         self.fh_ts.seek(fh_ts_offset)
-        return self.header0.__class__(tuple(last_line.split()))
+        return header1
+
+    @property
+    def size(self):
+        """Number of samples in the file (including missing frames)."""
+        return (int(self._frame_nrs[-1]) + 1) * self.samples_per_frame
 
     def read(self, count=None, fill_value=0., squeeze=True, out=None):
         """Read count samples.
 
         The range retrieved can span multiple frames.
 
+        Frames missing from the time stamp file (see ``index.gaps``) are
+        filled with ``fill_value``.  Raw data are assumed to be present only
+        for frames that have a time stamp.
+
         Parameters
         ----------
         count : int
@@ -216,50 +399,81 @@ class GSBStreamReader(GSBStreamBase, VLBIStreamReaderBase):
             count = out.shape[0]
             squeeze = False
 
+        if count > 0 and (self.offset < 0 or
+                          self.offset + count > self.size):
+            raise EOFError("cannot read from beyond the stream.")
+
+        if self._payload_map is not None and self._contiguous:
+            # Decode just the samples requested from the memory map.
+            if self.offset + count > self._payload_map.nsample:
+                raise EOFError("cannot read beyond the end of the raw file.")
+            out[...] = self._payload_map[self.offset:self.offset + count]
+            self.offset += count
+            return out.squeeze() if squeeze else out
+
         offset0 = self.offset
         while count > 0:
             frame_nr, sample_offset = divmod(self.offset,
                                              self.samples_per_frame)
-            if(frame_nr != self._frame_nr):
-                # Read relevant frame (possibly reusing data array from
-                # previous frame set).
-                self._read_frame(fill_value)
-                assert np.isclose(self._frame_nr, self.frames_per_second *
-                                  (self._frame.header.time -
-                                   self.time0).to(u.s).value)
-
-            # Copy relevant data from frame into output.
+            entry = self._entry(frame_nr)
             nsample = min(count, self.samples_per_frame - sample_offset)
             sample = self.offset - offset0
-            out[sample:sample + nsample] = self._frame[sample_offset:
-                                                       sample_offset + nsample]
+            if entry is None:
+                out[sample:sample + nsample] = fill_value
+            elif self._payload_map is not None:
+                start = entry * self.samples_per_frame + sample_offset
+                if start + nsample > self._payload_map.nsample:
+                    raise EOFError("cannot read beyond the end of the raw "
+                                   "file.")
+                out[sample:sample + nsample] = self._payload_map[
+                    start:start + nsample]
+            else:
+                if frame_nr != self._frame_nr:
+                    self._read_frame(frame_nr, entry)
+                # Copy relevant data from frame into output.
+                out[sample:sample + nsample] = self._frame[
+                    sample_offset:sample_offset + nsample]
             self.offset += nsample
             count -= nsample
 
         return out.squeeze() if squeeze else out
 
-    def _read_frame(self, fill_value=0., out=None):
-        frame_nr = self.offset // self.samples_per_frame
-        self.fh_ts.seek(self.header0.seek_offset(frame_nr,
-                                                 size=self._header0_size))
+    def _read_frame(self, frame_nr, entry):
+        self.fh_ts.seek(int(self.index.offsets[entry]))
+        kwargs = {}
         if self.header0.mode == 'rawdump':
-            self.fh_raw.seek(frame_nr * self._payloadsize)
+            self.fh_raw.seek(entry * self._payloadsize)
         else:
+            nfile = 0
             for fh_pair in self.fh_raw:
                 for fh in fh_pair:
-                    fh.seek(frame_nr * self._payloadsize)
+                    fh.seek(entry * self._payloadsize)
+                    nfile += 1
+            if self._read_pool is None and nfile > 1:
+                self._read_pool = ThreadPool(nfile)
+            kwargs = dict(pool=self._read_pool,
+                          buffer_pool=self._buffer_pool)
         self._frame = GSBFrame.fromfile(self.fh_ts, self.fh_raw,
                                         payloadsize=self._payloadsize,
                                         nchan=self.nchan, bps=self.bps,
-                                        complex_data=self.complex_data)
+                                        complex_data=self.complex_data,
+                                        **kwargs)
         self._frame_nr = frame_nr
         return self._frame
 
+    def close(self):
+        if self._read_pool is not None:
+            self._read_pool.close()
+            self._read_pool.join()
+            self._read_pool = None
+        super(GSBStreamReader, self).close()
+
 
 class GSBStreamWriter(GSBStreamBase, VLBIStreamWriterBase):
     def __init__(self, fh_ts, fh_raw, header=None, nchan=None, bps=None,
                  complex_data=None, samples_per_frame=None, payloadsize=None,
-                 frames_per_second=None, sample_rate=None, **kwargs):
+                 frames_per_second=None, sample_rate=None, workers=0,
+                 **kwargs):
         if header is None:
             mode = kwargs.pop('header_mode',
                               'rawdump' if hasattr(fh_raw, 'read') else
@@ -269,7 +483,8 @@ class GSBStreamWriter(GSBStreamBase, VLBIStreamWriterBase):
             fh_ts, fh_raw, header, nchan=nchan, bps=bps,
             complex_data=complex_data,
             samples_per_frame=samples_per_frame, payloadsize=payloadsize,
-            frames_per_second=frames_per_second, sample_rate=sample_rate)
+            frames_per_second=frames_per_second, sample_rate=sample_rate,
+            workers=workers)
         self._data = np.zeros((self.samples_per_frame, self.nthread,
                                self.nchan), (np.complex64 if self.complex_data
                                              else np.float32))
@@ -314,14 +529,26 @@ class GSBStreamWriter(GSBStreamBase, VLBIStreamWriterBase):
             self._data[sample_offset:sample_end] = data[sample:
                                                         sample + nsample]
             if sample_end == self.samples_per_frame:
-                self._frame = GSBFrame.fromdata(self._data, self._header,
-                                                self.bps)
-                self._frame.tofile(self.fh_ts, self.fh_raw)
+                self._write_frame(self._header)
 
             self.offset += nsample
             count -= nsample
 
+    def _make_frame(self, data, header):
+        return GSBFrame.fromdata(data, header, self.bps)
+
+    def _frame_tofile(self, frame):
+        frame.tofile(self.fh_ts, self.fh_raw)
+
+    def close(self):
+        try:
+            self._close_pipeline()
+        finally:
+            super(GSBStreamWriter, self).close()
+
     def flush(self):
+        if self._pipeline is not None:
+            self._pipeline.flush()
         self.fh_ts.flush()
         try:
             self.fh_raw.flush()
@@ -370,6 +597,13 @@ def open(name, mode='rs', **kwargs):
         Total number of samples per frame.  Can also give ``payloadsize``, the
         number of bytes per payload block.
 
+    --- For reading a stream : (see `~baseband.gsb.base.GSBStreamReader`)
+
+    memmap : bool, optional
+        For rawdump data, whether to map the raw file into memory, so that
+        only the samples requested are decoded, rather than whole frames.
+        Default: `False`.
+
     --- For writing a stream : (see `~baseband.gsb.base.GSBStreamWriter`)
 
     frames_per_second : float, optional
@@ -35,7 +35,7 @@ class GSBFrame(VLBIFrameBase):
 
     @classmethod
     def fromfile(cls, fh_ts, fh_raw, payloadsize=1 << 24, nchan=1, bps=4,
-                 complex_data=False, valid=True, verify=True):
+                 complex_data=False, valid=True, verify=True, **kwargs):
         """Read a frame from timestamp and raw data file handles.
 
         Any arguments beyond the filehandle are used to help initialize the
@@ -63,11 +63,15 @@ class GSBFrame(VLBIFrameBase):
             Whether the frame contains valid data (default: `True`).
         verify : bool
             Whether to verify consistency of the frame parts (default: `True`).
+        **kwargs
+            Further arguments for reading phased payloads (``pool`` and
+            ``buffer_pool``; see `~baseband.gsb.GSBPayload.fromfile`).
         """
         header = cls._header_class.fromfile(fh_ts, verify=verify)
         payload = cls._payload_class.fromfile(fh_raw, payloadsize=payloadsize,
                                               nchan=nchan, bps=bps,
-                                              complex_data=complex_data)
+                                              complex_data=complex_data,
+                                              **kwargs)
         return cls(header, payload, valid=valid, verify=verify)
 
     def tofile(self, fh_ts, fh_raw):
@@ -9,16 +9,32 @@ See http://gmrt.ncra.tifr.res.in/gmrt_hpage/sub_system/gmrt_gsb/index.htm
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import sys
+import threading
+
 import numpy as np
+from astropy.extern import six
 
 from ..vlbi_base.payload import VLBIPayloadBase
 
 
-__all__ = ['GSBPayload']
+__all__ = ['init_luts', 'decode_4bit', 'encode_4bit', 'GSBPayload']
+
+
+def init_luts():
+    """Set up the look-up table for 4-bit levels as a function of input byte.
 
+    For a given byte containing bits 76543210, the first sample is in 3210,
+    the second in 7654, and both are interpreted as signed 4-bit integers.
+    """
+    b = np.arange(256)[:, np.newaxis]
+    i = np.arange(0, 8, 4)
+    lut4bit = (((b >> i) & 0xf) ^ 8) - 8
+    return lut4bit.astype(np.float32)
 
-shift40 = np.array([4, 0], np.int8)
-shift04 = np.array([0, 4], np.int8)
+lut4bit = init_luts()
+# For speed, look up both samples in a byte at once, as a single 8-byte item.
+lut4bit_pairs = lut4bit.view(np.uint64).ravel()
 
 
 def decode_4bit(words):
@@ -28,12 +44,7 @@ def decode_4bit(words):
     the first sample is in 3210, the second in 7654, and both are interpreted
     as signed 4-bit integers.
     """
-    # left_shift(byte[:,np.newaxis], shift40):  [3210xxxx, 76543210]
-    split = np.left_shift(words[:, np.newaxis], shift40).ravel()
-    # right_shift(..., 4):                      [33333210, 77777654]
-    # so least significant bits go first.
-    split >>= 4
-    return split.astype(np.float32)
+    return lut4bit_pairs[words.view(np.uint8)].view(np.float32)
 
 
 def decode_8bit(words):
@@ -43,16 +54,69 @@ def decode_8bit(words):
 
 
 def encode_4bit(values):
-    b = np.clip(np.round(values), -8, 7).astype(np.int8).reshape(-1, 2)
-    b &= 0xf
-    b <<= shift04
-    return b[:, 0] | b[:, 1]
+    """Encode 4-bit data.
+
+    Values are rounded to integers in the range -8 to 7, and pairs of samples
+    combined in single bytes, with the first sample in the lower 4 bits.
+
+    All arithmetic is done in place in a single float32 buffer: the values
+    are offset to 0 to 15, each pair is combined into a byte index ``lo + 16
+    * hi``, and this is converted to the byte holding the two signed 4-bit
+    samples by flipping the top bit of each nibble (``^ 0x88``).
+    """
+    b = np.empty(np.size(values), np.float32)
+    np.clip(np.ravel(values), -8., 7., out=b)
+    np.rint(b, out=b)
+    b += 8.
+    pairs = b.reshape(-1, 2)
+    pairs[:, 1] *= 16.
+    pairs[:, 0] += pairs[:, 1]
+    encoded = np.empty(len(pairs), np.int8)
+    encoded_u1 = encoded.view(np.uint8)
+    np.copyto(encoded_u1, pairs[:, 0], casting='unsafe')
+    encoded_u1 ^= 0x88
+    return encoded
 
 
 def encode_8bit(values):
     return np.clip(np.rint(values), -128, 127).astype(np.int8)
 
 
+def _run_concurrently(function, args_list, pool=None):
+    """Call function for each set of arguments, each in a separate thread.
+
+    Used to read or write the files holding phased data in parallel, since
+    these are typically on different disks.  If ``pool`` is given, it should
+    be a thread pool with a ``map`` method, which is used instead of
+    starting new threads.  Any exception raised in a thread is re-raised
+    once all threads are done.
+    """
+    if len(args_list) == 1:
+        function(*args_list[0])
+        return
+
+    if pool is not None:
+        pool.map(lambda args: function(*args), args_list)
+        return
+
+    errors = []
+
+    def run(args):
+        try:
+            function(*args)
+        except Exception:
+            errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=run, args=(args,))
+               for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        six.reraise(*errors[0])
+
+
 class GSBPayload(VLBIPayloadBase):
     """Container for decoding and encoding GSB payloads.
 
@@ -78,7 +142,7 @@ class GSBPayload(VLBIPayloadBase):
 
     @classmethod
     def fromfile(cls, fh, payloadsize=None, bps=4, nchan=1,
-                 complex_data=False):
+                 complex_data=False, pool=None, buffer_pool=None):
         """Read payloads from several threads.
 
         Parameters
@@ -97,6 +161,12 @@ class GSBPayload(VLBIPayloadBase):
             Number of fourier channels.  Default: 1.
         complex_data : bool
             Whether data is complex or float.  Default: False.
+        pool : `~multiprocessing.pool.ThreadPool`, optional
+            Pool of threads in which to read the parts.  By default, a new
+            thread is started for each part.
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the buffers that parts of multiple
+            threads are read into before being interleaved.
         """
         if hasattr(fh, 'read'):
             return super(GSBPayload,
@@ -104,40 +174,65 @@ class GSBPayload(VLBIPayloadBase):
                                        bps=bps, sample_shape=(nchan,),
                                        complex_data=complex_data)
 
+        # All parts are read concurrently, directly into the final array if
+        # there is only one thread, and otherwise in per-part buffers, which
+        # are interleaved into the final array in the reading thread.
         nthread = len(fh)
-        payloads = [[super(GSBPayload,
-                           cls).fromfile(fh1, payloadsize=payloadsize, bps=bps,
-                                         sample_shape=(nchan,),
-                                         complex_data=complex_data)
-                     for fh1 in fh_set] for fh_set in fh]
+        npart = len(fh[0])
         if nthread == 1:
-            words = np.hstack([payload.words for payload in payloads[0]])
+            words = np.empty((npart, payloadsize), dtype=cls._dtype_word)
+            _run_concurrently(cls._readinto,
+                              [(fh1, part.view(np.uint8))
+                               for fh1, part in zip(fh[0], words)], pool)
         else:
-            bpfs = payloads[0][0]._bpfs
+            bpfs = bps * (2 if complex_data else 1) * nchan
             if bpfs % 8:
                 raise TypeError('cannot create phased payload: complete sample'
                                 ' does not fit in integer number of bytes.')
-            words = np.empty((len(payloads[0]),
-                              payloads[0][0].words.size * 8 // bpfs,
-                              nthread,
-                              bpfs // 8), dtype=cls._dtype_word)
-            for payload_set, thread in zip(payloads,
-                                           words.transpose(2, 0, 1, 3)):
-                for payload, part in zip(payload_set, thread):
-                    part[:] = payload.words.reshape(-1, bpfs // 8)
+            words = np.empty((npart, payloadsize * 8 // bpfs,
+                              nthread, bpfs // 8), dtype=cls._dtype_word)
+
+            def read_part(fh1, part):
+                buf = (np.empty(payloadsize, np.uint8) if buffer_pool is None
+                       else buffer_pool.get(payloadsize))
+                try:
+                    cls._readinto(fh1, buf)
+                    part[...] = buf.view(cls._dtype_word).reshape(
+                        -1, bpfs // 8)
+                finally:
+                    if buffer_pool is not None:
+                        buffer_pool.release(buf)
+
+            _run_concurrently(read_part,
+                              [(fh1, part)
+                               for fh_set, thread in zip(
+                                   fh, words.transpose(2, 0, 1, 3))
+                               for fh1, part in zip(fh_set, thread)], pool)
 
         return cls(words.ravel(), bps=bps, sample_shape=(nthread, nchan),
                    complex_data=complex_data)
 
     def tofile(self, fh):
-        try:
-            fh.write(self.words.tostring())
-        except AttributeError:
-            nthread = len(fh)
-            assert nthread == self.sample_shape[0]
-
-            words = self.words.reshape(len(fh[0]), -1, nthread,
-                                       self._bpfs // nthread // 8)
-            for fh_set, thread in zip(fh, words.transpose(2, 0, 1, 3)):
-                for fh, part in zip(fh_set, thread):
-                    fh.write(part.tostring())
+        """Write payload to a file, or to several files for phased data.
+
+        Parameters
+        ----------
+        fh : filehandle or tuple of tuple of filehandle
+            Handles to the file(s) to which data are written, with the same
+            structure as for `fromfile`.  For multiple files, all parts are
+            written concurrently.
+        """
+        if hasattr(fh, 'write'):
+            return fh.write(self.words.tostring())
+
+        nthread = len(fh)
+        assert nthread == self.sample_shape[0]
+        # Parts of a single thread are contiguous and can be written
+        # directly; for multiple threads, they have to be de-interleaved.
+        words = self.words.reshape(len(fh[0]), -1, nthread,
+                                   self._bpfs // nthread // 8)
+        _run_concurrently(lambda fh1, part: fh1.write(
+            np.ascontiguousarray(part).view(np.uint8)),
+            [(fh1, part)
+             for fh_set, thread in zip(fh, words.transpose(2, 0, 1, 3))
+             for fh1, part in zip(fh_set, thread)])
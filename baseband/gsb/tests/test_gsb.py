@@ -1,11 +1,14 @@
 # Licensed under the GPLv3 - see LICENSE.rst
 import io
+import threading
+from multiprocessing.pool import ThreadPool
 import numpy as np
 from astropy.tests.helper import pytest
 import astropy.units as u
 from astropy.time import Time
 from astropy.tests.helper import assert_quantity_allclose
 from ... import gsb
+from ...vlbi_base.utils import BufferPool
 from ..payload import decode_4bit, encode_4bit
 
 
@@ -158,6 +161,15 @@ class TestGSB(object):
              0x67, 0x45, 0x23, 0x01, 0xef, 0xcd, 0xab, 0x89]))
         d2 = decode_4bit(b2)
         assert np.all(d2 == areal2)
+        # Check all possible bytes, and rounding and clipping in encoding.
+        b3 = np.arange(256, dtype=np.uint8).view(np.int8)
+        d3 = decode_4bit(b3)
+        assert d3.dtype == np.float32
+        assert np.all(d3[::2] == (b3 << 4) >> 4)
+        assert np.all(d3[1::2] == b3 >> 4)
+        assert np.all(encode_4bit(d3) == b3)
+        assert np.all(encode_4bit(np.array([-9.2, 0.4, 1.6, 12.])) ==
+                      np.array([0x08, 0x72], np.uint8).view(np.int8))
 
     def test_payload(self):
         payload1 = gsb.GSBPayload.fromdata(self.data, bps=4)
@@ -201,6 +213,71 @@ class TestGSB(object):
                                                  payloadsize=payload.size)
                 assert np.all(phased.data == payload.data[:, np.newaxis])
 
+    @pytest.mark.parametrize('nthread', (1, 2))
+    def test_phased_payload_concurrent(self, nthread):
+        class ThreadRecorder(io.BytesIO):
+            def readinto(self, buf):
+                self.thread = threading.current_thread()
+                return super(ThreadRecorder, self).readinto(buf)
+
+            def write(self, buf):
+                self.thread = threading.current_thread()
+                return super(ThreadRecorder, self).write(buf)
+
+        data = self.data.reshape(-1, nthread, 2)
+        payload = gsb.GSBPayload.fromdata(data, bps=8)
+        fh = [[ThreadRecorder(), ThreadRecorder()] for i in range(nthread)]
+        payload.tofile(fh)
+        files = [f for fh_pair in fh for f in fh_pair]
+        payloadsize = payload.size // len(files)
+        assert len(set(f.thread for f in files)) == len(files)
+        for f in files:
+            assert f.tell() == payloadsize
+            f.seek(0)
+        payload2 = gsb.GSBPayload.fromfile(fh, payloadsize=payloadsize,
+                                           bps=8, nchan=2)
+        assert len(set(f.thread for f in files)) == len(files)
+        assert payload2 == payload
+        # Errors in reading any part are passed on.
+        for f in files:
+            f.seek(0)
+        files[-1].seek(1)
+        with pytest.raises(EOFError):
+            gsb.GSBPayload.fromfile(fh, payloadsize=payloadsize,
+                                    bps=8, nchan=2)
+        # A persistent thread pool and reusable buffers can be passed in.
+        pool = ThreadPool(len(files))
+        buffer_pool = BufferPool()
+        try:
+            for f in files:
+                f.seek(0)
+            payload3 = gsb.GSBPayload.fromfile(fh, payloadsize=payloadsize,
+                                               bps=8, nchan=2, pool=pool,
+                                               buffer_pool=buffer_pool)
+            assert payload3 == payload
+            assert all(f.thread.name.startswith('Thread') and
+                       f.thread is not threading.current_thread()
+                       for f in files)
+            # Per-part buffers are only needed to interleave threads, and
+            # are given back to the pool, also if reading fails.
+            nbuffer = len(buffer_pool._buffers.get(payloadsize, ()))
+            if nthread == 1:
+                assert nbuffer == 0
+            else:
+                assert 0 < nbuffer <= len(files)
+            for f in files:
+                f.seek(0)
+            files[-1].seek(1)
+            with pytest.raises(EOFError):
+                gsb.GSBPayload.fromfile(fh, payloadsize=payloadsize,
+                                        bps=8, nchan=2, pool=pool,
+                                        buffer_pool=buffer_pool)
+            assert (nbuffer <= len(buffer_pool._buffers.get(payloadsize, ()))
+                    <= (len(files) if nthread > 1 else 0))
+        finally:
+            pool.close()
+            pool.join()
+
     def test_rawdump_frame(self):
         header1 = gsb.GSBHeader(self.rawdump_ts.split())
         frame1 = gsb.GSBFrame.fromdata(self.data, header1, bps=4)
@@ -339,6 +416,95 @@ class TestGSB(object):
                     u.s/fh_r.frames_per_second)
             assert np.all(data.reshape(2, -1) == self.data.ravel())
 
+    @pytest.mark.parametrize('memmap', (False, True))
+    def test_raw_stream_gaps(self, tmpdir, memmap):
+        header = gsb.GSBHeader(self.rawdump_ts.split())
+        data = np.clip(np.round(np.random.uniform(-8.5, 7.5, size=8192)),
+                       -8, 7)
+        ts_name = str(tmpdir.join('ts.dat'))
+        raw_name = str(tmpdir.join('raw.dat'))
+        with gsb.open(ts_name, 'ws', raw=raw_name, sample_rate=4096*u.Hz,
+                      samples_per_frame=2048, **header) as fh_w:
+            fh_w.write(data)
+        # Drop the time stamp and the raw data of the third frame.
+        with io.open(ts_name, 'rt') as fh:
+            lines = fh.readlines()
+        with io.open(raw_name, 'rb') as fh:
+            raw = fh.read()
+        gap_ts_name = str(tmpdir.join('gap_ts.dat'))
+        gap_raw_name = str(tmpdir.join('gap_raw.dat'))
+        with io.open(gap_ts_name, 'wt') as fh:
+            fh.writelines(lines[:2] + lines[3:])
+        with io.open(gap_raw_name, 'wb') as fh:
+            fh.write(raw[:2048] + raw[3072:])
+
+        with gsb.open(gap_ts_name, 'rs', raw=gap_raw_name,
+                      samples_per_frame=2048, memmap=memmap) as fh_r:
+            assert np.all(fh_r.index.gaps(fh_r.frames_per_second) == [2])
+            assert fh_r.size == 8192
+            record = fh_r.read(fill_value=100.)
+            assert fh_r.tell() == 8192
+            fh_r.seek(8190)
+            with pytest.raises(EOFError):
+                fh_r.read(3)
+            fh_r.seek(-10)
+            with pytest.raises(EOFError):
+                fh_r.read(5)
+
+        assert np.all(record[:4096] == data[:4096])
+        assert np.all(record[4096:6144] == 100.)
+        assert np.all(record[6144:] == data[6144:])
+
+    def test_raw_stream_memmap(self, tmpdir):
+        header = gsb.GSBHeader(self.rawdump_ts.split())
+        data = np.clip(np.round(np.random.uniform(-8.5, 7.5, size=8192)),
+                       -8, 7)
+        ts_name = str(tmpdir.join('ts.dat'))
+        raw_name = str(tmpdir.join('raw.dat'))
+        with gsb.open(ts_name, 'ws', raw=raw_name, sample_rate=4096*u.Hz,
+                      samples_per_frame=2048, **header) as fh_w:
+            fh_w.write(data)
+
+        with gsb.open(ts_name, 'rs', raw=raw_name, samples_per_frame=2048,
+                      memmap=True) as fh_r:
+            assert fh_r.size == 8192
+            assert_quantity_allclose(
+                (fh_r.header1.time - fh_r.header0.time).to(u.s), 1.5 * u.s)
+            for offset, count in ((0, 10), (2047, 3), (3001, 2000),
+                                  (8190, 2)):
+                fh_r.seek(offset)
+                assert np.all(fh_r.read(count) == data[offset:offset+count])
+                assert fh_r.tell() == offset + count
+                # No frames are read.
+                assert fh_r._frame_nr is None
+            fh_r.seek(100)
+            out = np.zeros((10, 1), np.float32)
+            fh_r.read(out=out)
+            assert np.all(out[:, 0] == data[100:110])
+            fh_r.seek(8190)
+            with pytest.raises(EOFError):
+                fh_r.read(3)
+            # Reads cannot start before the start either.
+            fh_r.seek(-10)
+            with pytest.raises(EOFError):
+                fh_r.read(5)
+            assert fh_r.tell() == -10
+
+        with gsb.open(ts_name, 'rs', raw=raw_name,
+                      samples_per_frame=2048) as fh_r:
+            fh_r.seek(3001)
+            assert np.all(fh_r.read(2000) == data[3001:5001])
+
+        phased_header = gsb.GSBHeader(self.phased_ts.split())
+        with io.BytesIO() as sh, gsb.open(sh, 'wt') as fh_ts:
+            fh_ts.write_timestamp(phased_header)
+            fh_ts.flush()
+            sh.seek(0)
+            with pytest.raises(ValueError):
+                gsb.open(sh, 'rs', raw=((io.BytesIO(), io.BytesIO()),),
+                         samples_per_frame=2, frames_per_second=1,
+                         memmap=True)
+
     @pytest.mark.parametrize('bps', (4, 8))
     def test_phased_stream(self, bps):
         header = gsb.GSBHeader(self.phased_ts.split())
@@ -408,9 +574,119 @@ class TestGSB(object):
                 assert_quantity_allclose(fh_r.tell(unit=u.s), 0.5 * u.s)
                 assert sp0.tell() == 1024 * bps // 8
                 assert fh_r._frame.header == fh_r.header1
+                # Parts were read with a thread pool kept by the reader.
+                assert fh_r._read_pool is not None
+            assert fh_r._read_pool is None
             assert np.all(data[:twopol.shape[0]] == twopol)
             assert np.all(data[twopol.shape[0]:] == twopol[::-1])
 
+    @pytest.mark.parametrize(('nsample', 'overlap'),
+                             ((512, 0), (700, 100), (300, 299)))
+    def test_raw_stream_iter_chunks(self, nsample, overlap):
+        header = gsb.GSBHeader(self.rawdump_ts.split())
+        data = self.data.ravel()
+        with io.BytesIO() as sh, io.BytesIO() as sp, gsb.open(
+                sh, 'ws', raw=sp, sample_rate=4096*u.Hz,
+                samples_per_frame=512, **header) as fh_w:
+            fh_w.write(data)
+            fh_w.flush()
+            sh.seek(0)
+            sp.seek(0)
+            with gsb.open(sh, mode='rs', raw=sp,
+                          samples_per_frame=512) as fh_r:
+                step = nsample - overlap
+                nblock = 0
+                for i, block in enumerate(fh_r.iter_chunks(nsample,
+                                                           overlap=overlap)):
+                    assert block.shape == (nsample,)
+                    assert np.all(block == data[i * step:i * step + nsample])
+                    nblock += 1
+                assert nblock == (len(data) - overlap) // step
+                assert fh_r.tell() == overlap + nblock * step
+
+    @pytest.mark.parametrize(('nsample', 'overlap'),
+                             ((8, 0), (12, 3), (20, 19)))
+    def test_phased_stream_iter_chunks(self, tmpdir, nsample, overlap):
+        # Two polarisations, each in two files, read as one stream.
+        header = gsb.GSBHeader(self.phased_ts.split())
+        cmplx = self.data[::2] + 1j * self.data[1::2]
+        twopol = cmplx.reshape(-1, 2, 16)
+        timestamps = str(tmpdir.join('phased.timestamp'))
+        raw = [[str(tmpdir.join('phased.{0}{1}.dat'.format(pol, part)))
+                for part in (1, 2)] for pol in 'LR']
+        with gsb.open(timestamps, 'ws', raw=raw, bps=8,
+                      sample_rate=128*u.Hz,
+                      samples_per_frame=twopol.shape[0] // 4,
+                      nchan=16, nthread=2, complex_data=True,
+                      header=header) as fh_w:
+            fh_w.write(twopol)
+
+        with gsb.open(timestamps, 'rs', raw=raw, bps=8,
+                      samples_per_frame=twopol.shape[0] // 4,
+                      nchan=16) as fh_r:
+            assert fh_r.size == len(twopol)
+            step = nsample - overlap
+            nblock = 0
+            for i, block in enumerate(fh_r.iter_chunks(nsample,
+                                                       overlap=overlap)):
+                assert block.shape == (nsample, 2, 16)
+                assert np.all(block == twopol[i * step:i * step + nsample])
+                nblock += 1
+            assert nblock == (len(twopol) - overlap) // step
+            assert fh_r.tell() == overlap + nblock * step
+            # The four files were read concurrently.
+            assert fh_r._read_pool is not None
+
+    def test_timestamp_index(self):
+        header = gsb.GSBHeader(self.phased_ts.split())
+        header = header.copy()
+        # Ensure sequence numbers change number of digits.
+        header['seq_nr'] = 9998
+        header['sub_int'] = 0
+        headers = []
+        with io.BytesIO() as sh, gsb.open(sh, 'wt') as fh_w:
+            for i in range(40):
+                if i == 30:
+                    continue  # Create a gap.
+                h = header.copy()
+                h.time = header.time + i * 0.125 * u.s
+                h['seq_nr'] = 9998 + i // 8
+                h['sub_int'] = i % 8
+                fh_w.write_timestamp(h)
+                headers.append(h)
+            fh_w.flush()
+            fh_w.seek(0)
+            fh_w.read_timestamp()
+            index = fh_w.read_index('phased')
+            assert fh_w.tell() == len(' '.join(header.words)) + 1
+            assert len(index) == 39
+            for i in (0, 16, 17, 38):
+                assert (index.offsets[i] ==
+                        header.seek_offset(i, size=index.offsets[1]))
+                fh_w.seek(int(index.offsets[i]))
+                assert fh_w.read_timestamp() == headers[i]
+            assert np.all(index.seq_nr == [h['seq_nr'] for h in headers])
+            assert np.all(index.sub_int == [h['sub_int'] for h in headers])
+            dt = (index.times - index.times[0]) * 1e-9 * u.s
+            assert_quantity_allclose(dt, [(h.time - header.time).to(u.s)
+                                          for h in headers], atol=1*u.ns)
+            assert np.all(index.gaps(8.) == [30])
+
+        rawdump_header = gsb.GSBHeader(self.rawdump_ts.split())
+        with io.BytesIO() as sh, gsb.open(sh, 'wt') as fh_w:
+            for i in range(3):
+                h = rawdump_header.copy()
+                h.time = rawdump_header.time + i * u.s
+                fh_w.write_timestamp(h)
+            fh_w.flush()
+            index = fh_w.read_index('rawdump')
+            assert np.all(index.offsets == np.arange(3) * 32)
+            assert np.all(np.diff(index.times) == 10**9)
+            assert index.seq_nr is None
+            assert len(index.gaps(1.)) == 0
+            with pytest.raises(ValueError):
+                fh_w.read_index('phased')
+
     def test_stream_invalid(self):
         with pytest.raises(ValueError):
             gsb.open('ts.dat', 's')
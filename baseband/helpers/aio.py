@@ -0,0 +1,216 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+"""Access to stream readers from `asyncio` code.
+
+Reading from a stream involves both disk access and decoding, and thus
+would block an event loop.  `AsyncStreamReader` wraps any of the stream
+readers such that these are done in an executor instead.  Requires
+python 3.5 or later.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import asyncio
+import concurrent.futures
+import functools
+from collections import deque
+
+import numpy as np
+
+
+# Before python 3.7, get_event_loop returns the running loop when called
+# from a coroutine or callback, but creates a new one otherwise.
+_get_running_loop = getattr(asyncio, 'get_running_loop',
+                            asyncio.get_event_loop)
+
+
+class AsyncStreamReader(object):
+    """Wrap a stream reader for use with `asyncio`.
+
+    All reading is done in an executor, with a single worker, so that reads
+    are done in order and the event loop is never blocked.  Methods return
+    `asyncio.Future` instances, which should be awaited, e.g.::
+
+        async with AsyncStreamReader(vdif.open(name, 'rs')) as fh:
+            data = await fh.read(1000)
+            async for chunk in fh.iter_chunks(20000):
+                process(chunk)
+
+    Other attributes, like ``size``, ``tell`` and ``seek``, are taken from
+    the underlying stream.  Note that the latter two should not be used
+    while reads are in progress.
+
+    Parameters
+    ----------
+    stream : stream reader
+        E.g., as opened with ``vdif.open(name, 'rs')``.
+    loop : `asyncio.AbstractEventLoop`, optional
+        Event loop to use.  Default: the loop running when a method is
+        called (so that the reader can be created outside of any loop).
+    executor : `concurrent.futures.Executor`, optional
+        Executor in which reads are done.  Should use a single worker, to
+        ensure reads are done in order.  By default, a thread pool executor
+        with a single worker is created (and shut down on `close`).
+    max_frames : int, optional
+        Maximum number of frames read ahead by `iter_chunks`, where each
+        chunk counts for the number of frames its new samples span.  At
+        least one chunk is always read ahead.  Default: 4.
+    """
+    def __init__(self, stream, loop=None, executor=None, max_frames=4):
+        self.stream = stream
+        self._loop = loop
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+        self.max_frames = max_frames
+
+    @property
+    def loop(self):
+        """Event loop used; if not given, the one currently running."""
+        return _get_running_loop() if self._loop is None else self._loop
+
+    def __getattr__(self, attr):
+        """Get attributes not defined on self from the underlying stream."""
+        if not attr.startswith('_'):
+            return getattr(self.stream, attr)
+        raise AttributeError("{0} object has no attribute {1}"
+                             .format(type(self).__name__, attr))
+
+    def _submit(self, function, *args, **kwargs):
+        return self.loop.run_in_executor(
+            self.executor, functools.partial(function, *args, **kwargs))
+
+    def _result(self, result):
+        future = asyncio.Future(loop=self.loop)
+        future.set_result(result)
+        return future
+
+    def read(self, count=None, **kwargs):
+        """Read count samples in the executor.
+
+        For parameters, see the ``read`` method of the stream reader.
+
+        Returns
+        -------
+        future : `asyncio.Future`
+            Which will hold the data read.
+        """
+        return self._submit(self.stream.read, count, **kwargs)
+
+    def iter_chunks(self, nsample, overlap=0, squeeze=True, **kwargs):
+        """Iterate asynchronously over the stream in chunks of ``nsample``.
+
+        Runs the ``iter_chunks`` method of the stream in the executor, so
+        iteration starts at the current position, and stops once fewer than
+        ``nsample - overlap`` samples remain.  While one chunk is processed,
+        subsequent ones are already being read.  Chunks are read into a ring
+        of buffers that are reused; a chunk yielded remains valid until the
+        next one has been processed.
+
+        Parameters
+        ----------
+        nsample : int
+            Number of samples in each chunk.
+        overlap : int, optional
+            Number of samples at the end of a chunk to include at the start
+            of the next one.  Default: 0.
+        squeeze : bool
+            If `True` (default), remove channel and thread dimensions if unity
+            from the chunks yielded.
+        **kwargs
+            Further arguments for the ``read`` method of the stream.
+
+        Returns
+        -------
+        iterator : asynchronous iterator
+            To be used in an ``async for`` loop.
+        """
+        return _AsyncChunkIterator(self, nsample, overlap, squeeze, kwargs)
+
+    def close(self):
+        """Close the stream, once all reads in progress are done.
+
+        Returns
+        -------
+        future : `asyncio.Future`
+            Which will be done once the stream is closed.
+        """
+        future = self._submit(self.stream.close)
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+        return future
+
+    def __aenter__(self):
+        return self._result(self)
+
+    def __aexit__(self, exc_type, exc_value, traceback):
+        return self.close()
+
+
+class _AsyncChunkIterator(object):
+    """Asynchronous iterator returned by `AsyncStreamReader.iter_chunks`.
+
+    The ``iter_chunks`` generator of the stream is created and advanced in
+    the executor, with enough buffers for the chunks read ahead and the one
+    being processed, plus one to keep the one before valid.
+    """
+    def __init__(self, reader, nsample, overlap, squeeze, kwargs):
+        if not 0 <= overlap < nsample:
+            raise ValueError("overlap should be non-negative and smaller "
+                             "than the number of samples per chunk.")
+        self.reader = reader
+        self.nsample = nsample
+        self.overlap = overlap
+        self.squeeze = squeeze
+        self.kwargs = kwargs
+        frames_per_chunk = -(-(nsample - overlap) //
+                             reader.stream.samples_per_frame)
+        self.maxsize = max(1, reader.max_frames // frames_per_chunk)
+        self._chunks = None
+        self._done = False
+        self._pending = deque()
+
+    def _next_chunk(self):
+        """Get the next chunk (or `None` at the end); run in the executor."""
+        if self._chunks is None:
+            stream = self.reader.stream
+            template = stream.read(0, squeeze=False, **self.kwargs)
+            buffers = [np.empty((self.nsample,) + template.shape[1:],
+                                template.dtype)
+                       for i in range(self.maxsize + 1)]
+            self._chunks = stream.iter_chunks(
+                self.nsample, overlap=self.overlap, out=buffers,
+                squeeze=self.squeeze, **self.kwargs)
+        return next(self._chunks, None)
+
+    def _chunk_or_stop(self, future):
+        """Future with the result of ``future``, or StopAsyncIteration."""
+        result = asyncio.Future(loop=self.reader.loop)
+
+        def transfer(future):
+            if future.cancelled():
+                result.cancel()
+            elif future.exception() is not None:
+                result.set_exception(future.exception())
+            elif future.result() is None:
+                self._done = True
+                result.set_exception(StopAsyncIteration())
+            else:
+                result.set_result(future.result())
+
+        future.add_done_callback(transfer)
+        return result
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        while len(self._pending) < self.maxsize and not self._done:
+            self._pending.append(self.reader._submit(self._next_chunk))
+
+        if self._pending:
+            return self._chunk_or_stop(self._pending.popleft())
+
+        future = asyncio.Future(loop=self.reader.loop)
+        future.set_exception(StopAsyncIteration())
+        return future
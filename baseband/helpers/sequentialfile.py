@@ -3,24 +3,225 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import io
+import os
 import itertools
 from bisect import bisect
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 import numpy as np
+from astropy.extern import six
 from astropy.utils import lazyproperty
 
 
+class FileNameSequencer(object):
+    """List-like generator of file names using a template.
+
+    The template is formatted, filling in '{file_nr}' with the index, as well
+    as any other items in curly brackets with values from ``header``.
+
+    The length of the instance will be the number of files that exist that
+    match the template for increasing values of the file number.
+
+    Parameters
+    ----------
+    template : str
+        Template to format to get specific file names.
+    header : dict-like, optional
+        Structure holding key'd values that are used to fill in the format.
+
+    Examples
+    --------
+
+    >>> from baseband.helpers import sequentialfile as sf
+    >>> fns = sf.FileNameSequencer('a{file_nr:03d}.vdif')
+    >>> fns[10]
+    'a010.vdif'
+    """
+    def __init__(self, template, header=None):
+        self.template = template
+        self.items = {} if header is None else dict(header)
+
+    def __getitem__(self, file_nr):
+        if file_nr < 0:
+            file_nr += len(self)
+            if file_nr < 0:
+                raise IndexError('file number out of range.')
+
+        return self.template.format(file_nr=file_nr, **self.items)
+
+    def __len__(self):
+        file_nr = 0
+        while os.path.isfile(self[file_nr]):
+            file_nr += 1
+
+        return file_nr
+
+
+class SequentialMemmap(object):
+    """Read-only memory map of data spanning several files.
+
+    Combines maps of consecutive parts of the data in different files, and
+    can be indexed like a one-dimensional array.  If the items requested lie
+    within one part, a view of its map is returned; only items that straddle
+    a file boundary are copied.  For use as payload words, `view` and
+    `reshape` are supported as well.
+
+    Parameters
+    ----------
+    maps : list of `~numpy.memmap`
+        Maps of the consecutive parts, with type `~numpy.uint8`.
+    dtype : `~numpy.dtype`
+        Type of the items.  The number of bytes in all maps combined should
+        be a multiple of its size.
+    """
+    ndim = 1
+
+    def __init__(self, maps, dtype):
+        self.maps = maps
+        self.dtype = np.dtype(dtype)
+        self._offsets = [0]
+        for mm in maps:
+            self._offsets.append(self._offsets[-1] + mm.size)
+        self.nbytes = self._offsets[-1]
+        self.size = self.nbytes // self.dtype.itemsize
+        self.shape = (self.size,)
+
+    def __len__(self):
+        return self.size
+
+    def _get_bytes(self, start, stop):
+        """Get bytes ``start`` to ``stop``, as a view if possible."""
+        index = bisect(self._offsets, start) - 1
+        offset = self._offsets[index]
+        if stop <= self._offsets[index + 1]:
+            return self.maps[index][start - offset:stop - offset]
+
+        out = np.empty(stop - start, np.uint8)
+        done = 0
+        while start + done < stop:
+            mm = self.maps[index]
+            part = mm[start + done - offset:stop - offset]
+            out[done:done + part.size] = part
+            done += part.size
+            offset += mm.size
+            index += 1
+        return out
+
+    def __getitem__(self, item):
+        if item is Ellipsis or item == ():
+            item = slice(None)
+
+        itemsize = self.dtype.itemsize
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.size)
+            count = len(six.moves.range(start, stop, step))
+            if count == 0:
+                return np.empty(0, self.dtype)
+            first, last = sorted((start, start + (count - 1) * step))
+            data = self._get_bytes(first * itemsize, (last + 1) * itemsize)
+            data = data.view(self.dtype)
+            return data if step == 1 else data[start - first::step]
+
+        index = item + self.size if item < 0 else item
+        if not 0 <= index < self.size:
+            raise IndexError('index {0} is out of bounds for size {1}.'
+                             .format(item, self.size))
+        return self._get_bytes(index * itemsize,
+                               (index + 1) * itemsize).view(self.dtype)[0]
+
+    def __array__(self, dtype=None):
+        data = self[:]
+        return data if dtype is None else data.astype(dtype)
+
+    def view(self, dtype=None, type=None):
+        """View the data with a different type.
+
+        Without ``type``, a new `SequentialMemmap` using the same maps is
+        returned, with its shape in units of the new ``dtype``.  Otherwise,
+        all data are viewed (or, if they span files, copied) as an array,
+        and that array is viewed with the given ``dtype`` and ``type``.
+        """
+        if type is None:
+            dtype = self.dtype if dtype is None else np.dtype(dtype)
+            if self.nbytes % dtype.itemsize:
+                raise ValueError('size of the data is not a multiple of '
+                                 'the new data-type size.')
+            return SequentialMemmap(self.maps, dtype)
+
+        data = self[:]
+        return (data.view(type) if dtype is None else
+                data.view(dtype, type))
+
+    def reshape(self, *shape, **kwargs):
+        """Reshape all data, copying them if they span files."""
+        return self[:].reshape(*shape, **kwargs)
+
+
+class FileCache(object):
+    """Cache of open files, keyed by file number.
+
+    If more than ``maxsize`` files are open, the least recently used one is
+    closed.
+
+    Parameters
+    ----------
+    opener : callable
+        Called with a file number to open the corresponding file.
+    maxsize : int, optional
+        Maximum number of files kept open.  Default: 8.
+    closer : callable, optional
+        Called with a cached item to close it.  By default, the item's
+        ``close`` method is used.
+    """
+    def __init__(self, opener, maxsize=8, closer=None):
+        self.opener = opener
+        self.maxsize = maxsize
+        self.closer = closer
+        self._files = OrderedDict()
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, file_nr):
+        return file_nr in self._files
+
+    def get(self, file_nr):
+        """Get the open file for ``file_nr``, opening it if needed."""
+        try:
+            fh = self._files.pop(file_nr)
+        except KeyError:
+            fh = self.opener(file_nr)
+        # Re-insert to mark as most recently used.
+        self._files[file_nr] = fh
+        while len(self._files) > self.maxsize:
+            self._close(self._files.popitem(last=False)[1])
+        return fh
+
+    def _close(self, fh):
+        if self.closer is None:
+            fh.close()
+        else:
+            self.closer(fh)
+
+    def close(self):
+        """Close all open files."""
+        while self._files:
+            self._close(self._files.popitem()[1])
+
+
 class SequentialFileBase(object):
     """Deal with several files as if they were one contiguous one.
 
     For details, see `SequentialFileReader` and `SequentialFileWriter`.
     """
-    def __init__(self, files, mode='rb', opener=None):
+    def __init__(self, files, mode='rb', opener=None, max_open_files=1):
         self.files = files
         self.mode = mode
         self.opener = io.open if opener is None else opener
         self.file_nr = None
         self._file_sizes = []
         self._file_offsets = [0]
+        self._file_cache = FileCache(self._open_file, max_open_files)
         self._open(0)
 
     def __getattr__(self, attr):
@@ -35,16 +236,14 @@ class SequentialFileBase(object):
     def _open(self, file_nr):
         """Open the ``file_nr``th file of the list of underlying files.
 
-        If a different file was already open, it is closed.  Nothing is done
-        if the requested file is already open.
+        The file is positioned at its start.  Files used previously are kept
+        open if possible, up to a maximum number, beyond which the least
+        recently used file is closed.  Nothing is done if the requested file
+        is already the current one.
         """
         if file_nr != self.file_nr:
-            try:
-                fh = self.opener(self.files[file_nr], mode=self.mode)
-            except IndexError:
-                raise OSError('ran out of files.')
-            if self.file_nr is not None:
-                self.fh.close()
+            fh = self._file_cache.get(file_nr)
+            fh.seek(0)
             self.fh = fh
             self.file_nr = file_nr
             if self.file_nr == len(self._file_sizes):
@@ -54,16 +253,30 @@ class SequentialFileBase(object):
                     self._file_offsets.append(self._file_offsets[-1] +
                                               file_size)
 
+    def _open_file(self, file_nr):
+        """Get a handle to the ``file_nr``th file."""
+        try:
+            name = self.files[file_nr]
+        except IndexError:
+            raise OSError('ran out of files.')
+        return self.opener(name, mode=self.mode)
+
     def tell(self):
         """Return the current stream position."""
         return self._file_offsets[self.file_nr] + self.fh.tell()
 
+    def fileno(self):
+        """Not supported, since the data are spread over several files."""
+        raise io.UnsupportedOperation('fileno')
+
     def memmap(self, dtype=np.uint8, mode=None, offset=None, shape=None,
                order='C'):
         """Map part of the file in memory.
 
-        Note that the map cannnot span multiple underlying files.
-        Parameters are as for `~numpy.memmap`.
+        Parameters are as for `~numpy.memmap`.  For reading, a
+        one-dimensional map can span multiple underlying files, in which case
+        a `SequentialMemmap` combining maps of the individual files is
+        returned.  Otherwise, the map cannot span multiple files.
         """
         if self.closed:
             raise ValueError('memmap of closed file.')
@@ -93,17 +306,37 @@ class SequentialFileBase(object):
                 count *= k
 
         if self.fh.tell() + count > self._file_sizes[self.file_nr]:
-            raise ValueError('mmap length exceeds individual file size')
+            if 'r' not in self.mode or len(shape) != 1:
+                raise ValueError('mmap length exceeds individual file size')
+            if self.tell() + count > self.size:
+                raise ValueError('mmap length exceeds file size')
+            return self._memmap_files(dtype, mode, count)
 
         file_offset = self.fh.tell()
         mm = np.memmap(self.fh, dtype, mode, file_offset, shape, order)
         self.fh.seek(file_offset + count)
         return mm
 
+    def _memmap_files(self, dtype, mode, count):
+        """Map ``count`` bytes from the current position, across files."""
+        maps = []
+        while count > 0:
+            file_offset = self.fh.tell()
+            nbytes = min(count, self._file_sizes[self.file_nr] - file_offset)
+            if nbytes > 0:
+                maps.append(np.memmap(self.fh, np.uint8, mode, file_offset,
+                                      (nbytes,)))
+                self.fh.seek(file_offset + nbytes)
+                count -= nbytes
+            if count > 0:
+                self._open(self.file_nr + 1)
+
+        return SequentialMemmap(maps, dtype)
+
     def close(self):
-        """Close the currently open local file, and therewith the set."""
+        """Close all open local files, and therewith the set."""
         if self.file_nr is not None:
-            self.fh.close()
+            self._file_cache.close()
             self.file_nr = None
 
     def __enter__(self):
@@ -124,6 +357,9 @@ class SequentialFileBase(object):
 class SequentialFileReader(SequentialFileBase):
     """Read several files as if they were one contiguous one.
 
+    For files given by name, sizes are determined with `os.stat`, so that
+    only files that are actually read from need to be opened.
+
     Parameters
     ----------
     files : list, tuple, or other iterable of str, filehandle
@@ -134,7 +370,13 @@ class SequentialFileReader(SequentialFileBase):
         The mode with which the files should be opened (default: 'rb')
     opener : callable, optional
         Function to open a single file (default: `io.open`).
+    max_open_files : int, optional
+        Maximum number of underlying files kept open, so that seeking back and
+        forth between files does not require reopening them (default: 8).
     """
+    def __init__(self, files, mode='rb', opener=None, max_open_files=8):
+        super(SequentialFileReader, self).__init__(files, mode, opener,
+                                                   max_open_files)
 
     @property
     def file_size(self):
@@ -144,9 +386,32 @@ class SequentialFileReader(SequentialFileBase):
         self.fh.seek(offset)
         return file_size
 
+    def _add_file_sizes(self, offset=None):
+        """Add sizes of files not yet seen, until ``offset`` is covered.
+
+        Sizes are determined using `os.stat`, so no files are opened.
+        Stops at the first file that is not given by name, or that does
+        not exist.
+        """
+        while offset is None or offset >= self._file_offsets[-1]:
+            try:
+                name = self.files[len(self._file_sizes)]
+            except IndexError:
+                return
+            if not isinstance(name, six.string_types):
+                return
+            try:
+                file_size = os.stat(name).st_size
+            except OSError:
+                return
+            self._file_sizes.append(file_size)
+            self._file_offsets.append(self._file_offsets[-1] + file_size)
+
     @lazyproperty
     def size(self):
         """Size of all underlying files combined."""
+        self._add_file_sizes()
+        # Any files not given by name need to be opened to get their size.
         offset = self.tell()
         for i in itertools.count(start=len(self._file_sizes)):
             try:
@@ -171,6 +436,7 @@ class SequentialFileReader(SequentialFileBase):
         if offset < 0:
             raise OSError('invalid offset')
 
+        self._add_file_sizes(offset)
         # If the offset is not in the current file, find right one.
         while not (0 <= offset - self._file_offsets[self.file_nr] <
                    self._file_sizes[self.file_nr]):
@@ -199,22 +465,41 @@ class SequentialFileReader(SequentialFileBase):
         if count is None or count < 0:
             count = max(self.size - self.tell(), 0)
 
-        data = b''
-        while count > 0:
-            extra = self.fh.read(count)
-            if not extra:
-                break
-            count -= len(extra)
-            if not data:  # avoid copies for first read.
-                data = extra
-            else:
-                data += extra
-            # Go to current offset, possibly opening new file.
-            self.seek(0, 1)
+        if count <= self._file_sizes[self.file_nr] - self.fh.tell():
+            # All within the current file, so no need for another copy.
+            return self.fh.read(count)
 
+        # Read across files straight into a bytearray, which is returned
+        # as is (rather than converted to bytes) to avoid another copy.
+        data = bytearray(count)
+        count = self.readinto(data)
+        del data[count:]
         return data
     read.__doc__ = io.BufferedIOBase.read.__doc__
 
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError('readinto of closed file.')
+
+        view = memoryview(b)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+        count = len(view)
+        nread = 0
+        while nread < count:
+            extra = self.fh.readinto(view[nread:])
+            if not extra:
+                # At the end of the current file, so go to the next one.
+                try:
+                    self._open(self.file_nr + 1)
+                except (OSError, IOError):
+                    break
+                continue
+            nread += extra
+
+        return nread
+    readinto.__doc__ = io.BufferedIOBase.readinto.__doc__
+
 
 class SequentialFileWriter(SequentialFileBase):
     """Write several files as if they were one contiguous one.
@@ -237,11 +522,92 @@ class SequentialFileWriter(SequentialFileBase):
         class somewhat pointless).
     opener : callable, optional
         Function to open a single file (default: `io.open`).
+    preallocate : bool, optional
+        Whether to allocate disk space for ``file_size`` bytes when opening a
+        file, using `os.posix_fallocate` (where available), to reduce
+        fragmentation.  On closing, the last file is truncated to the size
+        actually written.  Default: `False`.
+    open_ahead : bool, optional
+        Whether to open (and possibly preallocate) the next file in a
+        background thread as soon as a file is opened, so that this does not
+        hold up writing at the rollover.  Only files that do not exist yet
+        are opened ahead;  if such a file is not needed in the end, it is
+        removed on closing.  Default: `False`.
     """
-    def __init__(self, files, mode='w+b', file_size=None, opener=None):
+    def __init__(self, files, mode='w+b', file_size=None, opener=None,
+                 preallocate=False, open_ahead=False):
         self.file_size = file_size
+        self.preallocate = preallocate
+        self.open_ahead = open_ahead
+        self._next_file = None
+        self._pool = None
         super(SequentialFileWriter, self).__init__(files, mode, opener)
 
+    def _prepare_file(self, file_nr):
+        fh = super(SequentialFileWriter, self)._open_file(file_nr)
+        if (self.preallocate and self.file_size is not None and
+                hasattr(os, 'posix_fallocate')):
+            os.posix_fallocate(fh.fileno(), 0, self.file_size)
+        return fh
+
+    def _open_file(self, file_nr):
+        if self._next_file is not None and self._next_file[0] == file_nr:
+            result = self._next_file[1]
+            self._next_file = None
+            return result.get()
+
+        self._discard_next_file()
+        return self._prepare_file(file_nr)
+
+    def _open(self, file_nr):
+        super(SequentialFileWriter, self)._open(file_nr)
+        if (self.open_ahead and self.file_size is not None and
+                self._next_file is None):
+            try:
+                name = self.files[file_nr + 1]
+            except IndexError:
+                return
+            # Opening would truncate an existing file, which should be left
+            # alone in case it turns out not to be needed.
+            if isinstance(name, six.string_types) and os.path.exists(name):
+                return
+            if self._pool is None:
+                self._pool = ThreadPool(1)
+            self._next_file = (file_nr + 1, self._pool.apply_async(
+                self._prepare_file, (file_nr + 1,)))
+
+    def _discard_next_file(self):
+        """Close and remove a file opened ahead but not used.
+
+        Since only files that did not exist yet are opened ahead, this
+        only removes files created by the writer itself.
+        """
+        if self._next_file is None:
+            return
+        file_nr, result = self._next_file
+        self._next_file = None
+        try:
+            fh = result.get()
+        except Exception:
+            return
+        fh.close()
+        name = self.files[file_nr]
+        if isinstance(name, six.string_types):
+            os.remove(name)
+
+    def close(self):
+        """Close the currently open local file, and therewith the set."""
+        try:
+            if self.file_nr is not None and self.preallocate:
+                self.fh.truncate(self.fh.tell())
+            self._discard_next_file()
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+            super(SequentialFileWriter, self).close()
+
     def write(self, data):
         if self.closed:
             raise ValueError('write to closed file.')
@@ -267,15 +633,17 @@ class SequentialFileWriter(SequentialFileBase):
                      self).memmap(dtype, mode, offset, shape, order)
 
 
-def open(files, mode='rb', file_size=None, opener=None):
+def open(files, mode='rb', file_size=None, opener=None, **kwargs):
     """Read or write several files as if they were one contiguous one.
 
     Parameters
     ----------
-    files : list, tuple, or other iterable of str, filehandle
+    files : list, tuple, or other iterable of str, filehandle, or str
         The contains the names of the underlying files that should be combined.
         If not a list or tuple, it should allow indexing with positive indices,
-        and raise `IndexError` if these are out of range.
+        and raise `IndexError` if these are out of range.  If a string, it is
+        taken as a template, which is formatted with '{file_nr}' (see
+        `FileNameSequencer`);  for reading, all existing files are used.
     mode : str, optional
         The mode with which the files should be opened (default: 'rb').
     file_size : int, optional
@@ -284,24 +652,63 @@ def open(files, mode='rb', file_size=None, opener=None):
         single file will be written).
     opener : callable, optional
         Function to open a single file (default: `io.open`).
+    **kwargs
+        For writing, further arguments, such as ``preallocate`` and
+        ``open_ahead`` (see `SequentialFileWriter`).
 
     Notes
     -----
     The returned reader/writer will have a ``memmap`` method with which part of
     the files can be mapped to memory (like with `~numpy.memmap`), as long as
-    those parts do not span files (and the underlying files are regular ones).
-    For writing, this requires opening in read-write mode (i.e., 'w+b').
+    the underlying files are regular ones.  For reading, one-dimensional maps
+    can span files (see `SequentialMemmap`).  For writing, maps cannot span
+    files, and opening in read-write mode (i.e., 'w+b') is required.
 
     Methods other than ``read``, ``write``, ``seek``, ``tell``, and ``close``
     are tried on the underlying file.  This implies, e.g., ``readline`` is
     possible, though the line cannot span multiple files.
     """
+    if isinstance(files, six.string_types):
+        files = FileNameSequencer(files)
+        if 'r' in mode:
+            files = [files[i] for i in range(len(files))]
+
     if 'r' in mode:
         if file_size is not None:
             raise TypeError("cannot pass in 'file_size' for reading.")
-        return SequentialFileReader(files, mode, opener=opener)
+        return SequentialFileReader(files, mode, opener=opener, **kwargs)
     elif 'w' in mode:
         return SequentialFileWriter(files, mode, file_size=file_size,
-                                    opener=opener)
+                                    opener=opener, **kwargs)
     else:
         raise ValueError("invalid mode '{0}'".format(mode))
+
+
+def open_series(name, mode='rb', file_size=None, **kwargs):
+    """Open a series of files as one, if ``name`` describes such a series.
+
+    Used by the format ``open`` functions to support multiple files.
+
+    Parameters
+    ----------
+    name : str, filehandle, list or tuple of str
+        A list or tuple is taken to be a series of file names, and a string
+        containing a '{file_nr' field a template for those (see
+        `FileNameSequencer`).  Anything else, including a name of a single
+        file that happens to contain braces, is returned unchanged.
+    mode : str, optional
+        The mode with which the files should be opened (default: 'rb').
+    file_size : int, optional
+        For writing, the maximum size of a file (see `open`).
+    **kwargs
+        Further arguments for `open`.
+
+    Returns
+    -------
+    name : str, filehandle, `SequentialFileReader`, or `SequentialFileWriter`
+        The combined files for a series, otherwise ``name`` itself.
+    """
+    if isinstance(name, (tuple, list)) or (
+            isinstance(name, six.string_types) and '{file_nr' in name):
+        return open(name, mode, file_size=file_size, **kwargs)
+    return name
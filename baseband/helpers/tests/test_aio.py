@@ -0,0 +1,171 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+
+import numpy as np
+from astropy import units as u
+from astropy.tests.helper import pytest
+
+from ... import vdif, mark5b
+from ...data import SAMPLE_VDIF, SAMPLE_MARK5B
+
+asyncio = pytest.importorskip('asyncio')
+aio = pytest.importorskip('baseband.helpers.aio')
+
+
+def iterate(loop, iterator):
+    """Run through an asynchronous iterator, without needing 'async for'.
+
+    Copies of the items are returned, since chunks reuse buffers.
+    """
+    aiter = iterator.__aiter__()
+    result = []
+    while True:
+        try:
+            result.append(loop.run_until_complete(aiter.__anext__()).copy())
+        except StopAsyncIteration:  # noqa
+            return result
+
+
+def run_in_loop(loop, function):
+    """Call function while loop is running, and wait for its future.
+
+    Like awaiting ``function()`` inside a coroutine, but without needing
+    'async def'.
+    """
+    result = asyncio.Future(loop=loop)
+
+    def call():
+        try:
+            future = function()
+        except Exception as exc:
+            result.set_exception(exc)
+            return
+
+        def transfer(future):
+            if future.exception() is not None:
+                result.set_exception(future.exception())
+            else:
+                result.set_result(future.result())
+
+        future.add_done_callback(transfer)
+
+    loop.call_soon(call)
+    return loop.run_until_complete(result)
+
+
+class TestAsyncStreamReader(object):
+    def setup(self):
+        self.loop = asyncio.new_event_loop()
+        with vdif.open(SAMPLE_VDIF, 'rs') as fh:
+            self.data = fh.read()
+
+    def teardown(self):
+        self.loop.close()
+
+    def test_read(self):
+        fh = aio.AsyncStreamReader(vdif.open(SAMPLE_VDIF, 'rs'),
+                                   loop=self.loop)
+        assert fh.size == 40000
+        data = self.loop.run_until_complete(fh.read(12))
+        assert fh.tell() == 12
+        assert np.all(data == self.data[:12])
+        fh.seek(30000)
+        future = fh.read(fill_value=1.)
+        assert isinstance(future, asyncio.Future)
+        data = self.loop.run_until_complete(future)
+        assert np.all(data == self.data[30000:])
+        self.loop.run_until_complete(fh.close())
+        assert fh.closed
+
+    def test_context_manager(self):
+        raw = vdif.open(SAMPLE_VDIF, 'rs')
+        fh = aio.AsyncStreamReader(raw, loop=self.loop)
+        assert self.loop.run_until_complete(fh.__aenter__()) is fh
+        self.loop.run_until_complete(fh.__aexit__(None, None, None))
+        assert raw.closed
+
+    @pytest.mark.parametrize('nsample,overlap',
+                             ((3000, 0), (3000, 1000), (20000, 0),
+                              (40000, 0)))
+    def test_iter_chunks(self, nsample, overlap):
+        with vdif.open(SAMPLE_VDIF, 'rs') as fh:
+            fh.seek(100)
+            expected = [chunk.copy() for chunk in
+                        fh.iter_chunks(nsample, overlap=overlap)]
+            expected_offset = fh.tell()
+
+        raw = vdif.open(SAMPLE_VDIF, 'rs')
+        fh = aio.AsyncStreamReader(raw, loop=self.loop, max_frames=1)
+        fh.seek(100)
+        chunks = iterate(self.loop, fh.iter_chunks(nsample, overlap=overlap))
+        # Like for the stream itself, only complete chunks are returned.
+        assert len(chunks) == len(expected) == ((39900 - overlap) //
+                                                (nsample - overlap))
+        for chunk, expected_chunk in zip(chunks, expected):
+            assert chunk.shape == (nsample, 8)
+            assert np.all(chunk == expected_chunk)
+        assert fh.tell() == expected_offset
+        self.loop.run_until_complete(fh.close())
+
+    def test_iter_chunks_buffers(self, monkeypatch):
+        raw = vdif.open(SAMPLE_VDIF, 'rs')
+        threads = []
+        read = raw.read
+
+        def recording_read(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return read(*args, **kwargs)
+
+        monkeypatch.setattr(raw, 'read', recording_read)
+        fh = aio.AsyncStreamReader(raw, loop=self.loop, max_frames=2)
+        iterator = fh.iter_chunks(4000)
+        # Nothing is read until iteration starts.
+        assert threads == []
+        aiter = iterator.__aiter__()
+        chunks = []
+        for i in range(6):
+            chunk = self.loop.run_until_complete(aiter.__anext__())
+            assert np.all(chunk == self.data[i * 4000:(i + 1) * 4000])
+            chunks.append(chunk)
+        # Two chunks are read ahead, so the buffers form a ring of three.
+        assert np.may_share_memory(chunks[0], chunks[3])
+        assert not any(np.may_share_memory(chunks[0], chunk)
+                       for chunk in chunks[1:3])
+        # All reading is done outside of the event loop thread.
+        assert threads
+        assert threading.current_thread() not in threads
+        self.loop.run_until_complete(fh.close())
+
+    def test_default_loop(self):
+        # Without a loop given, the reader can be created where there is no
+        # event loop, such as in another thread; the loop running when its
+        # methods are called is used.
+        created = []
+        thread = threading.Thread(target=lambda: created.append(
+            aio.AsyncStreamReader(vdif.open(SAMPLE_VDIF, 'rs'),
+                                  max_frames=1)))
+        thread.start()
+        thread.join()
+        fh = created[0]
+        assert run_in_loop(self.loop, fh.__aenter__) is fh
+        data = run_in_loop(self.loop, lambda: fh.read(12))
+        assert np.all(data == self.data[:12])
+        aiter = fh.iter_chunks(10000).__aiter__()
+        chunk = run_in_loop(self.loop, aiter.__anext__)
+        assert np.all(chunk == self.data[12:10012])
+        run_in_loop(self.loop, lambda: fh.__aexit__(None, None, None))
+        assert fh.closed
+
+    def test_mark5b(self):
+        kwargs = dict(nchan=8, bps=2, ref_mjd=57000, sample_rate=32*u.MHz)
+        with mark5b.open(SAMPLE_MARK5B, 'rs', **kwargs) as fh:
+            data = fh.read()
+        fh = aio.AsyncStreamReader(mark5b.open(SAMPLE_MARK5B, 'rs', **kwargs),
+                                   loop=self.loop)
+        chunks = iterate(self.loop, fh.iter_chunks(6000))
+        assert len(chunks) == len(data) // 6000
+        assert np.all(np.concatenate(chunks) == data[:len(chunks) * 6000])
+        self.loop.run_until_complete(fh.close())
@@ -2,6 +2,7 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import io
 import os
 import numpy as np
 from astropy.tests.helper import pytest
@@ -64,6 +65,46 @@ class TestSequentialFileReader(object):
             assert fh._file_sizes == self.sizes
             assert fh._file_offsets == self.offsets
 
+    def test_sizes_without_opening(self):
+        opened = []
+
+        def opener(name, mode):
+            opened.append(name)
+            return io.open(name, mode)
+
+        with sf.open(self.files, opener=opener) as fh:
+            assert fh.size == self.size
+            assert fh._file_offsets == self.offsets
+            fh.seek(self.offsets[2] + 1)
+            assert fh.read(2) == self.data[21:23]
+        # Only the first file and the one actually read should be opened.
+        assert opened == [self.files[0], self.files[2]]
+
+    @pytest.mark.parametrize('max_open_files', (1, 2, 3))
+    def test_file_cache(self, max_open_files):
+        opened = []
+
+        def opener(name, mode):
+            opened.append(name)
+            return io.open(name, mode)
+
+        with sf.open(self.files, opener=opener,
+                     max_open_files=max_open_files) as fh:
+            for i in (0, 2, 0, 2, 1, 0):
+                fh.seek(self.offsets[i] + 1)
+                assert fh.read(2) == self.data[self.offsets[i] + 1:
+                                               self.offsets[i] + 3]
+                assert len(fh._file_cache) <= max_open_files
+            cached = [fh._file_cache.get(i) for i in range(3)
+                      if i in fh._file_cache]
+        assert all(f.closed for f in cached)
+        if max_open_files == 1:
+            assert opened == [self.files[i] for i in (0, 2, 0, 2, 1, 0)]
+        elif max_open_files == 2:
+            assert opened == [self.files[i] for i in (0, 2, 1, 0)]
+        else:
+            assert opened == [self.files[i] for i in (0, 2, 1)]
+
     def test_seek(self):
         with sf.open(self.files) as fh:
             fh.seek(self.offsets[1])
@@ -105,6 +146,8 @@ class TestSequentialFileReader(object):
             assert check == self.data[2:4]
             check = fh.read(10)
             assert check == self.data[4:14]
+            # Data spanning files are read straight into a bytearray.
+            assert isinstance(check, bytearray)
             check = fh.read()
             assert check == self.data[14:]
             fh.seek(0)
@@ -117,6 +160,26 @@ class TestSequentialFileReader(object):
             check = fh.read()
             assert check == self.data
 
+    def test_readinto(self):
+        with sf.open(self.files) as fh:
+            buf = bytearray(14)
+            assert fh.readinto(buf) == 14
+            assert buf == self.data[:14]
+            assert fh.readinto(buf) == 12
+            assert buf[:12] == self.data[14:]
+            assert fh.readinto(buf) == 0
+            with pytest.raises(io.UnsupportedOperation):
+                fh.fileno()
+            # Arrays spanning all files can be filled directly.
+            fh.seek(1)
+            out = np.zeros((3, 4), np.uint16)
+            assert fh.readinto(out) == 24
+            assert np.all(out.ravel() == self.uint8_data[1:25].view('u2'))
+            assert fh.tell() == 25
+        # cannot read closed file
+        with pytest.raises(ValueError):
+            fh.readinto(buf)
+
     def test_seek_read(self):
         with sf.open(self.files) as fh:
             fh.seek(8)
@@ -139,8 +202,6 @@ class TestSequentialFileReader(object):
             mm = fh.memmap(shape=(5,))
             assert fh.tell() == 10
             assert (mm == self.uint8_data[5:10]).all()
-            with pytest.raises(ValueError):
-                fh.memmap(offset=7, shape=(5,))
             offset = self.offsets[1]
             fh.seek(offset)
             mm = fh.memmap(shape=(5,))
@@ -158,6 +219,46 @@ class TestSequentialFileReader(object):
         with pytest.raises(ValueError):  # file closed.
             fh.memmap(offset=0, shape=(5,))
 
+    def test_memmap_across_files(self):
+        with sf.open(self.files) as fh:
+            mm = fh.memmap(offset=7, shape=(5,))
+            assert isinstance(mm, sf.SequentialMemmap)
+            assert fh.tell() == 12
+            assert mm.shape == (5,)
+            assert np.all(np.asarray(mm) == self.uint8_data[7:12])
+            # Within a file, one gets views.
+            assert isinstance(mm[:3], np.memmap)
+            assert np.all(mm[:3] == self.uint8_data[7:10])
+            assert not isinstance(mm[2:4], np.memmap)
+            assert np.all(mm[2:4] == self.uint8_data[9:11])
+            assert mm[-1] == self.uint8_data[11]
+            with pytest.raises(IndexError):
+                mm[5]
+            # Items can straddle file boundaries, and maps can span all files.
+            mm = fh.memmap(dtype='<u2', offset=1, shape=(12,))
+            expected = self.uint8_data[1:25].view('<u2')
+            assert mm.size == 12
+            assert mm[4] == expected[4]
+            for item in (slice(None), slice(2, 9), slice(1, None, 3),
+                         slice(10, 2, -3), slice(5, 5)):
+                assert np.all(mm[item] == expected[item])
+            # Views and reshapes, as needed for payload words.
+            mm8 = mm.view(np.uint8)
+            assert isinstance(mm8, sf.SequentialMemmap)
+            assert mm8.shape == (24,)
+            assert np.all(mm8[5:9] == self.uint8_data[6:10])
+            assert np.all(mm8.view('<u2')[:] == expected)
+            array = mm.view(np.uint8, np.ndarray)
+            assert type(array) is np.ndarray
+            assert np.all(array == self.uint8_data[1:25])
+            assert np.all(mm.reshape(3, 4) == expected.reshape(3, 4))
+            with pytest.raises(ValueError):
+                fh.memmap(offset=8, shape=(3,)).view('<u4')
+            with pytest.raises(ValueError):
+                fh.memmap(offset=20, shape=(10,))
+            with pytest.raises(ValueError):
+                fh.memmap(offset=7, shape=(2, 3))
+
 
 class TestSequentialFileWriter(object):
     def _setup(self, tmpdir):
@@ -232,6 +333,47 @@ class TestSequentialFileWriter(object):
         with sf.open(self.files, 'rb') as fh:
             assert fh.read() == self.data
 
+    @pytest.mark.parametrize('preallocate, open_ahead', ((True, False),
+                                                         (False, True),
+                                                         (True, True)))
+    def test_preallocate_open_ahead(self, tmpdir, preallocate, open_ahead):
+        self._setup(tmpdir)
+        files = self.files + [str(tmpdir.join('file3.raw'))]
+        with sf.open(files, 'wb', file_size=10, preallocate=preallocate,
+                     open_ahead=open_ahead) as fh:
+            fh.write(self.data[:4])
+            if preallocate and hasattr(os, 'posix_fallocate'):
+                assert os.path.getsize(self.files[0]) == 10
+            fh.write(self.data[4:23])
+            assert fh.file_nr == 2
+            fh.write(self.data[23:])
+
+        # The last file is truncated, and a file opened ahead is removed.
+        assert [os.path.getsize(fil) for fil in self.files] == [10, 10, 6]
+        assert not os.path.isfile(files[3])
+        with sf.open(self.files, 'rb') as fh:
+            assert fh.read() == self.data
+
+        # Files that exist already are not opened ahead, so they are neither
+        # truncated nor removed if not needed, but are overwritten if needed.
+        with io.open(files[3], 'wb') as fw:
+            fw.write(b'keep')
+        with sf.open(files, 'wb', file_size=10, preallocate=preallocate,
+                     open_ahead=open_ahead) as fh:
+            fh.write(self.data[:4])
+            fh.write(self.data[4:23])
+            fh.write(self.data[23:])
+            fh.write(b'....')
+            assert fh.file_nr == 2
+        assert [os.path.getsize(fil) for fil in self.files] == [10, 10, 10]
+        with io.open(files[3], 'rb') as fh:
+            assert fh.read() == b'keep'
+        with sf.open(files[:2], 'wb', file_size=10,
+                     preallocate=preallocate, open_ahead=open_ahead) as fh:
+            fh.write(self.data[:15])
+        with sf.open(files[:2], 'rb') as fh:
+            assert fh.read() == self.data[:15]
+
     def test_simple_sequencer(self, tmpdir):
         self._setup(tmpdir)
 
@@ -245,6 +387,40 @@ class TestSequentialFileWriter(object):
             assert check == self.data
             assert fh._file_sizes == [8, 8, 8, 2]
 
+    def test_template(self, tmpdir):
+        self._setup(tmpdir)
+
+        template = str(tmpdir.join('file{file_nr:03d}.raw'))
+        with sf.open(template, 'wb', file_size=8) as fh:
+            fh.write(self.data)
+            assert fh.file_nr == 3
+
+        with sf.open(template, 'rb') as fh:
+            assert len(fh.files) == 4
+            assert fh.files[1] == template.format(file_nr=1)
+            check = fh.read()
+            assert check == self.data
+
+    def test_open_series(self, tmpdir):
+        self._setup(tmpdir)
+
+        template = str(tmpdir.join('file{file_nr:03d}.raw'))
+        with sf.open_series(template, 'wb', file_size=8) as fh:
+            assert isinstance(fh, sf.SequentialFileWriter)
+            fh.write(self.data)
+
+        with sf.open_series([template.format(file_nr=i) for i in range(4)],
+                            'rb') as fh:
+            assert isinstance(fh, sf.SequentialFileReader)
+            assert fh.read() == self.data
+
+        # Names that are not series, including ones with braces that do
+        # not define a file number, are passed on unchanged.
+        name = str(tmpdir.join('{odd}.raw'))
+        assert sf.open_series(name, 'rb') is name
+        with io.open(name, 'wb') as fw:
+            assert sf.open_series(fw, 'wb') is fw
+
     def test_memmap(self, tmpdir):
         self._setup(tmpdir)
         data = self.uint8_data
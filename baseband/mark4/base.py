@@ -4,6 +4,7 @@ import io
 import numpy as np
 
 from ..vlbi_base.base import VLBIStreamReaderBase, VLBIStreamWriterBase
+from ..helpers import sequentialfile as sf
 from .header import Mark4Header
 from .frame import Mark4Frame
 
@@ -23,7 +24,7 @@ class Mark4FileReader(io.BufferedReader):
     reader :class:`~io.BufferedReader`.
     """
 
-    def read_frame(self, ntrack, decade):
+    def read_frame(self, ntrack, decade, buffer_pool=None):
         """Read a single frame (header plus payload).
 
         Parameters
@@ -33,6 +34,8 @@ class Mark4FileReader(io.BufferedReader):
         decade : int
             Decade the observations were taken (needed to remove ambiguity in
             the Mark 4 time stamp).
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payload into.
 
         Returns
         -------
@@ -41,7 +44,8 @@ class Mark4FileReader(io.BufferedReader):
             :class:`~baseband.mark4.Mark4Header` and data encoded in the frame,
             respectively.
         """
-        return Mark4Frame.fromfile(self, ntrack=ntrack, decade=decade)
+        return Mark4Frame.fromfile(self, ntrack=ntrack, decade=decade,
+                                   buffer_pool=buffer_pool)
 
     def find_frame(self, ntrack, maximum=None, forward=True):
         """Look for the first occurrence of a frame, from the current position.
@@ -210,84 +214,39 @@ class Mark4StreamReader(VLBIStreamReaderBase):
         ``sample_rate``, or by scanning the file.
     sample_rate : `~astropy.units.Quantity`, optional
         Rate at which each thread is sampled (bandwidth * 2; frequency units).
+    prefetch : int, optional
+        Number of frames to read ahead in a background thread.  Default: 0,
+        i.e., frames are read only when needed.
+    prefetch_decode : bool, optional
+        Whether to also decode frames read ahead.  Default: `False`.
+    workers : int, optional
+        Number of threads used to decode frames in parallel, for reads that
+        span multiple frames.  Default: 1, i.e., no parallel decoding.
     """
 
     _frame_class = Mark4Frame
 
     def __init__(self, raw, ntrack, decade=None, thread_ids=None,
-                 frames_per_second=None, sample_rate=None):
+                 frames_per_second=None, sample_rate=None, prefetch=0,
+                 prefetch_decode=False, workers=1):
         self.offset0 = raw.find_frame(ntrack=ntrack)
         self._frame = raw.read_frame(ntrack, decade)
+        self._frame_index = 0
         self._frame_data = None
-        self._frame_nr = None
         header = self._frame.header
         super(Mark4StreamReader, self).__init__(
             fh_raw=raw, header0=header, nchan=header.nchan, bps=header.bps,
             complex_data=False, thread_ids=thread_ids,
             samples_per_frame=header.samples_per_frame,
-            frames_per_second=frames_per_second, sample_rate=sample_rate)
+            frames_per_second=frames_per_second, sample_rate=sample_rate,
+            prefetch=prefetch, prefetch_decode=prefetch_decode,
+            workers=workers)
 
-    def read(self, count=None, fill_value=0., squeeze=True, out=None):
-        """Read count samples.
-
-        The range retrieved can span multiple frames.
-
-        Parameters
-        ----------
-        count : int
-            Number of samples to read.  If omitted or negative, the whole
-            file is read.
-        fill_value : float
-            Value to use for invalid or missing data.
-        squeeze : bool
-            If `True` (default), remove channel and thread dimensions if unity.
-        out : `None` or array
-            Array to store the data in. If given, count will be inferred,
-            and squeeze is set to `False`.
-
-        Returns
-        -------
-        out : array of float
-            Dimensions are (sample-time, vlbi-thread, channel).
-        """
-        if out is None:
-            if count is None or count < 0:
-                count = self.size - self.offset
-
-            out = np.empty((self.nthread, count),
-                           dtype=self._frame.dtype).T
-        else:
-            count = out.shape[0]
-            squeeze = False
-
-        offset0 = self.offset
-        while count > 0:
-            frame_nr, sample_offset = divmod(self.offset,
-                                             self.samples_per_frame)
-            if frame_nr != self._frame_nr:
-                self._read_frame()
-
-            data = self._frame.data
-            if self.thread_ids:
-                data = data[:, self.thread_ids]
-            # Copy relevant data from frame into output.
-            nsample = min(count, self.samples_per_frame - sample_offset)
-            sample = self.offset - offset0
-            out[sample:sample + nsample] = data[sample_offset:
-                                                sample_offset + nsample]
-            self.offset += nsample
-            count -= nsample
-
-        return out.squeeze() if squeeze else out
-
-    def _read_frame(self):
-        frame_nr = self.offset // self.samples_per_frame
-        self.fh_raw.seek(self.offset0 + frame_nr * self.header0.framesize)
-        self._frame = self.fh_raw.read_frame(ntrack=self.header0.ntrack,
-                                             decade=self.header0.decade)
-        # Convert payloads to data array.
-        self._frame_data = self._frame.data
-        self._frame_nr = frame_nr
+    def _read_frame(self, index):
+        self.fh_raw.seek(self.offset0 + index * self.header0.framesize)
+        return self.fh_raw.read_frame(ntrack=self.header0.ntrack,
+                                      decade=self.header0.decade,
+                                      buffer_pool=self._buffer_pool)
 
 
 class Mark4StreamWriter(VLBIStreamWriterBase):
@@ -319,12 +278,17 @@ class Mark4StreamWriter(VLBIStreamWriterBase):
         Bits per sample.
     fanout : int
         Number of tracks over which a given channel is spread out.
+    workers : int, optional
+        Number of threads used to encode frames in the background, with
+        writing also done in a separate thread.  Default: 0, i.e., frames
+        are encoded and written as soon as they are filled.  If used, call
+        ``flush`` to ensure all data have been written.
     """
 
     _frame_class = Mark4Frame
 
     def __init__(self, raw, frames_per_second=None, sample_rate=None,
-                 header=None, **kwargs):
+                 header=None, workers=0, **kwargs):
         if header is None:
             header = Mark4Header.fromvalues(**kwargs)
         super(Mark4StreamWriter, self).__init__(
@@ -332,7 +296,8 @@ class Mark4StreamWriter(VLBIStreamWriterBase):
             bps=header.bps, nchan=header.nchan, complex_data=False,
             samples_per_frame=(header.framesize * 8 // header.bps //
                                header.nchan),
-            frames_per_second=frames_per_second, sample_rate=sample_rate)
+            frames_per_second=frames_per_second, sample_rate=sample_rate,
+            workers=workers)
 
         self._data = np.zeros((self.samples_per_frame, self.nchan), np.float32)
 
@@ -346,7 +311,6 @@ class Mark4StreamWriter(VLBIStreamWriterBase):
         count = data.shape[0]
         sample = 0
         offset0 = self.offset
-        frame = self._data
         while count > 0:
             frame_nr, sample_offset = divmod(self.tell(),
                                              self.samples_per_frame)
@@ -362,9 +326,10 @@ class Mark4StreamWriter(VLBIStreamWriterBase):
             nsample = min(count, self.samples_per_frame - sample_offset)
             sample_end = sample_offset + nsample
             sample = self.offset - offset0
-            frame[sample_offset:sample_end] = data[sample:sample + nsample]
+            self._data[sample_offset:sample_end] = data[sample:
+                                                        sample + nsample]
             if sample_end == self.samples_per_frame:
-                self.fh_raw.write_frame(self._data, self._header)
+                self._write_frame(self._header)
 
             self.offset += nsample
             count -= nsample
@@ -379,11 +344,17 @@ def open(name, mode='rs', **kwargs):
 
     Parameters
     ----------
-    name : str
-        File name
+    name : str, filehandle, or list of str
+        File name, file handle, or series of file names.  A string with
+        '{file_nr}' is taken as a template for a series of names (see
+        `~baseband.helpers.sequentialfile.FileNameSequencer`).  Series are
+        read or written as if they were a single file.
     mode : {'rb', 'wb', 'rs', or 'ws'}, optional
         Whether to open for reading or writing, and as a regular binary file
         or as a stream (default is reading a stream).
+    file_size : int, optional
+        When writing to a list of files or a template, the maximum size of
+        each file.  Default: `None`, i.e., all data go to the first file.
     **kwargs
         Additional arguments when opening the file as a stream
 
@@ -421,6 +392,10 @@ def open(name, mode='rs', **kwargs):
         :class:`~baseband.mark4.base.Mark4StreamReader` or
         :class:`~baseband.mark4.base.Mark4StreamWriter` instance (stream)
     """
+    # Several files are read or written as one.
+    name = sf.open_series(name, 'wb' if 'w' in mode else 'rb',
+                          file_size=kwargs.pop('file_size', None))
+
     if 'w' in mode:
         if not hasattr(name, 'write'):
             name = io.open(name, 'wb')
@@ -97,7 +97,7 @@ class Mark4Frame(VLBIFrameBase):
             self.header['communication_error'] = True
 
     @classmethod
-    def fromfile(cls, fh, ntrack, decade=None, verify=True):
+    def fromfile(cls, fh, ntrack, decade=None, verify=True, buffer_pool=None):
         """Read a frame from a filehandle.
 
         Parameters
@@ -111,9 +111,12 @@ class Mark4Frame(VLBIFrameBase):
             the Mark 4 time stamp).
         verify : bool
             Whether to do basic verification of integrity.  Default: `True`.
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payload into.
         """
         header = cls._header_class.fromfile(fh, ntrack, decade, verify)
-        payload = cls._payload_class.fromfile(fh, header=header)
+        payload = cls._payload_class.fromfile(fh, header=header,
+                                              buffer_pool=buffer_pool)
         return cls(header, payload, verify=verify)
 
     @classmethod
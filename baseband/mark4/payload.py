@@ -223,16 +223,17 @@ class Mark4Payload(VLBIPayloadBase):
         self._coder = (nchan, bps, fanout)
 
     @classmethod
-    def fromfile(cls, fh, header):
+    def fromfile(cls, fh, header, buffer_pool=None):
         """Read payload from file handle and decode it into data.
 
         The payloadsize, number of channels, bits per sample, and fanout ratio
-        are all taken from the header.
+        are all taken from the header.  If given, the memory to read the
+        payload into is taken from ``buffer_pool``.
         """
-        s = fh.read(header.payloadsize)
-        if len(s) < header.payloadsize:
-            raise EOFError("Could not read full payload.")
-        return cls(np.fromstring(s, dtype=header.stream_dtype), header)
+        words = cls._words_fromfile(fh, header.payloadsize,
+                                    dtype=header.stream_dtype,
+                                    buffer_pool=buffer_pool)
+        return cls(words, header)
 
     @classmethod
     def fromdata(cls, data, header):
@@ -479,6 +479,23 @@ class TestMark4(object):
                 conv_bytes = s.read()
                 assert conv_bytes == orig_bytes
 
+    @pytest.mark.parametrize(('nsample', 'overlap'),
+                             ((40000, 0), (50000, 10000), (70000, 33)))
+    def test_iter_chunks(self, nsample, overlap):
+        with mark4.open(SAMPLE_FILE, 'rs', ntrack=64, decade=2010,
+                        sample_rate=32*u.MHz) as fh:
+            record = fh.read()
+            fh.seek(0)
+            step = nsample - overlap
+            nblock = 0
+            for i, block in enumerate(fh.iter_chunks(nsample,
+                                                     overlap=overlap)):
+                assert block.shape == (nsample, 8)
+                assert np.all(block == record[i * step:i * step + nsample])
+                nblock += 1
+            assert nblock == (fh.size - overlap) // step
+            assert fh.tell() == overlap + nblock * step
+
     def test_corrupt_stream(self):
         with mark4.open(SAMPLE_FILE, 'rb') as fh, io.BytesIO() as s:
             fh.seek(0xa88)
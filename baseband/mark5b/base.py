@@ -4,6 +4,7 @@ import numpy as np
 from astropy import units as u
 
 from ..vlbi_base.base import VLBIStreamReaderBase, VLBIStreamWriterBase
+from ..helpers import sequentialfile as sf
 from .header import Mark5BHeader
 from .frame import Mark5BFrame
 
@@ -19,7 +20,7 @@ class Mark5BFileReader(io.BufferedReader):
     reader :class:`~io.BufferedReader`.
     """
 
-    def read_frame(self, ref_mjd, nchan, bps=2):
+    def read_frame(self, ref_mjd, nchan, bps=2, buffer_pool=None):
         """Read a single frame (header plus payload).
 
         Parameters
@@ -31,6 +32,8 @@ class Mark5BFileReader(io.BufferedReader):
             Number of channels encoded in the payload.
         bps : int
             Bits per sample (default=2).
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payload into.
 
         Returns
         -------
@@ -39,7 +42,7 @@ class Mark5BFileReader(io.BufferedReader):
             Mark5BHeader and data encoded in the frame, respectively.
         """
         return Mark5BFrame.fromfile(self, nchan=nchan, bps=bps,
-                                    ref_mjd=ref_mjd)
+                                    ref_mjd=ref_mjd, buffer_pool=buffer_pool)
 
     def find_header(self, template_header=None, kday=None, framesize=None,
                     maximum=None, forward=True):
@@ -166,20 +169,32 @@ class Mark5BStreamReader(VLBIStreamReaderBase):
         ``sample_rate``, or by scanning the file.
     sample_rate : `~astropy.units.Quantity`, optional
         Rate at which each thread is sampled (bandwidth * 2; frequency units).
+    prefetch : int, optional
+        Number of frames to read ahead in a background thread.  Default: 0,
+        i.e., frames are read only when needed.
+    prefetch_decode : bool, optional
+        Whether to also decode frames read ahead.  Default: `False`.
+    workers : int, optional
+        Number of threads used to decode frames in parallel, for reads that
+        span multiple frames.  Default: 1, i.e., no parallel decoding.
     """
 
     _frame_class = Mark5BFrame
 
     def __init__(self, raw, nchan, bps=2, ref_mjd=None, thread_ids=None,
-                 frames_per_second=None, sample_rate=None):
+                 frames_per_second=None, sample_rate=None, prefetch=0,
+                 prefetch_decode=False, workers=1):
         self._frame = raw.read_frame(ref_mjd=ref_mjd, nchan=nchan, bps=bps)
+        self._frame_index = 0
         self._frame_data = None
         header = self._frame.header
         super(Mark5BStreamReader, self).__init__(
             raw, header0=header, nchan=nchan, bps=bps, complex_data=False,
             thread_ids=thread_ids,
             samples_per_frame=header.payloadsize * 8 // bps // nchan,
-            frames_per_second=frames_per_second, sample_rate=sample_rate)
+            frames_per_second=frames_per_second, sample_rate=sample_rate,
+            prefetch=prefetch, prefetch_decode=prefetch_decode,
+            workers=workers)
 
     @property
     def size(self):
@@ -188,69 +203,16 @@ class Mark5BStreamReader(VLBIStreamReaderBase):
             self.frames_per_second)) + 1
         return n_frames * self.samples_per_frame
 
-    def read(self, count=None, fill_value=0., squeeze=True, out=None):
-        """Read count samples.
-
-        The range retrieved can span multiple frames.
-
-        Parameters
-        ----------
-        count : int
-            Number of samples to read.  If omitted or negative, the whole
-            file is read.
-        fill_value : float or complex
-            Value to use for invalid or missing data.
-        squeeze : bool
-            If `True` (default), remove channel and thread dimensions if unity.
-        out : `None` or array
-            Array to store the data in. If given, count will be inferred,
-            and squeeze is set to `False`.
-
-        Returns
-        -------
-        out : array of float or complex
-            Dimensions are (sample-time, vlbi-thread, channel).
-        """
-        if out is None:
-            if count is None or count < 0:
-                count = self.size - self.offset
-
-            out = np.empty((self.nthread, count),
-                           dtype=self._frame.dtype).T
-        else:
-            count = out.shape[0]
-            squeeze = False
-
-        offset0 = self.offset
-        while count > 0:
-            dt, frame_nr, sample_offset = self._frame_info()
-            if(dt != self._frame.seconds - self.header0.seconds or
-               frame_nr != self._frame['frame_nr']):
-                # Read relevant frame, reusing data array from previous frame.
-                self._read_frame()
-                assert dt == (self._frame.seconds - self.header0.seconds)
-                assert frame_nr == self._frame['frame_nr']
-
-            data = self._frame.data
-            if self.thread_ids:
-                data = data[:, self.thread_ids]
-            # Copy relevant data from frame into output.
-            nsample = min(count, self.samples_per_frame - sample_offset)
-            sample = self.offset - offset0
-            out[sample:sample + nsample] = data[sample_offset:
-                                                sample_offset + nsample]
-            self.offset += nsample
-            count -= nsample
-
-        return out.squeeze() if squeeze else out
-
-    def _read_frame(self):
-        self.fh_raw.seek(self.offset // self.samples_per_frame *
-                         self._frame.size)
-        self._frame = self.fh_raw.read_frame(ref_mjd=self.header0.kday,
-                                             nchan=self.nchan, bps=self.bps)
-        # Convert payloads to data array.
-        self._frame_data = self._frame.data
+    def _read_frame(self, index):
+        self.fh_raw.seek(index * self.header0.framesize)
+        frame = self.fh_raw.read_frame(ref_mjd=self.header0.kday,
+                                       nchan=self.nchan, bps=self.bps,
+                                       buffer_pool=self._buffer_pool)
+        dt, frame_nr = divmod(index + self.header0['frame_nr'],
+                              self.frames_per_second)
+        assert dt == frame.seconds - self.header0.seconds
+        assert frame_nr == frame['frame_nr']
+        return frame
 
 
 class Mark5BStreamWriter(VLBIStreamWriterBase):
@@ -281,19 +243,25 @@ class Mark5BStreamWriter(VLBIStreamWriterBase):
     time : `~astropy.time.Time` instance
         Sets bcd-encoded unit day, hour, minute, second, and fraction, as
         well as the frame number.
+    workers : int, optional
+        Number of threads used to encode frames in the background, with
+        writing also done in a separate thread.  Default: 0, i.e., frames
+        are encoded and written as soon as they are filled.  If used, call
+        ``flush`` to ensure all data have been written.
     """
 
     _frame_class = Mark5BFrame
 
     def __init__(self, raw, frames_per_second=None, sample_rate=None,
-                 nchan=1, bps=2, header=None, **kwargs):
+                 nchan=1, bps=2, header=None, workers=0, **kwargs):
         if header is None:
             header = Mark5BHeader.fromvalues(**kwargs)
         super(Mark5BStreamWriter, self).__init__(
             raw, header0=header, nchan=nchan, bps=bps, complex_data=False,
             thread_ids=None,
             samples_per_frame=header.payloadsize * 8 // bps // nchan,
-            frames_per_second=frames_per_second, sample_rate=sample_rate)
+            frames_per_second=frames_per_second, sample_rate=sample_rate,
+            workers=workers)
         self._data = np.zeros((self.samples_per_frame, self.nchan), np.float32)
         self._valid = True
 
@@ -310,7 +278,6 @@ class Mark5BStreamWriter(VLBIStreamWriterBase):
         count = data.shape[0]
         sample = 0
         offset0 = self.offset
-        frame = self._data
         while count > 0:
             dt, frame_nr, sample_offset = self._frame_info()
             if sample_offset == 0:
@@ -326,10 +293,11 @@ class Mark5BStreamWriter(VLBIStreamWriterBase):
             nsample = min(count, self.samples_per_frame - sample_offset)
             sample_end = sample_offset + nsample
             sample = self.offset - offset0
-            frame[sample_offset:sample_end] = data[sample:sample + nsample]
+            self._data[sample_offset:sample_end] = data[sample:
+                                                        sample + nsample]
             if sample_end == self.samples_per_frame:
-                self.fh_raw.write_frame(self._data, self._header,
-                                        bps=self.bps, valid=self._valid)
+                self._write_frame(self._header, bps=self.bps,
+                                  valid=self._valid)
                 self._valid = True
 
             self.offset += nsample
@@ -345,11 +313,17 @@ def open(name, mode='rs', **kwargs):
 
     Parameters
     ----------
-    name : str or filehandle
-        File name or handle
+    name : str, filehandle, or list of str
+        File name, file handle, or series of file names.  A string with
+        '{file_nr}' is taken as a template for a series of names (see
+        `~baseband.helpers.sequentialfile.FileNameSequencer`).  Series are
+        read or written as if they were a single file.
     mode : {'rb', 'wb', 'rs', or 'ws'}, optional
         Whether to open for reading or writing, and as a regular binary file
         or as a stream (default is reading a stream).
+    file_size : int, optional
+        When writing to a list of files or a template, the maximum size of
+        each file.  Default: `None`, i.e., all data go to the first file.
     **kwargs
         Additional arguments when opening the file as a stream
 
@@ -397,6 +371,10 @@ def open(name, mode='rs', **kwargs):
         :class:`~baseband.mark5b.base.Mark5BStreamReader` or
         :class:`~baseband.mark5b.base.Mark5BStreamWriter` instance (stream).
     """
+    # Several files are read or written as one.
+    name = sf.open_series(name, 'wb' if 'w' in mode else 'rb',
+                          file_size=kwargs.pop('file_size', None))
+
     if 'w' in mode:
         if not hasattr(name, 'write'):
             name = io.open(name, 'wb')
@@ -69,7 +69,8 @@ class Mark5BFrame(VLBIFrameBase):
         super(Mark5BFrame, self).__init__(header, payload, valid, verify)
 
     @classmethod
-    def fromfile(cls, fh, ref_mjd, nchan, bps=2, valid=None, verify=True):
+    def fromfile(cls, fh, ref_mjd, nchan, bps=2, valid=None, verify=True,
+                 buffer_pool=None):
         """Read a frame from a filehandle.
 
         Parameters
@@ -85,9 +86,12 @@ class Mark5BFrame(VLBIFrameBase):
             Number of bits per sample used in payload encoding (default: 2).
         verify : bool
             Whether to do basic checks of frame integrity (default: `True`).
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payload into.
         """
         header = cls._header_class.fromfile(fh, ref_mjd, verify=verify)
-        payload = cls._payload_class.fromfile(fh, nchan, bps)
+        payload = cls._payload_class.fromfile(fh, nchan, bps,
+                                              buffer_pool=buffer_pool)
         return cls(header, payload, valid, verify)
 
     @classmethod
@@ -384,6 +384,112 @@ class TestMark5B(object):
                 conv_bytes = s.read()
                 assert conv_bytes == orig_bytes
 
+    @pytest.mark.parametrize('prefetch_decode', (False, True))
+    def test_filestreamer_prefetch(self, prefetch_decode):
+        with mark5b.open(SAMPLE_FILE, 'rs', nchan=8, bps=2,
+                         sample_rate=32*u.MHz, ref_mjd=57000) as fh:
+            record = fh.read()
+
+        with mark5b.open(SAMPLE_FILE, 'rs', nchan=8, bps=2,
+                         sample_rate=32*u.MHz, ref_mjd=57000, prefetch=2,
+                         prefetch_decode=prefetch_decode) as fh:
+            record2 = np.vstack([fh.read(3000) for i in range(6)] +
+                                [fh.read()])
+            # Going back requires reading to restart.
+            fh.seek(5000)
+            record3 = fh.read(7000)
+            # Reading beyond the end should fail like usual.
+            fh.seek(-10, 2)
+            with pytest.raises(EOFError):
+                fh.read(20)
+            assert not fh._prefetcher.running
+            fh.seek(-10, 2)
+            record4 = fh.read()
+
+        assert fh._prefetcher is not None and not fh._prefetcher.running
+        assert np.all(record2 == record)
+        assert np.all(record3 == record[5000:12000])
+        assert np.all(record4 == record[-10:])
+
+    @pytest.mark.parametrize('workers', (1, 3))
+    def test_filestreamer_write_workers(self, workers):
+        with open(SAMPLE_FILE, 'rb') as fh:
+            orig_bytes = fh.read()
+            fh.seek(0)
+            header = mark5b.Mark5BHeader.fromfile(fh, kday=56000)
+        with mark5b.open(SAMPLE_FILE, 'rs', nchan=8, bps=2,
+                         sample_rate=32*u.MHz, ref_mjd=57000) as fh:
+            time0 = fh.time0
+            record = fh.read()
+
+        with io.BytesIO() as s, mark5b.open(
+                s, 'ws', time=time0, nchan=8, bps=2, sample_rate=32*u.MHz,
+                user=header['user'], internal_tvg=header['internal_tvg'],
+                frame_nr=header['frame_nr'], workers=workers) as fw:
+            for i in range(0, 20000, 3000):
+                fw.write(record[i:i+3000])
+            fw.flush()
+            assert fw._pipeline is not None
+            conv_bytes = s.getvalue()
+            # Invalid frames should be marked as such also in the pipeline.
+            s.seek(0)
+            s.truncate()
+            fw.offset = 0
+            fw.write(record[:5000])
+            fw.write(record[5000:10000], invalid_data=True)
+            fw.write(record[10000:])
+            fw.flush()
+            s.seek(0)
+            with mark5b.open(s, 'rs', nchan=8, bps=2, sample_rate=32*u.MHz,
+                             ref_mjd=57000) as fh:
+                record2 = fh.read()
+
+        assert conv_bytes == orig_bytes
+        assert np.all(record2[:5000] == record[:5000])
+        assert np.all(record2[5000:10000] == 0.)
+        assert np.all(record2[10000:] == record[10000:])
+
+    def test_filestreamer_multiple_files(self, tmpdir):
+        with mark5b.open(SAMPLE_FILE, 'rs', nchan=8, bps=2,
+                         sample_rate=32*u.MHz, ref_mjd=57000) as fh:
+            header0 = fh.header0
+            record = fh.read()
+
+        template = str(tmpdir.join('{file_nr:03d}.m5b'))
+        with mark5b.open(template, 'ws', header=header0, nchan=8, bps=2,
+                         sample_rate=32*u.MHz, file_size=25000) as fw:
+            fw.write(record)
+
+        files = [template.format(file_nr=i) for i in range(2)]
+        with mark5b.open(files, 'rs', nchan=8, bps=2,
+                         sample_rate=32*u.MHz, ref_mjd=57000) as fh:
+            assert fh.header0 == header0
+            assert fh.size == 20000
+            fh.seek(4000)
+            record2 = fh.read(8000)
+            fh.seek(0)
+            record3 = fh.read()
+
+        assert np.all(record2 == record[4000:12000])
+        assert np.all(record3 == record)
+
+    @pytest.mark.parametrize(('nsample', 'overlap'),
+                             ((5000, 0), (7000, 2000), (3000, 1)))
+    def test_iter_chunks(self, nsample, overlap):
+        with mark5b.open(SAMPLE_FILE, 'rs', nchan=8, bps=2,
+                         sample_rate=32*u.MHz, ref_mjd=57000) as fh:
+            record = fh.read()
+            fh.seek(0)
+            step = nsample - overlap
+            nblock = 0
+            for i, block in enumerate(fh.iter_chunks(nsample,
+                                                     overlap=overlap)):
+                assert block.shape == (nsample, 8)
+                assert np.all(block == record[i * step:i * step + nsample])
+                nblock += 1
+            assert nblock == (fh.size - overlap) // step
+            assert fh.tell() == overlap + nblock * step
+
     def test_stream_invalid(self):
         with pytest.raises(ValueError):
             mark5b.open('ts.dat', 's')
@@ -0,0 +1,173 @@
+import io
+import os
+import numpy as np
+from astropy import units as u
+from astropy.tests.helper import pytest
+from .. import vdif, mark5b, convert as convert_module
+from ..convert import convert, rewrap, main
+from ..data import SAMPLE_VDIF, SAMPLE_MARK5B
+
+
+class TestConvert(object):
+    def setup(self):
+        with vdif.open(SAMPLE_VDIF, 'rs') as fr:
+            self.header = fr.header0
+            self.data = fr.read()
+        self.writer_kwargs = dict(nchan=8, bps=2,
+                                  sample_rate=self.header.bandwidth * 2)
+        # Sequential conversion, for comparison.
+        with io.BytesIO() as s, mark5b.open(s, 'ws', time=self.header.time,
+                                            **self.writer_kwargs) as fw:
+            fw.write(self.data)
+            fw.fh_raw.flush()
+            self.expected = s.getvalue()
+
+    @pytest.mark.parametrize(('nproc', 'samples_per_range'),
+                             ((1, None), (2, None), (2, 15000)))
+    def test_vdif_to_mark5b(self, tmpdir, nproc, samples_per_range):
+        outfile = str(tmpdir.join('converted.m5b'))
+        outfiles = convert(SAMPLE_VDIF, outfile, 'vdif', 'mark5b',
+                           writer_kwargs=self.writer_kwargs, nproc=nproc,
+                           samples_per_range=samples_per_range,
+                           blocksize=5000)
+        assert outfiles == [outfile]
+        with open(outfile, 'rb') as fh:
+            assert fh.read() == self.expected
+
+        with mark5b.open(outfile, 'rs', nchan=8, bps=2,
+                         ref_mjd=self.header.time.mjd,
+                         sample_rate=self.header.bandwidth * 2) as fh:
+            assert abs(fh.time0 - self.header.time) < 1. * u.ns
+            assert np.all(fh.read() == self.data)
+
+    def test_vdif_to_mark5b_split(self, tmpdir):
+        outfile = str(tmpdir.join('converted_{part}.m5b'))
+        outfiles = convert(SAMPLE_VDIF, outfile, 'vdif', 'mark5b',
+                           writer_kwargs=self.writer_kwargs, nproc=2,
+                           split=True)
+        assert outfiles == [outfile.format(part=part) for part in (0, 1)]
+        parts = []
+        for part_file in outfiles:
+            with open(part_file, 'rb') as fh:
+                parts.append(fh.read())
+        assert b''.join(parts) == self.expected
+        # The parts can be read as a single stream.
+        with mark5b.open(outfiles, 'rs', nchan=8, bps=2,
+                         ref_mjd=self.header.time.mjd,
+                         sample_rate=self.header.bandwidth * 2) as fh:
+            assert abs(fh.time0 - self.header.time) < 1. * u.ns
+            assert np.all(fh.read() == self.data)
+
+    @pytest.mark.parametrize('nproc', (1, 2))
+    def test_vdif_to_mark5b_split_merge(self, tmpdir, nproc):
+        outfile = str(tmpdir.join('converted_{part}.m5b'))
+        merged = str(tmpdir.join('converted.m5b'))
+        outfiles = convert(SAMPLE_VDIF, outfile, 'vdif', 'mark5b',
+                           writer_kwargs=self.writer_kwargs, nproc=nproc,
+                           samples_per_range=10000, split=True,
+                           merge=merged)
+        assert outfiles == [merged]
+        assert sorted(os.listdir(str(tmpdir))) == ['converted.m5b']
+        with open(merged, 'rb') as fh:
+            assert fh.read() == self.expected
+
+        with pytest.raises(ValueError):
+            convert(SAMPLE_VDIF, merged, 'vdif', 'mark5b',
+                    writer_kwargs=self.writer_kwargs, merge=merged)
+
+    def test_incomplete_write(self, tmpdir, monkeypatch):
+        convert_range = convert_module._convert_range
+
+        def short_convert_range(task):
+            nsample, nbytes = convert_range(task)
+            return nsample, nbytes - 1
+
+        monkeypatch.setattr(convert_module, '_convert_range',
+                            short_convert_range)
+        outfile = str(tmpdir.join('converted.m5b'))
+        with pytest.raises(IOError):
+            convert(SAMPLE_VDIF, outfile, 'vdif', 'mark5b',
+                    writer_kwargs=self.writer_kwargs, nproc=1)
+
+    def test_invalid_formats(self, tmpdir):
+        outfile = str(tmpdir.join('converted'))
+        with pytest.raises(ValueError):
+            convert(SAMPLE_VDIF, outfile, 'vdif', 'gsb')
+        with pytest.raises(ValueError):
+            convert(SAMPLE_VDIF, outfile, 'gsb', 'vdif')
+
+
+class TestRewrap(object):
+    def setup(self):
+        self.reader_kwargs = dict(nchan=8, bps=2, ref_mjd=57000)
+
+    def test_mark5b_to_vdif_and_back(self, tmpdir):
+        vdif_file = str(tmpdir.join('rewrapped.vdif'))
+        nframes = rewrap(SAMPLE_MARK5B, vdif_file, 'mark5b', 'vdif',
+                         reader_kwargs=self.reader_kwargs,
+                         header_kwargs=dict(station='AR'))
+        assert nframes == 4
+        with mark5b.open(SAMPLE_MARK5B, 'rs', sample_rate=32*u.MHz,
+                         **self.reader_kwargs) as fm, \
+                vdif.open(vdif_file, 'rs', sample_rate=32*u.MHz) as fv:
+            assert fv.header0.edv == 0xab
+            assert fv.header0.station == 'AR'
+            assert abs(fv.time0 - fm.time0) < 1. * u.ns
+            assert fv.size == fm.size
+            assert np.all(fv.read() == fm.read())
+
+        m5b_file = str(tmpdir.join('rewrapped.m5b'))
+        assert rewrap(vdif_file, m5b_file, 'vdif', 'mark5b') == 4
+        with open(m5b_file, 'rb') as fh, open(SAMPLE_MARK5B, 'rb') as fm:
+            assert fh.read() == fm.read()
+
+    def test_vdif_legacy_to_edv(self, tmpdir):
+        legacy_file = str(tmpdir.join('legacy.vdif'))
+        with vdif.open(SAMPLE_VDIF, 'rb') as fr, \
+                vdif.open(legacy_file, 'wb') as fw:
+            for i in range(16):
+                frame = fr.read_frame()
+                keys = {k: frame.header[k] for k in
+                        vdif.header.VDIFLegacyHeader._header_parser.keys()}
+                keys['legacy_mode'] = True
+                keys['frame_length'] -= 2
+                header = vdif.VDIFHeader.fromkeys(**keys)
+                payload = vdif.VDIFPayload(frame.payload.words, header)
+                vdif.VDIFFrame(header, payload).tofile(fw)
+
+        edv_file = str(tmpdir.join('edv.vdif'))
+        assert rewrap(legacy_file, edv_file, 'vdif', 'vdif') == 16
+        with vdif.open(legacy_file, 'rb') as fl, \
+                vdif.open(edv_file, 'rb') as fe:
+            for i in range(16):
+                frame_l = fl.read_frame()
+                frame_e = fe.read_frame()
+                assert frame_e.header.edv == 0
+                assert frame_e.header.payloadsize == frame_l.header.payloadsize
+                for key in ('seconds', 'frame_nr', 'thread_id'):
+                    assert frame_e.header[key] == frame_l.header[key]
+                assert np.all(frame_e.payload.words == frame_l.payload.words)
+        # Frames that already have an extended header cannot be rewrapped.
+        with pytest.raises(ValueError):
+            rewrap(edv_file, str(tmpdir.join('edv2.vdif')), 'vdif', 'vdif')
+
+    def test_invalid_formats(self, tmpdir):
+        outfile = str(tmpdir.join('rewrapped'))
+        with pytest.raises(ValueError):
+            rewrap(SAMPLE_VDIF, outfile, 'vdif', 'mark4')
+        with pytest.raises(ValueError):
+            rewrap(SAMPLE_VDIF, outfile, 'vdif', 'mark5b')
+
+    def test_main(self, tmpdir, capsys):
+        vdif_file = str(tmpdir.join('rewrapped.vdif'))
+        main([SAMPLE_MARK5B, vdif_file, '-f', 'mark5b', '-t', 'vdif',
+              '--nchan', '8', '--ref-mjd', '57000'])
+        assert 'Rewrapped 4 frames' in capsys.readouterr()[0]
+        m5b_file = str(tmpdir.join('rewrapped.m5b'))
+        main([vdif_file, m5b_file, '--from', 'vdif', '--to', 'mark5b'])
+        with open(m5b_file, 'rb') as fh, open(SAMPLE_MARK5B, 'rb') as fm:
+            assert fh.read() == fm.read()
+        # Mark 5B input requires the number of channels.
+        with pytest.raises(SystemExit):
+            main([SAMPLE_MARK5B, vdif_file, '-f', 'mark5b', '-t', 'vdif',
+                  '--ref-mjd', '57000'])
@@ -1,5 +1,6 @@
 # Licensed under the GPLv3 - see LICENSE.rst
 import io
+import os
 
 import numpy as np
 from astropy.utils import lazyproperty
@@ -7,7 +8,10 @@ import astropy.units as u
 
 from ..vlbi_base.base import (VLBIStreamBase, VLBIStreamReaderBase,
                               VLBIStreamWriterBase)
+from ..vlbi_base.header import eight_word_struct
+from ..helpers import sequentialfile as sf
 from .header import VDIFHeader
+from .payload import VDIFPayload
 from .frame import VDIFFrame, VDIFFrameSet
 
 
@@ -67,9 +71,14 @@ class VDIFFileReader(io.BufferedReader):
     Adds ``read_frame`` and ``read_frameset`` methods to the basic binary
     file reader :class:`~io.BufferedReader`.
     """
-    def read_frame(self):
+    def read_frame(self, buffer_pool=None):
         """Read a single frame (header plus payload).
 
+        Parameters
+        ----------
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payload into.
+
         Returns
         -------
         frame : `~baseband.vdif.VDIFFrame`
@@ -77,9 +86,10 @@ class VDIFFileReader(io.BufferedReader):
             :class:`~baseband.vdif.VDIFHeader` and data encoded in the frame,
             respectively.
         """
-        return VDIFFrame.fromfile(self)
+        return VDIFFrame.fromfile(self, buffer_pool=buffer_pool)
 
-    def read_frameset(self, thread_ids=None, sort=True, edv=None, verify=True):
+    def read_frameset(self, thread_ids=None, sort=True, edv=None, verify=True,
+                      buffer_pool=None):
         """Read a single frame (header plus payload).
 
         Parameters
@@ -94,6 +104,8 @@ class VDIFFileReader(io.BufferedReader):
             improves file integrity checking.)
         verify : bool, optional
             Whether to do (light) sanity checks on the header. Default: True.
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payloads into.
 
         Returns
         -------
@@ -103,7 +115,7 @@ class VDIFFileReader(io.BufferedReader):
             frame set, respectively.
         """
         return VDIFFrameSet.fromfile(self, thread_ids, sort=sort, edv=edv,
-                                     verify=verify)
+                                     verify=verify, buffer_pool=buffer_pool)
 
     def find_header(self, template_header=None, framesize=None, edv=None,
                     maximum=None, forward=True):
@@ -236,7 +248,7 @@ class VDIFStreamBase(VLBIStreamBase):
     _frame_class = VDIFFrame
 
     def __init__(self, fh_raw, header0, thread_ids, frames_per_second=None,
-                 sample_rate=None):
+                 sample_rate=None, **kwargs):
         if frames_per_second is None and sample_rate is None:
             try:
                 frames_per_second = int(header0.framerate.to(u.Hz).value)
@@ -249,7 +261,7 @@ class VDIFStreamBase(VLBIStreamBase):
             thread_ids=thread_ids,
             samples_per_frame=header0.samples_per_frame,
             frames_per_second=frames_per_second,
-            sample_rate=sample_rate)
+            sample_rate=sample_rate, **kwargs)
 
     def _get_time(self, header):
         """Calculate time for given header.
@@ -272,8 +284,17 @@ class VDIFStreamReader(VDIFStreamBase, VLBIStreamReaderBase):
     """VLBI VDIF format reader.
 
     This wrapper is allows one to access a VDIF file as a continues series of
-    samples.  Invalid data are marked, but possible gaps in the data stream
-    are not yet filled in.
+    samples.  Invalid data are marked, and gaps in the data stream, i.e.,
+    missing frame sets or missing frames for some threads, are filled in with
+    ``fill_value``.  The frame indices and thread ids of any missing frames
+    encountered while reading are recorded in the ``missing`` dictionary.
+
+    If only some of the threads are selected and the file is a regular one,
+    only the frames of those threads are read, using positional reads based
+    on the layout of the first frame set (falling back to regular reading
+    for any frame set that does not match that layout).  For sequential
+    reading, the frames of up to 64 frame sets are read in a single system
+    call.
 
     Parameters
     ----------
@@ -286,9 +307,21 @@ class VDIFStreamReader(VDIFStreamBase, VLBIStreamReaderBase):
         ``sample_rate``, EDV bandwidth, or by scanning the file.
     sample_rate : `~astropy.units.Quantity`, optional
         Rate at which each channel in each thread is sampled.
+    prefetch : int, optional
+        Number of frames to read ahead in a background thread.  Default: 0,
+        i.e., frames are read only when needed.
+    prefetch_decode : bool, optional
+        Whether to also decode frames read ahead.  Default: `False`.
+    workers : int, optional
+        Number of threads used to decode frames in parallel, for reads that
+        span multiple frames.  Default: 1, i.e., no parallel decoding.
     """
+    _pread_batch = 64
+    """Maximum number of frame sets read in a single positional read."""
+
     def __init__(self, raw, thread_ids=None, frames_per_second=None,
-                 sample_rate=None):
+                 sample_rate=None, prefetch=0, prefetch_decode=False,
+                 workers=1):
         # We use the very first header in the file, since in some VLBA files
         # not all the headers have the right time.  Hopefully, the first is
         # least likely to have problems...
@@ -296,12 +329,196 @@ class VDIFStreamReader(VDIFStreamBase, VLBIStreamReaderBase):
         # Now also read the first frameset, since we need to know how many
         # threads there are, and what the frameset size is.
         raw.seek(0)
-        self._frameset = raw.read_frameset(thread_ids)
+        self._frame = raw.read_frameset(thread_ids)
+        self._frame_index = 0
+        self._frame_data = None
         if thread_ids is None:
-            thread_ids = [fr['thread_id'] for fr in self._frameset.frames]
+            thread_ids = [fr['thread_id'] for fr in self._frame.frames]
         self._framesetsize = raw.tell()
-        super(VDIFStreamReader, self).__init__(raw, header, thread_ids,
-                                               frames_per_second, sample_rate)
+        # Offset of the actual frame set positions relative to those expected
+        # from the frame set size (nonzero if frames are missing).
+        self._raw_shift = 0
+        self._pread_runs = None
+        # Frame sets read ahead by positional reads, the index following the
+        # last batch read, and the number of frame sets in that batch.
+        self._pread_cache = {}
+        self._pread_next = None
+        self._pread_nbatch = 1
+        self.missing = {}
+        super(VDIFStreamReader, self).__init__(
+            raw, header, thread_ids, frames_per_second, sample_rate,
+            prefetch=prefetch, prefetch_decode=prefetch_decode,
+            workers=workers)
+        self._pread_runs = self._get_pread_runs()
+
+    def _get_pread_runs(self):
+        """Runs of adjacent selected frames within a frame set.
+
+        Returns a list of (byte offset, number of frames) tuples, or `None`
+        if positional reads cannot be used or are not useful.
+        """
+        if not hasattr(os, 'pread'):  # pragma: no cover
+            return None
+        try:
+            self._fileno = self.fh_raw.fileno()
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            return None
+
+        framesize = self.header0.framesize
+        nframe = self._framesetsize // framesize
+        if len(self.thread_ids) >= nframe:
+            return None
+
+        raw_offset = self.fh_raw.tell()
+        self.fh_raw.seek(0)
+        file_thread_ids = []
+        for i in range(nframe):
+            header = VDIFHeader.fromfile(self.fh_raw, edv=self.header0.edv)
+            file_thread_ids.append(header['thread_id'])
+            self.fh_raw.seek(header.payloadsize, 1)
+        self.fh_raw.seek(raw_offset)
+
+        runs = []
+        previous = None
+        for slot, thread_id in enumerate(file_thread_ids):
+            if thread_id in self.thread_ids:
+                if previous == slot - 1:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([slot * framesize, 1])
+                previous = slot
+
+        # Frames of threads not selected are read into a scratch buffer,
+        # large enough for the largest gap between runs of selected frames.
+        starts = [run[0] for run in runs]
+        stops = [start + nframe * framesize for start, nframe in runs]
+        gaps = ([start - stop for start, stop in zip(starts[1:], stops[:-1])] +
+                [self._framesetsize - stops[-1] + starts[0]])
+        self._pread_skip = np.empty(max(gaps), np.uint8)
+        try:
+            iov_max = os.sysconf('SC_IOV_MAX')
+        except (AttributeError, ValueError, OSError):  # pragma: no cover
+            iov_max = 1024
+        self._pread_max_batch = max(1, min(self._pread_batch,
+                                           iov_max // (2 * len(runs))))
+        return [tuple(run) for run in runs]
+
+    def _pread_frames(self, index, nframeset):
+        """Read the selected frames of ``nframeset`` frame sets at ``index``.
+
+        All frames are read with a single positional read, skipping over the
+        frames of threads that were not selected (with `os.preadv`, these are
+        read into a scratch buffer; otherwise, they are read and ignored).
+
+        Returns a list with, for each frame set read completely, a list of
+        buffers holding its selected frames.
+        """
+        framesize = self.header0.framesize
+        first = self._pread_runs[0][0]
+        last = self._pread_runs[-1][0] + self._pread_runs[-1][1] * framesize
+        offset = index * self._framesetsize + self._raw_shift + first
+        # End of the selected frames of each frame set, relative to offset.
+        stops = [i * self._framesetsize + last - first
+                 for i in range(nframeset)]
+        if hasattr(os, 'preadv'):
+            iovecs = []
+            framesets = []
+            position = first
+            for i in range(nframeset):
+                buffers = []
+                for start, nframe in self._pread_runs:
+                    start += i * self._framesetsize
+                    if start > position:
+                        iovecs.append(self._pread_skip[:start - position])
+                    buffers += [self._buffer_pool.get(framesize)
+                                for k in range(nframe)]
+                    iovecs += buffers[-nframe:]
+                    position = start + nframe * framesize
+                framesets.append(buffers)
+            nbytes = os.preadv(self._fileno, iovecs, offset)
+        else:
+            data = os.pread(self._fileno, stops[-1], offset)
+            nbytes = len(data)
+            framesets = [[np.frombuffer(data, np.uint8, framesize,
+                                        i * self._framesetsize + start +
+                                        k * framesize - first)
+                          for start, nframe in self._pread_runs
+                          for k in range(nframe)]
+                         for i in range(nframeset)
+                         if stops[i] <= nbytes]
+
+        ncomplete = sum(stop <= nbytes for stop in stops)
+        for buffers in framesets[ncomplete:]:
+            for buf in buffers:
+                self._buffer_pool.release(buf)
+        return framesets[:ncomplete]
+
+    def _pread_frameset(self, buffers, index):
+        """Create the frame set at ``index`` from buffers of its frames.
+
+        Returns `None` if the frames found do not match the expected ones.
+        """
+        header_size = self.header0.size
+        frames = []
+        for buf in buffers:
+            header = VDIFHeader(
+                eight_word_struct.unpack_from(buf)[:header_size // 4],
+                edv=self.header0.edv, verify=False)
+            if(header['thread_id'] not in self.thread_ids or
+               self._header_index(header) != index):
+                return None
+            payload = VDIFPayload(buf[header_size:].view('<u4'), header)
+            frames.append(VDIFFrame(header, payload))
+
+        frames.sort(key=lambda frame: frame['thread_id'])
+        return VDIFFrameSet(frames)
+
+    def _pread_framesets(self, index):
+        """Read the selected frames of the frame set at ``index``.
+
+        For sequential access, the following frame sets are read in the same
+        batch, with the number per batch doubling (up to ``_pread_batch``,
+        limited by the number of buffers a single `os.preadv` can fill).
+        Any frame sets beyond the one requested are cached.
+
+        Returns `None` if the frames found do not match the expected ones.
+        """
+        self._clear_pread_cache()
+        if index * self._framesetsize + self._raw_shift < 0:
+            return None
+
+        if index == self._pread_next:
+            self._pread_nbatch = min(2 * self._pread_nbatch,
+                                     self._pread_max_batch)
+        else:
+            self._pread_nbatch = 1
+        framesets = []
+        for i, buffers in enumerate(self._pread_frames(index,
+                                                       self._pread_nbatch)):
+            # Once a frame set does not match, later ones are not trusted.
+            frameset = (self._pread_frameset(buffers, index + i)
+                        if len(framesets) == i else None)
+            if frameset is None:
+                for buf in buffers:
+                    self._buffer_pool.release(buf)
+            else:
+                framesets.append(frameset)
+
+        self._pread_next = index + len(framesets)
+        if not framesets:
+            return None
+        for i, frameset in enumerate(framesets[1:], start=index + 1):
+            self._pread_cache[i] = frameset
+        return framesets[0]
+
+    def _clear_pread_cache(self):
+        for frameset in self._pread_cache.values():
+            self._release_frame(frameset)
+        self._pread_cache.clear()
+
+    def close(self):
+        self._clear_pread_cache()
+        return super(VDIFStreamReader, self).close()
 
     @lazyproperty
     def header1(self):
@@ -328,70 +545,119 @@ class VDIFStreamReader(VDIFStreamBase, VLBIStreamReaderBase):
         self.fh_raw.seek(raw_offset)
         return header1
 
-    def read(self, count=None, fill_value=0., squeeze=True, out=None):
-        """Read count samples.
+    def _empty_out(self, count):
+        return np.empty((self.nthread, count, self.nchan),
+                        dtype=self._frame.dtype).transpose(1, 0, 2)
+
+    def _header_index(self, header):
+        """Index of the frame set a header belongs to."""
+        return ((header['seconds'] - self.header0['seconds']) *
+                self.frames_per_second +
+                header['frame_nr'] - self.header0['frame_nr'])
+
+    def _read_frame(self, index):
+        if self._pread_runs is not None:
+            frameset = self._pread_cache.pop(index, None)
+            if frameset is None:
+                frameset = self._pread_framesets(index)
+            if frameset is not None:
+                return frameset
+
+        # Usually, the frame set is at the expected position.
+        raw_offset = index * self._framesetsize + self._raw_shift
+        if raw_offset >= 0:
+            self.fh_raw.seek(raw_offset)
+            try:
+                frameset = self.fh_raw.read_frameset(
+                    self.thread_ids, edv=self.header0.edv,
+                    buffer_pool=self._buffer_pool)
+            except (EOFError, IOError, AssertionError):
+                pass
+            else:
+                if self._header_index(frameset.header0) == index:
+                    return frameset
+                self._release_frame(frameset)
 
-        The range retrieved can span multiple frames.
+        return self._read_frame_with_gaps(index)
 
-        Parameters
-        ----------
-        count : int
-            Number of samples to read.  If omitted or negative, the whole
-            file is read.
-        fill_value : float or complex
-            Value to use for invalid or missing data.
-        squeeze : bool
-            If `True` (default), remove channel and thread dimensions if unity.
-        out : `None` or array
-            Array to store the data in. If given, count will be inferred,
-            and squeeze is set to `False`.
+    def _find_frame(self, index):
+        """Find the file position of the first frame at or after ``index``.
 
-        Returns
-        -------
-        out : array of float or complex
-            Dimensions are (sample-time, vlbi-thread, channel).
+        Uses bisection on the frame positions, assuming the file consists of
+        whole frames in time order, with possibly some missing.
         """
-        if out is None:
-            if count is None or count < 0:
-                count = self.size - self.offset
-
-            out = np.empty((self.nthread, count, self.nchan),
-                           dtype=self._frameset.dtype).transpose(1, 0, 2)
-        else:
-            count = out.shape[0]
-            squeeze = False
-
-        offset0 = self.offset
-        while count > 0:
-            dt, frame_nr, sample_offset = self._frame_info()
-            if(dt != self._frameset['seconds'] - self.header0['seconds'] or
-               frame_nr != self._frameset['frame_nr']):
-                # Read relevant frame (possibly reusing data array from
-                # previous frame set).
-                self._read_frame_set(fill_value)
-                assert dt == (self._frameset['seconds'] -
-                              self.header0['seconds'])
-                assert frame_nr == self._frameset['frame_nr']
-
-            data = self._frameset.data.transpose(1, 0, 2)
-            # Copy relevant data from frame into output.
-            nsample = min(count, self.samples_per_frame - sample_offset)
-            sample = self.offset - offset0
-            out[sample:sample + nsample] = data[sample_offset:
-                                                sample_offset + nsample]
-            self.offset += nsample
-            count -= nsample
-
-        # Ensure pointer is at right place.
+        framesize = self.header0.framesize
+        self.fh_raw.seek(0, 2)
+        lo, hi = 0, self.fh_raw.tell() // framesize
+        while lo < hi:
+            mid = (lo + hi) // 2
+            self.fh_raw.seek(mid * framesize)
+            header = VDIFHeader.fromfile(self.fh_raw, edv=self.header0.edv)
+            if self._header_index(header) < index:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo * framesize
 
-        return out.squeeze() if squeeze else out
+    def _read_frame_with_gaps(self, index):
+        """Read the frame set at ``index``, filling in missing frames.
 
-    def _read_frame_set(self, fill_value=0.):
-        self.fh_raw.seek(self.offset // self.samples_per_frame *
-                         self._framesetsize)
-        self._frameset = self.fh_raw.read_frameset(self.thread_ids,
-                                                   edv=self.header0.edv)
-        self._frameset.invalid_data_value = fill_value
+        Raises `EOFError` if ``index`` is outside of the stream, or if no
+        frames are present at or after it.
+        """
+        if not 0 <= index < -(-self.size // self.samples_per_frame):
+            raise EOFError("frame set {0} is beyond the end of the stream."
+                           .format(index))
+        raw_offset = self._find_frame(index)
+        self.fh_raw.seek(0, 2)
+        if raw_offset >= self.fh_raw.tell():
+            raise EOFError("no frames at or after frame set {0}."
+                           .format(index))
+        self.fh_raw.seek(raw_offset)
+        frames = {}
+        while True:
+            try:
+                header = VDIFHeader.fromfile(self.fh_raw,
+                                             edv=self.header0.edv)
+            except EOFError:
+                break
+            if self._header_index(header) != index:
+                break
+            if header['thread_id'] in self.thread_ids:
+                payload = VDIFPayload.fromfile(self.fh_raw, header=header,
+                                               buffer_pool=self._buffer_pool)
+                frames[header['thread_id']] = VDIFFrame(header, payload)
+            else:
+                self.fh_raw.seek(header.payloadsize, 1)
+
+        missing = [thread_id for thread_id in self.thread_ids
+                   if thread_id not in frames]
+        if missing:
+            self.missing[index] = missing
+        if len(missing) < len(self.thread_ids):
+            # Use the new position as a guess for the following frame sets.
+            self._raw_shift = raw_offset - index * self._framesetsize
+
+        return VDIFFrameSet([frames[thread_id] if thread_id in frames else
+                             self._missing_frame(index, thread_id)
+                             for thread_id in sorted(self.thread_ids)])
+
+    def _missing_frame(self, index, thread_id):
+        """Create an invalid frame to stand in for a missing one."""
+        header = self.header0.copy()
+        dt, frame_nr = divmod(index + self.header0['frame_nr'],
+                              self.frames_per_second)
+        header['seconds'] = self.header0['seconds'] + dt
+        header['frame_nr'] = frame_nr
+        header['thread_id'] = thread_id
+        header['invalid_data'] = True
+        payload = VDIFPayload(np.zeros(header.payloadsize // 4, '<u4'),
+                              header)
+        return VDIFFrame(header, payload)
+
+    def _decode_frame(self, frame, fill_value=0.):
+        frame.invalid_data_value = fill_value
+        return frame.data.transpose(1, 0, 2)
 
 
 class VDIFStreamWriter(VDIFStreamBase, VLBIStreamWriterBase):
@@ -438,14 +704,19 @@ class VDIFStreamWriter(VDIFStreamBase, VLBIStreamWriterBase):
     bandwidth : `~astropy.units.Quantity`
         In frequency units.  Sufficient for `edv` 1, 3, or 4 to determine the
         frames per second.
+    workers : int, optional
+        Number of threads used to encode frames in the background, with
+        writing also done in a separate thread.  Default: 0, i.e., frames
+        are encoded and written as soon as they are filled.  If used, call
+        ``flush`` to ensure all data have been written.
     """
     def __init__(self, raw, nthread=1, frames_per_second=None,
-                 sample_rate=None, header=None, **kwargs):
+                 sample_rate=None, header=None, workers=0, **kwargs):
         if header is None:
             header = VDIFHeader.fromvalues(**kwargs)
         super(VDIFStreamWriter, self).__init__(
             raw, header, range(nthread), frames_per_second=frames_per_second,
-            sample_rate=sample_rate)
+            sample_rate=sample_rate, workers=workers)
         # Set framerate and thus bandwidth in the header, if not set already.
         try:
             header_framerate = self.header0.framerate
@@ -458,6 +729,9 @@ class VDIFStreamWriter(VDIFStreamBase, VLBIStreamWriterBase):
             (self.nthread, self.samples_per_frame, self.nchan),
             np.complex64 if self.complex_data else np.float32)
 
+    def _make_frame(self, data, header):
+        return VDIFFrameSet.fromdata(data, header)
+
     def write(self, data, squeezed=True, invalid_data=False):
         """Write data, buffering by frames as needed."""
         if squeezed and data.ndim < 3:
@@ -472,7 +746,6 @@ class VDIFStreamWriter(VDIFStreamBase, VLBIStreamWriterBase):
         count = data.shape[0]
         sample = 0
         offset0 = self.offset
-        frame = self._data.transpose(1, 0, 2)
         while count > 0:
             dt, frame_nr, sample_offset = self._frame_info()
             if sample_offset == 0:
@@ -488,9 +761,10 @@ class VDIFStreamWriter(VDIFStreamBase, VLBIStreamWriterBase):
             nsample = min(count, self.samples_per_frame - sample_offset)
             sample_end = sample_offset + nsample
             sample = self.offset - offset0
-            frame[sample_offset:sample_end] = data[sample:sample + nsample]
+            self._data[:, sample_offset:sample_end] = (
+                data[sample:sample + nsample].transpose(1, 0, 2))
             if sample_end == self.samples_per_frame:
-                self.fh_raw.write_frameset(self._data, self._header)
+                self._write_frame(self._header)
 
             self.offset += nsample
             count -= nsample
@@ -505,11 +779,17 @@ def open(name, mode='rs', *args, **kwargs):
 
     Parameters
     ----------
-    name : str
-        File name
+    name : str, filehandle, or list of str
+        File name, file handle, or series of file names.  A string with
+        '{file_nr}' is taken as a template for a series of names (see
+        `~baseband.helpers.sequentialfile.FileNameSequencer`).  Series are
+        read or written as if they were a single file.
     mode : {'rb', 'wb', 'rs', or 'ws'}, optional
         Whether to open for reading or writing, and as a regular binary file
         or as a stream (default is reading a stream).
+    file_size : int, optional
+        When writing to a list of files or a template, the maximum size of
+        each file.  Default: `None`, i.e., all data go to the first file.
     **kwargs :
         Additional arguments when opening the file as a stream
 
@@ -545,6 +825,10 @@ def open(name, mode='rs', *args, **kwargs):
         or a :class:`VDIFStreamReader` or :class:`VDIFStreamWriter` instance
         (stream).
     """
+    # Several files are read or written as one.
+    name = sf.open_series(name, 'wb' if 'w' in mode else 'rb',
+                          file_size=kwargs.pop('file_size', None))
+
     if 'w' in mode:
         if not hasattr(name, 'write'):
             name = io.open(name, 'wb')
@@ -97,7 +97,7 @@ class VDIFFrame(VLBIFrameBase):
         self.header['invalid_data'] = not valid
 
     @classmethod
-    def fromfile(cls, fh, edv=None, verify=True):
+    def fromfile(cls, fh, edv=None, verify=True, buffer_pool=None):
         """Read a frame from a filehandle.
 
         Parameters
@@ -111,9 +111,12 @@ class VDIFFrame(VLBIFrameBase):
             Whether or not to do basic assertions that check the integrity
             (e.g., that channel information and whether or not data are complex
             are consistent between header and data).  Default: `True`.
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payload into.
         """
         header = cls._header_class.fromfile(fh, edv, verify)
-        payload = cls._payload_class.fromfile(fh, header=header)
+        payload = cls._payload_class.fromfile(fh, header=header,
+                                              buffer_pool=buffer_pool)
         return cls(header, payload, verify=verify)
 
     @classmethod
@@ -198,7 +201,8 @@ class VDIFFrameSet(object):
             self.header0 = header0
 
     @classmethod
-    def fromfile(cls, fh, thread_ids=None, sort=True, edv=None, verify=True):
+    def fromfile(cls, fh, thread_ids=None, sort=True, edv=None, verify=True,
+                 buffer_pool=None):
         """Read a frame set from a file, starting at the current location.
 
         Parameters
@@ -221,6 +225,8 @@ class VDIFFrameSet(object):
             improves file integrity checking.)
         verify : bool
             Whether to do (light) sanity checks on the header. Default: True.
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payloads into.
 
         Returns
         -------
@@ -235,9 +241,9 @@ class VDIFFrameSet(object):
         header = header0
         while header['frame_nr'] == header0['frame_nr']:
             if thread_ids is None or header['thread_id'] in thread_ids:
-                frames.append(
-                    VDIFFrame(header, VDIFPayload.fromfile(fh, header=header),
-                              verify=verify))
+                payload = VDIFPayload.fromfile(fh, header=header,
+                                               buffer_pool=buffer_pool)
+                frames.append(VDIFFrame(header, payload, verify=verify))
             else:
                 fh.seek(header.payloadsize, 1)
 
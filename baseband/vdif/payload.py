@@ -117,7 +117,7 @@ class VDIFPayload(VLBIPayloadBase):
         self.nchan = nchan
 
     @classmethod
-    def fromfile(cls, fh, header):
+    def fromfile(cls, fh, header, buffer_pool=None):
         """Read payload from file handle and decode it into data.
 
         Parameters
@@ -127,11 +127,12 @@ class VDIFPayload(VLBIPayloadBase):
         header : `~baseband.vdif.VDIFHeader`
             Used to infer the payloadsize, number of channels, bits per sample,
             and whether the data is complex.
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payload into.
         """
-        s = fh.read(header.payloadsize)
-        if len(s) < header.payloadsize:
-            raise EOFError("Could not read full payload.")
-        return cls(np.fromstring(s, dtype=cls._dtype_word), header)
+        words = cls._words_fromfile(fh, header.payloadsize,
+                                    buffer_pool=buffer_pool)
+        return cls(words, header)
 
     @classmethod
     def fromdata(cls, data, header=None, bps=2, edv=None):
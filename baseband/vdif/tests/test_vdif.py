@@ -3,6 +3,7 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import io
+import os
 import numpy as np
 from astropy.tests.helper import pytest
 from astropy.time import Time
@@ -446,6 +447,279 @@ class TestVDIF(object):
                       np.array([-1, -1, 3, -1, 1, -1, 3, -1, 1, 3, -1, 1]))
         assert np.all(out.squeeze() == record)
 
+    def test_filestreamer_buffer_reuse(self):
+        with vdif.open(SAMPLE_FILE, 'rs') as fh:
+            spf = fh.samples_per_frame
+            words = fh._frame.frames[0].payload.words
+            fh.seek(spf)
+            fh.read(1)
+            fh.seek(0)
+            data = fh.read(spf)
+            # Payloads of the frame set read last should use the memory
+            # released when the one before was replaced.
+            assert any(np.may_share_memory(frame.payload.words, words)
+                       for frame in fh._frame.frames)
+            assert fh.tell() == spf
+
+        with vdif.open(SAMPLE_FILE, 'rb') as fh:
+            expected = fh.read_frameset().data.transpose(1, 0, 2)
+        assert np.all(data == expected.squeeze())
+
+    @pytest.mark.parametrize('thread_ids', ([3], [2, 3], [1, 5, 6]))
+    def test_filestreamer_selected_threads(self, thread_ids):
+        with vdif.open(SAMPLE_FILE, 'rs') as fh:
+            record = fh.read()
+            assert fh._pread_runs is None
+
+        with vdif.open(SAMPLE_FILE, 'rs', thread_ids=thread_ids) as fh:
+            assert fh._pread_runs is not None
+            assert sum(run[1] for run in fh._pread_runs) == len(thread_ids)
+            record2 = fh.read()
+            fh.seek(30000)
+            record3 = fh.read(5000)
+
+        with io.open(SAMPLE_FILE, 'rb') as f, io.BytesIO(f.read()) as s:
+            # Positional reads are not possible for an in-memory file.
+            with vdif.open(s, 'rs', thread_ids=thread_ids) as fh:
+                assert fh._pread_runs is None
+                record4 = fh.read()
+
+        assert np.all(record2.reshape(-1, len(thread_ids)) ==
+                      record[:, thread_ids])
+        assert np.all(record3.reshape(-1, len(thread_ids)) ==
+                      record[30000:35000, thread_ids])
+        assert np.all(record4 == record2)
+
+    def _check_positional_reads(self, thread_ids):
+        with vdif.open(SAMPLE_FILE, 'rs') as fh:
+            record = fh.read()
+
+        with vdif.open(SAMPLE_FILE, 'rs', thread_ids=thread_ids) as fh:
+            assert fh._pread_runs is not None
+            record2 = fh.read()
+            fh.seek(30000)
+            record3 = fh.read(5000)
+
+        assert np.all(record2.reshape(-1, len(thread_ids)) ==
+                      record[:, thread_ids])
+        assert np.all(record3.reshape(-1, len(thread_ids)) ==
+                      record[30000:35000, thread_ids])
+
+    @pytest.mark.skipif(not hasattr(os, 'preadv'),
+                        reason='os.preadv is not available.')
+    @pytest.mark.parametrize('thread_ids', ([3], [1, 5, 6]))
+    def test_filestreamer_preadv(self, thread_ids, monkeypatch):
+        offsets = []
+        preadv = os.preadv
+
+        def recording_preadv(fd, buffers, offset):
+            offsets.append(offset)
+            return preadv(fd, buffers, offset)
+
+        monkeypatch.setattr(os, 'preadv', recording_preadv)
+        self._check_positional_reads(thread_ids)
+        assert len(offsets) > 0
+
+    @pytest.mark.parametrize('thread_ids', ([3], [1, 5, 6]))
+    def test_filestreamer_pread(self, thread_ids, monkeypatch):
+        # Check the fallback used where os.preadv is not available.
+        monkeypatch.delattr(os, 'preadv', raising=False)
+        self._check_positional_reads(thread_ids)
+
+    @pytest.mark.parametrize('use_preadv', (False, True))
+    def test_pread_batches(self, tmpdir, monkeypatch, use_preadv):
+        header = vdif.VDIFHeader.fromvalues(
+            edv=0, time=Time('2010-01-01'), nchan=1, bps=2,
+            complex_data=False, frame_nr=0, thread_id=0,
+            samples_per_frame=64, station='me')
+        data = np.array([-3.3359, -1., 1., 3.3359], np.float32)[
+            np.arange(40 * 64 * 4).reshape(-1, 4) % 7 % 4]
+        name = str(tmpdir.join('batch.vdif'))
+        with vdif.open(name, 'ws', header=header, nthread=4,
+                       frames_per_second=100) as fw:
+            fw.write(data)
+        with vdif.open(name, 'rb') as fh:
+            frames = [fh.read_frame() for i in range(160)]
+        # Also make a file missing frame set 25.
+        gap_name = str(tmpdir.join('gap.vdif'))
+        with vdif.open(gap_name, 'wb') as fw:
+            for frame in frames[:100] + frames[104:]:
+                fw.write_frame(frame)
+
+        calls = []
+        if use_preadv:
+            def preadv(fd, buffers, offset):
+                # Emulate os.preadv if needed, so both paths can be tested.
+                calls.append(offset)
+                nbytes = 0
+                for buf in buffers:
+                    buf = np.frombuffer(buf, np.uint8)
+                    part = os.pread(fd, buf.size, offset + nbytes)
+                    buf[:len(part)] = np.frombuffer(part, np.uint8)
+                    nbytes += len(part)
+                return nbytes
+
+            if hasattr(os, 'preadv'):
+                real_preadv = os.preadv
+
+                def preadv(fd, buffers, offset):  # noqa
+                    calls.append(offset)
+                    return real_preadv(fd, buffers, offset)
+
+            monkeypatch.setattr(os, 'preadv', preadv, raising=False)
+        else:
+            monkeypatch.delattr(os, 'preadv', raising=False)
+            pread = os.pread
+
+            def recording_pread(fd, count, offset):
+                calls.append(offset)
+                return pread(fd, count, offset)
+
+            monkeypatch.setattr(os, 'pread', recording_pread)
+
+        thread_ids = [0, 2]
+        with vdif.open(name, 'rs', thread_ids=thread_ids,
+                       frames_per_second=100) as fh:
+            record = fh.read()
+        assert np.all(record == data[:, thread_ids])
+        # Frame sets are read in batches of 1, 2, 4, 8, 16, and 9.
+        assert len(calls) == 6
+
+        with vdif.open(gap_name, 'rs', frames_per_second=100) as fh:
+            expected = fh.read()
+        with vdif.open(gap_name, 'rs', thread_ids=thread_ids,
+                       frames_per_second=100) as fh:
+            pool = fh._buffer_pool
+            pool.maximum = 1000
+            allocated = []
+            get = pool.get
+
+            def counting_get(nbytes):
+                if(nbytes == header.framesize and
+                   not pool._buffers.get(nbytes)):
+                    allocated.append(nbytes)
+                return get(nbytes)
+
+            pool.get = counting_get
+            record = fh.read()
+            assert fh.missing == {25: [0, 2]}
+            # Leave a frame set read ahead in the cache.
+            fh.seek(30 * 64)
+            fh.read(2 * 64)
+            assert len(fh._pread_cache) > 0
+        assert np.all(record == expected[:, thread_ids])
+        assert fh._pread_cache == {}
+        if use_preadv:
+            # Buffers of frame sets that did not match or were not read
+            # completely, or that were cached but not used, are given back.
+            # Only the frame set last read is still held.
+            pooled = len(pool._buffers.get(header.framesize, ()))
+            assert len(allocated) - pooled == len(thread_ids)
+
+    @pytest.mark.parametrize('prefetch', (0, 1))
+    def test_filestreamer_workers(self, prefetch):
+        with vdif.open(SAMPLE_FILE, 'rs') as fh:
+            record = fh.read()
+            fh.seek(0)
+            invalid = fh.read(fill_value=1.)
+
+        with vdif.open(SAMPLE_FILE, 'rs', workers=3,
+                       prefetch=prefetch) as fh:
+            record2 = fh.read()
+            fh.seek(10)
+            record3 = fh.read(30000)
+            assert fh.tell() == 30010
+            # The last frame should have been kept for the next read.
+            assert fh._frame_index == 1
+            record4 = fh.read()
+            fh.seek(0)
+            invalid2 = fh.read(fill_value=1.)
+            pool = fh._decode_pool
+            assert pool is not None
+
+        assert fh._decode_pool is None
+        assert np.all(record2 == record)
+        assert np.all(record3 == record[10:30010])
+        assert np.all(record4 == record[30010:])
+        assert np.all(invalid2 == invalid)
+
+    def test_iter_chunks(self):
+        with vdif.open(SAMPLE_FILE, 'rs') as fh:
+            record = fh.read()
+            fh.seek(0)
+            blocks = [block.copy() for block in fh.iter_chunks(15000)]
+            assert fh.tell() == 30000
+            fh.seek(0)
+            buffers = []
+            for i, block in enumerate(fh.iter_chunks(15000, overlap=5000)):
+                assert block.shape == (15000, 8)
+                assert np.all(block == record[i * 10000:i * 10000 + 15000])
+                buffers.append(block)
+            # Only complete blocks are returned, and buffers are reused.
+            assert i == 2
+            assert fh.tell() == 35000
+            assert np.may_share_memory(buffers[0], buffers[2])
+            assert not np.may_share_memory(buffers[0], buffers[1])
+            # Blocks can be unsqueezed, and buffers passed in.
+            out = np.zeros((20000, 8, 1))
+            fh.seek(0)
+            blocks2 = list(fh.iter_chunks(20000, out=out, squeeze=False))
+            assert blocks2[0] is out
+            assert np.all(blocks2[0].squeeze() == record[:20000])
+            assert np.all(blocks2[1].squeeze() == record[20000:])
+            with pytest.raises(ValueError):
+                next(fh.iter_chunks(10, overlap=10))
+            # Buffers should hold exactly one block.
+            with pytest.raises(ValueError):
+                next(fh.iter_chunks(10000, out=out, squeeze=False))
+            with pytest.raises(ValueError):
+                next(fh.iter_chunks(20000, out=[out, out[:10000]],
+                                    squeeze=False))
+
+        assert len(blocks) == 2
+        assert np.all(np.vstack(blocks) == record[:30000])
+
+    def test_filestreamer_multiple_files(self, tmpdir):
+        with io.open(SAMPLE_FILE, 'rb') as fh:
+            raw = fh.read()
+        # Split at positions that do not coincide with frame boundaries.
+        files = [str(tmpdir.join('part{0}.vdif'.format(i))) for i in range(3)]
+        for filename, start, stop in zip(files, (0, 25000, 60000),
+                                         (25000, 60000, len(raw))):
+            with io.open(filename, 'wb') as fw:
+                fw.write(raw[start:stop])
+
+        with vdif.open(SAMPLE_FILE, 'rs') as fh:
+            header0 = fh.header0
+            record = fh.read()
+        with vdif.open(files, 'rs') as fh:
+            assert fh.header0 == header0
+            record2 = fh.read()
+            fh.seek(10000)
+            record3 = fh.read(20000)
+        assert np.all(record2 == record)
+        assert np.all(record3 == record[10000:30000])
+
+        template = str(tmpdir.join('out{file_nr:02d}.vdif'))
+        with vdif.open(template, 'ws', header=header0, nthread=8,
+                       file_size=30000) as fw:
+            fw.write(record)
+        assert os.path.getsize(template.format(file_nr=0)) == 30000
+        assert os.path.getsize(template.format(file_nr=2)) == len(raw) - 60000
+        with vdif.open(template, 'rs') as fh:
+            assert len(fh.fh_raw.raw.files) == 3
+            record4 = fh.read()
+        assert np.all(record4 == record)
+
+        # A single file with braces in its name is not taken as a template.
+        braces = str(tmpdir.join('{scan}.vdif'))
+        with io.open(braces, 'wb') as fw:
+            fw.write(raw)
+        with vdif.open(braces, 'rs') as fh:
+            assert fh.header0 == header0
+            record5 = fh.read()
+        assert np.all(record5 == record)
+
     def test_stream_writer(self, tmpdir):
         vdif_file = str(tmpdir.join('simple.vdif'))
         # try writing a very simple file, using edv=0
@@ -474,6 +748,68 @@ class TestVDIF(object):
             record = fh.read(16)
         assert np.all(record == data)
 
+    def test_stream_gaps(self):
+        header = vdif.VDIFHeader.fromvalues(
+            edv=0, time=Time('2010-01-01'), nchan=2, bps=2,
+            complex_data=False, frame_nr=0, thread_id=0, samples_per_frame=16,
+            station='me')
+        o2h = vlbi_base.encoding.OPTIMAL_2BIT_HIGH
+        data = np.array([-o2h, -1., 1., o2h], np.float32)[
+            np.arange(10 * 16 * 2 * 2).reshape(160, 2, 2) % 7 % 4]
+        with io.BytesIO() as s, vdif.open(s, 'ws', header=header, nthread=2,
+                                          frames_per_second=20) as fw:
+            fw.write(data)
+            fw.fh_raw.flush()
+            s.seek(0)
+            with vdif.open(s, 'rb') as fh:
+                frames = [fh.read_frame() for i in range(20)]
+
+        # Drop frame set 3 and thread 1 of frame set 6.
+        with io.BytesIO() as s:
+            for i, frame in enumerate(frames):
+                if i not in (6, 7, 13):
+                    frame.tofile(s)
+            s.seek(0)
+            with vdif.open(s, 'rs', frames_per_second=20) as fh:
+                assert fh.size == 160
+                record = fh.read()
+                fh.seek(7 * 16)
+                record2 = fh.read()
+                fh.seek(0)
+                record3 = fh.read(fill_value=1.)
+                missing = fh.missing
+
+        assert missing == {3: [0, 1], 6: [1]}
+        assert np.all(record[:48] == data[:48])
+        assert np.all(record[48:64] == 0.)
+        assert np.all(record[64:96] == data[64:96])
+        assert np.all(record[96:112, 0] == data[96:112, 0])
+        assert np.all(record[96:112, 1] == 0.)
+        assert np.all(record[112:] == data[112:])
+        assert np.all(record2 == data[112:])
+        assert np.all(record3[48:64] == 1.)
+        assert np.all(record3[96:112, 1] == 1.)
+        # Reading beyond the end should fail, even with gap filling.
+        with io.BytesIO() as s:
+            for i, frame in enumerate(frames):
+                if i not in (6, 7, 13):
+                    frame.tofile(s)
+            s.seek(0)
+            with vdif.open(s, 'rs', frames_per_second=20) as fh:
+                fh.seek(150)
+                with pytest.raises(EOFError):
+                    fh.read(20)
+
+    def test_stream_read_past_end(self):
+        with vdif.open(SAMPLE_FILE, 'rs') as fh:
+            fh.seek(39000)
+            with pytest.raises(EOFError):
+                fh.read(2000)
+            fh.seek(39000)
+            record = fh.read()
+            assert record.shape == (1000, 8)
+            assert fh.tell() == fh.size
+
     def test_corrupt_stream(self):
         with vdif.open(SAMPLE_FILE, 'rb') as fh, io.BytesIO() as s:
             frame = fh.read_frame()
@@ -1,7 +1,14 @@
+import threading
 import warnings
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 from astropy import units as u
 from astropy.utils import lazyproperty
+from astropy.extern.six.moves import queue
+
+from .utils import BufferPool
 
 
 __all__ = ['u_sample', 'VLBIStreamBase', 'VLBIStreamReaderBase',
@@ -116,11 +123,138 @@ class VLBIStreamBase(object):
                                    if self.thread_ids else '')))
 
 
+class FramePrefetcher(object):
+    """Read frames of a stream ahead of time, in a background thread.
+
+    Frames are read in order, starting at a given index, and put in a
+    bounded queue, from which they can be retrieved with `get`.  If a frame
+    other than the next one is requested, reading restarts from there.
+
+    Parameters
+    ----------
+    stream : `~baseband.vlbi_base.base.VLBIStreamReaderBase`
+        Stream reader whose ``_read_frame`` method is used to read frames.
+        Its underlying file should not be used while frames are being read.
+    nframe : int
+        Number of frames in the stream;  reading stops at the last one.
+    maxsize : int
+        Maximum number of frames read ahead.
+    decode : bool, optional
+        Whether to also decode frames in the background (using the stream's
+        ``_decode_frame`` method).  Default: `False`.
+    """
+    def __init__(self, stream, nframe, maxsize, decode=False):
+        self.stream = stream
+        self.nframe = nframe
+        self.maxsize = maxsize
+        self.decode = decode
+        # Value for invalid data used when decoding in the background.
+        self.fill_value = 0.
+        self._thread = None
+        self._next = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, index):
+        """(Re)start reading frames, beginning with the one at ``index``."""
+        self.stop()
+        self._queue = queue.Queue(self.maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(index, self._queue, self._stop))
+        self._thread.daemon = True
+        self._thread.start()
+        self._next = index
+
+    def stop(self):
+        """Stop reading, and release any frames not yet retrieved."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        while not self._queue.empty():
+            index, result = self._queue.get()
+            if not isinstance(result, Exception):
+                self.stream._release_frame(result[0])
+
+    def get(self, index):
+        """Get the frame at ``index``.
+
+        Returns
+        -------
+        frame : frame or frame set
+            As read by the stream's ``_read_frame`` method.
+        decoded : tuple or `None`
+            If decoding in the background, the fill value used and the
+            resulting data; otherwise `None`.
+        """
+        if self._thread is None or index != self._next:
+            self.start(index)
+        item_index, result = self._queue.get()
+        assert item_index == index
+        if isinstance(result, Exception):
+            # The thread has stopped; raise the error it encountered.
+            self.stop()
+            raise result
+        self._next = index + 1
+        return result
+
+    def _run(self, index, frames, stop):
+        while index < self.nframe and not stop.is_set():
+            try:
+                frame = self.stream._read_frame(index)
+                if self.decode:
+                    fill_value = self.fill_value
+                    decoded = fill_value, self.stream._decode_frame(
+                        frame, fill_value)
+                else:
+                    decoded = None
+                result = frame, decoded
+            except Exception as exc:
+                result = exc
+
+            while not stop.is_set():
+                try:
+                    frames.put((index, result), timeout=0.1)
+                except queue.Full:
+                    continue
+                else:
+                    break
+            else:
+                # Stopped before our frame could be queued.
+                if not isinstance(result, Exception):
+                    self.stream._release_frame(result[0])
+
+            if isinstance(result, Exception):
+                return
+            index += 1
+
+
 class VLBIStreamReaderBase(VLBIStreamBase):
+    """Base for VLBI stream readers.
+
+    Subclasses reading streams of fixed-size frames need to define
+    ``_read_frame(index)``, which should return the frame at ``index``,
+    read using the buffer pool ``_buffer_pool``.  They can also override
+    ``_decode_frame`` and ``_empty_out``.
+
+    Frames can be read ahead in a background thread, which allows disk
+    access to overlap with decoding and further processing.  For this,
+    pass in ``prefetch`` with the number of frames to read ahead, and,
+    to decode them in the background as well, ``prefetch_decode=True``.
+
+    Furthermore, for reads spanning multiple frames, the frames can be
+    decoded in parallel, by passing in the number of ``workers`` to use.
+    Reading itself is still done sequentially.
+    """
 
     def __init__(self, fh_raw, header0, nchan, bps, complex_data, thread_ids,
                  samples_per_frame, frames_per_second=None,
-                 sample_rate=None):
+                 sample_rate=None, prefetch=0, prefetch_decode=False,
+                 workers=1):
 
         if frames_per_second is None and sample_rate is None:
             frames_per_second = self._get_frame_rate(fh_raw, type(header0))
@@ -128,6 +262,14 @@ class VLBIStreamReaderBase(VLBIStreamBase):
         super(VLBIStreamReaderBase, self).__init__(
             fh_raw, header0, nchan, bps, complex_data, thread_ids,
             samples_per_frame, frames_per_second, sample_rate)
+        # Payloads are read into buffers from this pool; those of frames
+        # that are no longer needed are given back by `_release_frame`.
+        self._buffer_pool = BufferPool()
+        self.prefetch = prefetch
+        self.prefetch_decode = prefetch_decode
+        self._prefetcher = None
+        self.workers = workers
+        self._decode_pool = None
 
     @staticmethod
     def _get_frame_rate(fh, header_class):
@@ -150,6 +292,14 @@ class VLBIStreamReaderBase(VLBIStreamBase):
         fh.seek(oldpos)
         return max_frame + 1
 
+    def _release_frame(self, frame):
+        """Give the payload memory of a frame (or frame set) back to the pool.
+
+        Should only be called when no data of the frame are needed any more.
+        """
+        for f in getattr(frame, 'frames', [frame]):
+            self._buffer_pool.release(f.payload.words)
+
     @lazyproperty
     def header1(self):
         """Last header of the file."""
@@ -216,8 +366,392 @@ class VLBIStreamReaderBase(VLBIStreamBase):
 
         return self.offset
 
+    def read(self, count=None, fill_value=0., squeeze=True, out=None):
+        """Read count samples.
+
+        The range retrieved can span multiple frames.
+
+        Parameters
+        ----------
+        count : int
+            Number of samples to read.  If omitted or negative, the whole
+            file is read.
+        fill_value : float or complex
+            Value to use for invalid or missing data.
+        squeeze : bool
+            If `True` (default), remove channel and thread dimensions if unity.
+        out : `None` or array
+            Array to store the data in. If given, count will be inferred,
+            and squeeze is set to `False`.
+
+        Returns
+        -------
+        out : array of float or complex
+            Dimensions are (sample-time, vlbi-thread, channel).
+        """
+        if out is None:
+            if count is None or count < 0:
+                count = self.size - self.offset
+
+            out = self._empty_out(count)
+        else:
+            count = out.shape[0]
+            squeeze = False
+
+        offset0 = self.offset
+        parallel = self.workers > 1 and count > self.samples_per_frame
+        if parallel and self._decode_pool is None:
+            self._decode_pool = ThreadPool(self.workers)
+        # Frames being decoded in parallel, with their AsyncResult.
+        pending = deque()
+        try:
+            while count > 0:
+                frame_index, sample_offset = divmod(self.offset,
+                                                    self.samples_per_frame)
+                nsample = min(count, self.samples_per_frame - sample_offset)
+                sample = self.offset - offset0
+                if parallel and frame_index != self._frame_index:
+                    # Read the frame, but decode it in a worker thread.
+                    frame, decoded = self._fetch_frame(frame_index,
+                                                       fill_value)
+                    result = self._decode_pool.apply_async(
+                        self._decode_into,
+                        (out[sample:sample + nsample], frame, sample_offset,
+                         fill_value, decoded))
+                    pending.append((frame_index, frame, result))
+                    # Limit the number of frames held in memory.
+                    if len(pending) > 2 * self.workers:
+                        done_index, done_frame, done_result = pending.popleft()
+                        done_result.wait()
+                        self._release_frame(done_frame)
+                        done_result.get()
+                else:
+                    data = self._get_frame_data(frame_index, fill_value)
+                    # Copy relevant data from frame into output.
+                    out[sample:sample + nsample] = (
+                        data[sample_offset:sample_offset + nsample])
+                self.offset += nsample
+                count -= nsample
+        finally:
+            # Ensure workers are done with our frames and output array.
+            for item in pending:
+                item[2].wait()
+
+        done = [item[1] for item in pending]
+        if pending and pending[-1][0] == frame_index:
+            # Keep the last frame read around for subsequent reads.
+            done[-1] = self._frame
+            self._frame_index, self._frame = pending[-1][:2]
+            self._frame_data = None
+        for frame in done:
+            self._release_frame(frame)
+        for item in pending:
+            item[2].get()
+
+        return out.squeeze() if squeeze else out
+
+    def iter_chunks(self, nsample, overlap=0, out=None, squeeze=True,
+                    **kwargs):
+        """Iterate over the stream in blocks of ``nsample`` samples.
+
+        Iteration starts at the current position, and stops once fewer than
+        ``nsample - overlap`` samples remain.  Blocks are read into a ring of
+        buffers that are reused, so no memory is allocated for each block.
+        Hence, a block yielded will be overwritten once the ring wraps
+        around, i.e., with the default of two buffers, two iterations later.
+
+        Parameters
+        ----------
+        nsample : int
+            Number of samples in each block.
+        overlap : int, optional
+            Number of samples at the end of a block to include at the start
+            of the next one.  These are copied, not read again.  Default: 0.
+        out : array or list of array, optional
+            Buffer(s) to use, with the shape and dtype of the unsqueezed
+            output of ``read`` (hence, with length ``nsample``).  If not
+            enough are given to make a ring of two, further ones are created
+            as needed.
+        squeeze : bool
+            If `True` (default), remove channel and thread dimensions if unity
+            from the blocks yielded.
+        **kwargs
+            Any further arguments for ``read`` (e.g., ``fill_value``).
+
+        Yields
+        ------
+        block : array
+            With dimensions (sample-time, vlbi-thread, channel).
+        """
+        if not 0 <= overlap < nsample:
+            raise ValueError("overlap should be non-negative and smaller "
+                             "than the number of samples per block.")
+        if out is None:
+            buffers = []
+        elif isinstance(out, np.ndarray):
+            buffers = [out]
+        else:
+            buffers = list(out)
+        if any(buf.shape[0] != nsample for buf in buffers):
+            raise ValueError("buffers passed in should have length nsample.")
+        buffers += [None] * (2 - len(buffers))
+
+        stop = self.size
+        block = None
+        index = 0
+        # Number of samples to read for the next block.
+        count = nsample
+        while self.offset + count <= stop:
+            previous = block
+            block = buffers[index]
+            if previous is None:
+                if block is None:
+                    block = self.read(nsample, squeeze=False, **kwargs)
+                else:
+                    self.read(out=block, **kwargs)
+            else:
+                if block is None:
+                    block = np.empty_like(previous)
+                if overlap:
+                    block[:overlap] = previous[nsample - overlap:]
+                self.read(out=block[overlap:], **kwargs)
+            buffers[index] = block
+            index = (index + 1) % len(buffers)
+            count = nsample - overlap
+
+            if squeeze:
+                yield block.squeeze(axis=tuple(
+                    i for i in range(1, block.ndim) if block.shape[i] == 1))
+            else:
+                yield block
+
+    def _empty_out(self, count):
+        """Create an output array for ``count`` samples."""
+        return np.empty((self.nthread, count), dtype=self._frame.dtype).T
+
+    def _decode_frame(self, frame, fill_value=0.):
+        """Decode a frame, selecting the requested threads.
+
+        Returns
+        -------
+        data : array
+            With dimensions (sample-time, vlbi-thread[, channel]).
+        """
+        frame.invalid_data_value = fill_value
+        data = frame.data
+        if self.thread_ids:
+            data = data[:, self.thread_ids]
+        return data
+
+    def _decode_into(self, out, frame, sample_offset, fill_value=0.,
+                     decoded=None):
+        """Decode a frame, storing the part starting at sample_offset in out.
+
+        Used for decoding in worker threads.  If ``decoded`` is given, and
+        was obtained with the same ``fill_value``, its data are used directly.
+        """
+        if decoded is None or decoded[0] != fill_value:
+            data = self._decode_frame(frame, fill_value)
+        else:
+            data = decoded[1]
+        out[...] = data[sample_offset:sample_offset + len(out)]
+
+    def _get_frame_data(self, index, fill_value=0.):
+        """Get decoded data of the frame at ``index``.
+
+        The frame is read if it is not the current one, and decoded data
+        are kept, so that they can be reused for subsequent reads.
+        """
+        if index != self._frame_index:
+            frame, decoded = self._fetch_frame(index, fill_value)
+            self._release_frame(self._frame)
+            self._frame = frame
+            self._frame_index = index
+            self._frame_data = decoded
+
+        if self._frame_data is None or self._frame_data[0] != fill_value:
+            self._frame_data = fill_value, self._decode_frame(self._frame,
+                                                              fill_value)
+        return self._frame_data[1]
+
+    def _fetch_frame(self, index, fill_value=0.):
+        """Get the frame at ``index``, from the prefetcher if possible.
+
+        Returns
+        -------
+        frame : frame or frame set
+            As read by ``_read_frame``.
+        decoded : tuple or `None`
+            Fill value and decoded data if the frame was decoded already;
+            `None` otherwise.
+        """
+        if self.prefetch and self._prefetcher is None:
+            nframe = -(-self.size // self.samples_per_frame)
+            self._prefetcher = FramePrefetcher(self, nframe, self.prefetch,
+                                               decode=self.prefetch_decode)
+
+        if self._prefetcher is not None:
+            if index < self._prefetcher.nframe:
+                self._prefetcher.fill_value = fill_value
+                return self._prefetcher.get(index)
+            # Past the end: nothing to prefetch, but ensure the file handle
+            # is ours before reading (and raising the ensuing error).
+            self._prefetcher.stop()
+
+        return self._read_frame(index), None
+
+    def close(self):
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+        if self._decode_pool is not None:
+            self._decode_pool.close()
+            self._decode_pool.join()
+            self._decode_pool = None
+        return super(VLBIStreamReaderBase, self).close()
+
+
+class FrameWriterPipeline(object):
+    """Encode frames in worker threads and write them in a background thread.
+
+    Frames are written in the order in which they are put in, using the
+    stream's ``_frame_tofile`` method, after having been encoded with its
+    ``_make_frame`` method.  The data buffers passed in are recycled once
+    encoded;  new ones can be obtained with `get_buffer`, which will block
+    if too many frames are still being encoded.
+
+    Errors in encoding or writing are raised on the next call to `put`,
+    `flush`, or `close`.
+
+    Parameters
+    ----------
+    stream : `~baseband.vlbi_base.base.VLBIStreamWriterBase`
+        Stream writer providing ``_make_frame`` and ``_frame_tofile``.
+    workers : int
+        Number of threads used for encoding.
+    nbuffer : int, optional
+        Maximum number of frame buffers in use.  Default: 2 * workers + 1.
+    """
+    def __init__(self, stream, workers, nbuffer=None):
+        self.stream = stream
+        self.nbuffer = 2 * workers + 1 if nbuffer is None else nbuffer
+        self._nallocated = 0
+        self._free = queue.Queue()
+        self._results = queue.Queue(self.nbuffer)
+        self._error = None
+        self._pool = ThreadPool(workers)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_buffer(self, template):
+        """Get a frame buffer, like ``template``."""
+        if self._nallocated < self.nbuffer:
+            self._nallocated += 1
+            return np.zeros_like(template)
+        return self._free.get()
+
+    def put(self, data, header, kwargs):
+        """Encode a frame from data and header, and queue it for writing."""
+        self._check()
+        result = self._pool.apply_async(self._encode, (data, header, kwargs))
+        self._results.put(result)
+
+    def flush(self):
+        """Wait until all frames put in have been written."""
+        self._results.join()
+        self._check()
+
+    def close(self):
+        """Write all remaining frames, and stop the threads."""
+        self._results.put(None)
+        self._thread.join()
+        self._pool.close()
+        self._pool.join()
+        self._check()
+
+    def _check(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _encode(self, data, header, kwargs):
+        try:
+            return self.stream._make_frame(data, header, **kwargs)
+        finally:
+            self._free.put(data)
+
+    def _run(self):
+        while True:
+            result = self._results.get()
+            try:
+                if result is None:
+                    return
+                # After an error, just drain the queue.
+                if self._error is None:
+                    self.stream._frame_tofile(result.get())
+            except Exception as exc:
+                self._error = exc
+            finally:
+                self._results.task_done()
+
 
 class VLBIStreamWriterBase(VLBIStreamBase):
+    """Base for VLBI stream writers.
+
+    Subclasses should buffer data for a frame in ``_data``, and pass it on
+    by calling `_write_frame`, which uses ``_make_frame`` to encode the data
+    and ``_frame_tofile`` to write the resulting frame.
+
+    If a number of ``workers`` is passed in, frames are encoded by that many
+    worker threads, and written by a separate thread, so that `write` only
+    needs to copy data into the frame buffer.  Use `flush` to ensure all
+    data have been written.
+    """
+
+    def __init__(self, fh_raw, header0, nchan, bps, complex_data, thread_ids,
+                 samples_per_frame, frames_per_second=None,
+                 sample_rate=None, workers=0):
+        super(VLBIStreamWriterBase, self).__init__(
+            fh_raw, header0, nchan, bps, complex_data, thread_ids,
+            samples_per_frame, frames_per_second, sample_rate)
+        self.workers = workers
+        self._pipeline = None
+
+    def _make_frame(self, data, header, **kwargs):
+        """Encode a frame from data and header."""
+        return self._frame_class.fromdata(data, header, **kwargs)
+
+    def _frame_tofile(self, frame):
+        """Write an encoded frame to the underlying file."""
+        frame.tofile(self.fh_raw)
+
+    def _write_frame(self, header, **kwargs):
+        """Encode the data in the frame buffer and write the frame.
+
+        If using workers, the frame is queued, and ``_data`` is replaced by a
+        new buffer.
+        """
+        if not self.workers:
+            self._frame_tofile(self._make_frame(self._data, header,
+                                                **kwargs))
+            return
+
+        if self._pipeline is None:
+            self._pipeline = FrameWriterPipeline(self, self.workers)
+        self._pipeline.put(self._data, header, kwargs)
+        self._data = self._pipeline.get_buffer(self._data)
+
+    def flush(self):
+        """Ensure all frames have been written and flush the file."""
+        if self._pipeline is not None:
+            self._pipeline.flush()
+        return self.fh_raw.flush()
+
+    def _close_pipeline(self):
+        if self._pipeline is not None:
+            pipeline, self._pipeline = self._pipeline, None
+            pipeline.close()
+
     def close(self):
         extra = self.offset % self.samples_per_frame
         if extra != 0:
@@ -227,4 +761,7 @@ class VLBIStreamWriterBase(VLBIStreamBase):
                                  self.nthread, self.nchan)),
                        invalid_data=True)
             assert self.offset % self.samples_per_frame == 0
-        return super(VLBIStreamWriterBase, self).close()
+        try:
+            self._close_pipeline()
+        finally:
+            super(VLBIStreamWriterBase, self).close()
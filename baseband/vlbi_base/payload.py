@@ -66,17 +66,73 @@ class VLBIPayloadBase(object):
             Handle to the file from which data is read
         payloadsize : int
             Number of bytes to read (default: as given in ``cls._size``.
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to take the memory to read the payload into.
 
         Any other (keyword) arguments are passed on to the class initialiser.
         """
         payloadsize = kwargs.pop('payloadsize', cls._size)
+        buffer_pool = kwargs.pop('buffer_pool', None)
         if payloadsize is None:
             raise ValueError("Payloadsize should be given as an argument "
                              "if no default is defined on the class.")
-        s = fh.read(payloadsize)
-        if len(s) < payloadsize:
+        words = cls._words_fromfile(fh, payloadsize, buffer_pool=buffer_pool)
+        return cls(words, *args, **kwargs)
+
+    @classmethod
+    def _words_fromfile(cls, fh, payloadsize, dtype=None, buffer_pool=None):
+        """Read payload words from a file handle.
+
+        The bytes are read directly into a preallocated array, taken from
+        ``buffer_pool`` if given, thus avoiding intermediate copies.
+
+        Parameters
+        ----------
+        fh : filehandle
+            Handle to the file from which data is read.
+        payloadsize : int
+            Number of bytes to read.
+        dtype : `~numpy.dtype`, optional
+            Type of the words (default: ``cls._dtype_word``).
+        buffer_pool : `~baseband.vlbi_base.utils.BufferPool`, optional
+            Pool from which to get the memory to read into.
+        """
+        dtype = cls._dtype_word if dtype is None else np.dtype(dtype)
+        buf = (np.empty(payloadsize, np.uint8) if buffer_pool is None
+               else buffer_pool.get(payloadsize))
+        try:
+            cls._readinto(fh, buf)
+        except EOFError:
+            if buffer_pool is not None:
+                buffer_pool.release(buf)
+            raise
+
+        return buf.view(dtype)
+
+    @staticmethod
+    def _readinto(fh, buf):
+        """Fill a contiguous byte array with data read from a file handle.
+
+        Raises `EOFError` if the file does not hold enough data.
+        """
+        size = buf.size
+        try:
+            readinto = fh.readinto
+        except AttributeError:
+            s = fh.read(size)
+            nread = len(s)
+            buf[:nread] = np.frombuffer(s, np.uint8)
+        else:
+            nread = readinto(buf) or 0
+            # Raw streams are allowed to return less than requested.
+            while 0 < nread < size:
+                extra = readinto(buf[nread:])
+                if not extra:
+                    break
+                nread += extra
+
+        if nread < size:
             raise EOFError("Could not read full payload.")
-        return cls(np.fromstring(s, dtype=cls._dtype_word), *args, **kwargs)
 
     def tofile(self, fh):
         """Write VLBI payload to filehandle."""
@@ -1,4 +1,4 @@
-from ..utils import bcd_encode, bcd_decode, CRC
+from ..utils import bcd_encode, bcd_decode, CRC, BufferPool
 from ..header import HeaderParser, VLBIHeaderBase, four_word_struct
 from ..payload import VLBIPayloadBase
 from ..frame import VLBIFrameBase
@@ -305,6 +305,32 @@ class TestVLBIBase(object):
                 s, payloadsize=len(self.payload.words) * 4,
                 sample_shape=(2,), bps=8)
         assert payload == self.payload
+        # Truncated payloads should raise EOFError.
+        with io.BytesIO() as s:
+            self.payload.tofile(s)
+            s.seek(4)
+            with pytest.raises(EOFError):
+                self.Payload.fromfile(
+                    s, payloadsize=len(self.payload.words) * 4,
+                    sample_shape=(2,), bps=8)
+
+    def test_payload_fromfile_buffer_pool(self):
+        pool = BufferPool()
+        with io.BytesIO() as s:
+            self.payload.tofile(s)
+            s.seek(0)
+            payload = self.Payload.fromfile(
+                s, payloadsize=len(self.payload.words) * 4,
+                sample_shape=(2,), bps=8, buffer_pool=pool)
+            assert payload == self.payload
+            words = payload.words
+            pool.release(words)
+            s.seek(0)
+            payload2 = self.Payload.fromfile(
+                s, payloadsize=len(self.payload.words) * 4,
+                sample_shape=(2,), bps=8, buffer_pool=pool)
+        assert payload2 == self.payload
+        assert np.may_share_memory(payload2.words, words)
 
     def test_payload_fromdata(self):
         data = np.random.normal(0., 64., 16).reshape(16, 1)
@@ -399,3 +425,43 @@ def test_crc():
     assert '{:03x}'.format(crc) == crc_expected
     fullstream = np.hstack((bitstream, crcstream))
     assert crc12.check(fullstream)
+
+
+def test_buffer_pool():
+    pool = BufferPool(maximum=2)
+    buf = pool.get(16)
+    assert buf.dtype == np.uint8 and buf.shape == (16,)
+    pool.release(buf.view('<u4'))
+    buf2 = pool.get(16)
+    assert np.may_share_memory(buf, buf2)
+    # Different sizes are kept separately.
+    buf3 = pool.get(8)
+    assert not np.may_share_memory(buf, buf3)
+    # Memory not owned by numpy is not taken.
+    pool.release(np.frombuffer(b'0123456789abcdef', np.uint8))
+    assert not np.may_share_memory(pool.get(16), buf)
+    # At most maximum buffers are kept.
+    buffers = [np.empty(4, np.uint8) for i in range(3)]
+    for buf in buffers:
+        pool.release(buf)
+    assert len(pool._buffers[4]) == 2
+
+
+def test_buffer_pool_threads():
+    # Buffers released concurrently from several threads should all be
+    # kept, also when the first ones of a given size arrive together.
+    from multiprocessing.pool import ThreadPool
+    pool = BufferPool(maximum=1000)
+    thread_pool = ThreadPool(8)
+    try:
+        for nbytes in range(1, 21):
+            buffers = [np.empty(nbytes, np.uint8) for i in range(64)]
+            thread_pool.map(pool.release, buffers, chunksize=1)
+            assert len(pool._buffers[nbytes]) == 64
+            got = thread_pool.map(lambda i: pool.get(nbytes), range(64),
+                                  chunksize=1)
+            assert len(set(id(buf.base) for buf in got)) == 64
+            assert len(pool._buffers[nbytes]) == 0
+    finally:
+        thread_pool.close()
+        thread_pool.join()
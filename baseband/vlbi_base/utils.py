@@ -1,7 +1,9 @@
 import warnings
+import threading
+from collections import deque
 import numpy as np
 
-__all__ = ['bcd_decode', 'bcd_encode', 'CRC']
+__all__ = ['bcd_decode', 'bcd_encode', 'CRC', 'BufferPool']
 
 
 def bcd_decode(value):
@@ -120,3 +122,58 @@ class CRC(object):
         for i in range(0, len(stream) - len(self)):
             stream[i:i+pol_bin.size] ^= (pol_bin & stream[i])
         return stream[-len(self):]
+
+
+class BufferPool(object):
+    """Small pool of reusable buffers for reading payloads.
+
+    Stream readers use this to read payloads straight into preallocated
+    arrays, such that steady-state sequential reading does not allocate new
+    memory for every frame.  Buffers are handed out with `get`, and should be
+    given back with `release` once nothing refers to them any more.
+
+    Parameters
+    ----------
+    maximum : int, optional
+        Maximum number of released buffers kept for any given size.
+        Default: 16.  Further ones are simply left to garbage collection.
+
+    Notes
+    -----
+    The pool can be shared between threads, such as those of a prefetcher
+    and decoding workers.
+    """
+    def __init__(self, maximum=16):
+        self.maximum = maximum
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def get(self, nbytes):
+        """Get a buffer of ``nbytes`` bytes, as an uninitialised uint8 array.
+        """
+        try:
+            buffer = self._buffers[nbytes].pop()
+        except (KeyError, IndexError):
+            return np.empty(nbytes, np.uint8)
+        return buffer.view(np.uint8)
+
+    def release(self, array):
+        """Give back the memory underlying ``array`` for reuse.
+
+        Only arrays that own their memory (or views of those) are kept;
+        anything else, such as memory maps, is silently ignored.
+        """
+        while isinstance(array.base, np.ndarray):
+            array = array.base
+        if (type(array) is not np.ndarray or array.base is not None or
+                array.ndim != 1 or not array.flags.writeable):
+            return
+        buffers = self._buffers.get(array.nbytes)
+        if buffers is None:
+            # Creating the deque for a new size is guarded, so that threads
+            # releasing buffers of the same size do not each create one.
+            with self._lock:
+                buffers = self._buffers.setdefault(
+                    array.nbytes, deque(maxlen=self.maximum))
+        # deque.append and pop are atomic, so they need no lock.
+        buffers.append(array)
@@ -0,0 +1,9 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+"""Benchmarks for baseband, to be run with airspeed velocity (asv).
+
+From the top-level directory, run, e.g., ``asv run`` to benchmark the
+current master, or ``asv continuous master HEAD`` to compare a branch
+against it.  To try the benchmarks in the current environment, without
+building, use ``asv dev``.  All files needed are generated in temporary
+directories when the benchmarks are set up.
+"""
@@ -0,0 +1,173 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+"""Synthetic baseband files for the benchmarks.
+
+All files are generated in a temporary directory when a benchmark is set
+up, and are filled with (seeded) random noise, so that no external data are
+needed.  Where a header is needed as a template, it is taken from the
+sample files included with baseband.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+
+from baseband import vdif, mark5b, mark4, dada, gsb
+from baseband.data import SAMPLE_VDIF
+
+
+FORMATS = ('vdif', 'mark5b', 'mark4', 'dada', 'gsb')
+"""Formats covered by the stream benchmarks."""
+
+MODULES = {'vdif': vdif, 'mark5b': mark5b, 'mark4': mark4, 'dada': dada,
+           'gsb': gsb}
+
+TIME = Time('2018-01-01T00:00:00', precision=9)
+
+NSAMPLE = 2**20
+"""Approximate number of samples in the synthetic stream files."""
+
+
+def noise(shape, complex_data=False, seed=12345):
+    """Gaussian noise with a standard deviation of 2, in float32."""
+    rng = np.random.RandomState(seed)
+    data = rng.normal(0., 2., shape).astype(np.float32)
+    if complex_data:
+        data = data + 1j * rng.normal(0., 2., shape).astype(np.float32)
+    return data
+
+
+def vdif_header(bps=2):
+    """A VDIF EDV=3 header like those of the sample file, for given bps."""
+    with vdif.open(SAMPLE_VDIF, 'rb') as fh:
+        header = vdif.VDIFHeader.fromfile(fh).copy()
+    header.bps = bps
+    return header
+
+
+def gsb_header():
+    """A GSB rawdump header."""
+    return gsb.GSBHeader(tuple('2015 04 27 18 45 00 0.000000240'.split()))
+
+
+class SyntheticStream(object):
+    """A synthetic stream file for one format.
+
+    Parameters
+    ----------
+    fmt : str
+        Format of the file; one of `FORMATS`.
+    dirname : str
+        Directory in which to create files.
+    nsample : int, optional
+        Number of samples in the file; rounded down to a whole number of
+        frames (but at least one).  Default: `NSAMPLE`.
+
+    Notes
+    -----
+    On initialization, ``data`` is created and written to the file, which
+    can then be opened with `open`.  With `write`, the data can be written
+    to another file in the same directory.
+    """
+    def __init__(self, fmt, dirname, nsample=NSAMPLE):
+        self.fmt = fmt
+        self.module = MODULES[fmt]
+        self.dirname = dirname
+        getattr(self, '_setup_' + fmt)()
+        nframes = max(1, nsample // self.samples_per_frame)
+        shape = ((self.samples_per_frame * nframes,) + self.sample_shape)
+        self.data = noise(shape, self.complex_data)
+        self.name, self.writer_kwargs = self._output('stream')
+        self.write(self.name, self.writer_kwargs)
+
+    def _setup_vdif(self):
+        header = vdif_header()
+        self.writer_kwargs = dict(header=header, nthread=8)
+        self.reader_kwargs = {}
+        self.samples_per_frame = header.samples_per_frame
+        self.sample_shape = (8,)
+        self.complex_data = False
+
+    def _setup_mark5b(self):
+        self.writer_kwargs = dict(time=TIME, nchan=8, bps=2,
+                                  sample_rate=32*u.MHz)
+        self.reader_kwargs = dict(nchan=8, bps=2, ref_mjd=TIME.mjd,
+                                  sample_rate=32*u.MHz)
+        self.samples_per_frame = 5000
+        self.sample_shape = (8,)
+        self.complex_data = False
+
+    def _setup_mark4(self):
+        self.writer_kwargs = dict(time=TIME, ntrack=64, bps=2, fanout=4,
+                                  sample_rate=32*u.MHz)
+        self.reader_kwargs = dict(ntrack=64, decade=2010,
+                                  sample_rate=32*u.MHz)
+        self.samples_per_frame = 80000
+        self.sample_shape = (8,)
+        self.complex_data = False
+
+    def _setup_dada(self):
+        self.writer_kwargs = dict(time=TIME, bps=8, complex_data=True,
+                                  bandwidth=16*u.MHz, payloadsize=64000,
+                                  nthread=2, nchan=1)
+        self.reader_kwargs = {}
+        self.samples_per_frame = 16000
+        self.sample_shape = (2,)
+        self.complex_data = True
+
+    def _setup_gsb(self):
+        self.writer_kwargs = dict(header=gsb_header(), bps=4,
+                                  sample_rate=2**25*u.Hz,
+                                  samples_per_frame=2**16)
+        self.reader_kwargs = dict(samples_per_frame=2**16)
+        self.samples_per_frame = 2**16
+        self.sample_shape = ()
+        self.complex_data = False
+
+    def _output(self, prefix):
+        """File name and writer arguments for an output file."""
+        if self.fmt == 'dada':
+            # DADA files hold a single frame; use a template for the others.
+            prefix += '_{frame_nr:04d}'
+        name = os.path.join(self.dirname, prefix + '.' + self.fmt)
+        kwargs = self.writer_kwargs.copy()
+        if self.fmt == 'gsb':
+            kwargs['raw'] = os.path.join(self.dirname, prefix + '.raw')
+        return name, kwargs
+
+    def write(self, name=None, writer_kwargs=None):
+        """Write the data as a stream, by default to a scratch file."""
+        if name is None:
+            name, writer_kwargs = self._output('scratch')
+        with self.module.open(name, 'ws', **writer_kwargs) as fw:
+            fw.write(self.data)
+
+    def open(self, **kwargs):
+        """Open the synthetic file as a stream."""
+        kwargs = dict(self.reader_kwargs, **kwargs)
+        if self.fmt == 'gsb':
+            kwargs['raw'] = self.writer_kwargs['raw']
+        return self.module.open(self.name, 'rs', **kwargs)
+
+    def open_raw(self):
+        """Open the synthetic file in binary mode, for reading frames."""
+        return self.module.open(self.name.format(frame_nr=0), 'rb')
+
+
+class TemporaryDirectory(object):
+    """Base class that creates a temporary directory on setup.
+
+    The directory, ``dirname``, is removed again on teardown.  Subclasses
+    that override ``setup`` or ``teardown`` should call those of the
+    superclass.
+    """
+    def setup(self, *args):
+        self.dirname = tempfile.mkdtemp(prefix='baseband-bench-')
+
+    def teardown(self, *args):
+        shutil.rmtree(self.dirname, ignore_errors=True)
@@ -0,0 +1,67 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+"""Benchmarks of parsing and verifying headers, for all formats."""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+
+from baseband import vdif, mark5b, mark4, dada, gsb
+from baseband.data import (SAMPLE_VDIF, SAMPLE_MARK5B, SAMPLE_MARK4,
+                           SAMPLE_DADA)
+
+from .common import FORMATS, gsb_header
+
+
+HEADER_CLASSES = {'vdif': vdif.VDIFHeader,
+                  'mark5b': mark5b.Mark5BHeader,
+                  'mark4': mark4.Mark4Header,
+                  'dada': dada.DADAHeader,
+                  'gsb': gsb.GSBHeader}
+
+
+def sample_header(fmt):
+    """First header of the sample file for the given format.
+
+    Returns the header, as well as the extra arguments needed to read it
+    from a file.
+    """
+    if fmt == 'vdif':
+        with vdif.open(SAMPLE_VDIF, 'rb') as fh:
+            return vdif.VDIFHeader.fromfile(fh), {}
+    elif fmt == 'mark5b':
+        with mark5b.open(SAMPLE_MARK5B, 'rb') as fh:
+            header = mark5b.Mark5BHeader.fromfile(fh, ref_mjd=57000)
+            return header, dict(kday=header.kday)
+    elif fmt == 'mark4':
+        with mark4.open(SAMPLE_MARK4, 'rb') as fh:
+            return (fh.find_header(ntrack=64, decade=2010),
+                    dict(ntrack=64, decade=2010))
+    elif fmt == 'dada':
+        with dada.open(SAMPLE_DADA, 'rb') as fh:
+            return dada.DADAHeader.fromfile(fh), {}
+    else:
+        return gsb_header(), {}
+
+
+class HeaderParsing(object):
+    """Read headers from memory, verify them, and calculate their time."""
+    params = list(FORMATS)
+    param_names = ['format']
+
+    def setup(self, fmt):
+        self.header, self.kwargs = sample_header(fmt)
+        self.fh = io.StringIO() if fmt == 'gsb' else io.BytesIO()
+        self.header.tofile(self.fh)
+
+    def teardown(self, fmt):
+        self.fh.close()
+
+    def time_fromfile(self, fmt):
+        self.fh.seek(0)
+        HEADER_CLASSES[fmt].fromfile(self.fh, **self.kwargs)
+
+    def time_verify(self, fmt):
+        self.header.verify()
+
+    def time_time(self, fmt):
+        self.header.time
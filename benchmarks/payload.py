@@ -0,0 +1,92 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+"""Benchmarks of decoding and encoding payloads, for all formats and bps."""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from baseband import vdif, mark5b, mark4, dada, gsb
+from baseband.data import SAMPLE_MARK4
+
+from .common import noise
+
+
+PAYLOAD_CLASSES = {'vdif': vdif.VDIFPayload,
+                   'mark5b': mark5b.Mark5BPayload,
+                   'mark4': mark4.Mark4Payload,
+                   'dada': dada.DADAPayload,
+                   'gsb': gsb.GSBPayload}
+
+
+def mark4_header():
+    """Mark 4 header of the sample file (64 tracks, 8 channels, fanout 4)."""
+    with mark4.open(SAMPLE_MARK4, 'rb') as fh:
+        return fh.find_header(ntrack=64, decade=2010)
+
+
+class PayloadCoding(object):
+    """Decode and encode payloads holding 2**17 samples of 8 channels.
+
+    For formats with a fixed payload size, a single frame is used instead.
+    For Mark 4, the encoding is taken from the sample file header, which is
+    for 8 channels with fanout 4;  see `Mark4PayloadCoding` for the others.
+    """
+    params = (sorted(PAYLOAD_CLASSES), [1, 2, 4, 8, 16])
+    param_names = ['format', 'bps']
+
+    def setup(self, fmt, bps):
+        cls = PAYLOAD_CLASSES[fmt]
+        if fmt == 'mark4':
+            header = mark4_header()
+            supported = bps == header.bps
+        else:
+            supported = bps in cls._decoders
+        if not supported:
+            raise NotImplementedError('{0} payloads cannot have {1} bits.'
+                                      .format(fmt, bps))
+
+        if fmt == 'mark4':
+            nsample = (header.payloadsize // (header.ntrack // 8) *
+                       header.fanout)
+            self.data = noise((nsample, header.nchan))
+            self.encode_kwargs = dict(header=header)
+        else:
+            nsample = (2**17 if cls._size is None else
+                       cls._size * 8 // (bps * 8))
+            self.data = noise((nsample, 8))
+            self.encode_kwargs = dict(bps=bps)
+        self.cls = cls
+        self.payload = cls.fromdata(self.data, **self.encode_kwargs)
+
+    def time_decode(self, fmt, bps):
+        self.payload.data
+
+    def time_decode_slice(self, fmt, bps):
+        self.payload[1000:2000]
+
+    def time_encode(self, fmt, bps):
+        self.cls.fromdata(self.data, **self.encode_kwargs)
+
+
+class Mark4PayloadCoding(object):
+    """Decode and encode Mark 4 payloads, for all supported track layouts.
+
+    Each payload holds 2**17 samples, with the number of channels, bits per
+    sample and fanout given by the layout.
+    """
+    params = ['{0}chan_{1}bit_fanout{2}'.format(*coder)
+              for coder in sorted(mark4.Mark4Payload._decoders)]
+    param_names = ['layout']
+
+    def setup(self, layout):
+        nchan, bps, fanout = (int(part.strip('chanbitfanout'))
+                              for part in layout.split('_'))
+        self.data = noise((2**17, nchan))
+        self.encoder = mark4.Mark4Payload._encoders[nchan, bps, fanout]
+        self.kwargs = dict(nchan=nchan, bps=bps, fanout=fanout)
+        self.payload = mark4.Mark4Payload(self.encoder(self.data),
+                                          **self.kwargs)
+
+    def time_decode(self, layout):
+        self.payload.data
+
+    def time_encode(self, layout):
+        mark4.Mark4Payload(self.encoder(self.data), **self.kwargs)
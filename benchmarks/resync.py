@@ -0,0 +1,71 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+"""Benchmarks of finding headers in corrupted or truncated files."""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import os
+
+import numpy as np
+
+from .common import SyntheticStream, TemporaryDirectory
+
+
+class CorruptFile(TemporaryDirectory):
+    """Base class that opens a corrupted synthetic file.
+
+    The synthetic stream file is prefixed with random bytes amounting to
+    about half a frame, and ends in a truncated frame, so that searches from
+    either end have to step through those.
+    """
+    def setup(self, fmt):
+        super(CorruptFile, self).setup(fmt)
+        stream = SyntheticStream(fmt, self.dirname, nsample=2**16)
+        with stream.open() as fh:
+            self.header0 = fh.header0
+        self.framesize = self.header0.framesize
+        garbage = np.random.RandomState(1).randint(
+            0, 256, self.framesize // 2 + 3).astype(np.uint8)
+        name = os.path.join(self.dirname, 'corrupt.' + fmt)
+        with io.open(name, 'wb') as fw, io.open(stream.name, 'rb') as fr:
+            fw.write(garbage.tostring())
+            data = fr.read()
+            fw.write(data)
+            fw.write(data[:self.framesize // 2])
+        self.fh = stream.module.open(name, 'rb')
+
+    def teardown(self, fmt):
+        self.fh.close()
+        super(CorruptFile, self).teardown(fmt)
+
+
+class FindHeader(CorruptFile):
+    """Search for a header, forwards from the start of the file, or
+    backwards from one frame before its end (as is done by stream readers
+    to find the last header)."""
+    params = ['vdif', 'mark5b', 'mark4']
+    param_names = ['format']
+
+    def time_find_header_forward(self, fmt):
+        self.fh.seek(0)
+        self.fh.find_header(template_header=self.header0)
+
+    def time_find_header_backward(self, fmt):
+        self.fh.seek(-self.framesize, 2)
+        self.fh.find_header(template_header=self.header0,
+                            maximum=10*self.framesize, forward=False)
+
+
+class FindFrame(CorruptFile):
+    """Search for the Mark 4 frame pattern, forwards and backwards."""
+    params = ['mark4']
+    param_names = ['format']
+
+    def time_find_frame_forward(self, fmt):
+        self.fh.seek(0)
+        self.fh.find_frame(ntrack=self.header0.ntrack)
+
+    def time_find_frame_backward(self, fmt):
+        self.fh.seek(-self.framesize, 2)
+        self.fh.find_frame(ntrack=self.header0.ntrack,
+                           maximum=10*self.framesize, forward=False)
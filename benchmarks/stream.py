@@ -0,0 +1,171 @@
+# Licensed under the GPLv3 - see LICENSE.rst
+"""Benchmarks of stream and frame reading and writing, for all formats."""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+
+from .common import FORMATS, SyntheticStream, TemporaryDirectory
+
+
+class Stream(TemporaryDirectory):
+    """Base class that writes a synthetic stream for the given format."""
+    params = list(FORMATS)
+    param_names = ['format']
+
+    def setup(self, fmt):
+        super(Stream, self).setup(fmt)
+        self.stream = SyntheticStream(fmt, self.dirname)
+
+
+class StreamOpen(Stream):
+    """Open a stream and determine its size (which may need the last
+    header)."""
+    def time_open(self, fmt):
+        with self.stream.open() as fh:
+            fh.size
+
+
+class StreamRead(Stream):
+    """Read a stream fully, or in small pieces at random positions."""
+    def setup(self, fmt):
+        super(StreamRead, self).setup(fmt)
+        self.fh = self.stream.open()
+        self.offsets = np.random.RandomState(2).randint(
+            0, self.fh.size - 1000, 32)
+
+    def teardown(self, fmt):
+        self.fh.close()
+        super(StreamRead, self).teardown(fmt)
+
+    def time_read_sequential(self, fmt):
+        self.fh.seek(0)
+        self.fh.read()
+
+    def time_read_random(self, fmt):
+        for offset in self.offsets:
+            self.fh.seek(offset)
+            self.fh.read(1000)
+
+
+class StreamWrite(Stream):
+    """Write a stream in one go."""
+    def time_write(self, fmt):
+        self.stream.write()
+
+
+class FrameRead(Stream):
+    """Read single frames (or, for VDIF, frame sets) from a binary file."""
+    params = ['vdif', 'mark5b', 'mark4', 'dada']
+
+    def setup(self, fmt):
+        super(FrameRead, self).setup(fmt)
+        self.fh = self.stream.open_raw()
+        with self.stream.open() as fh:
+            header0 = fh.header0
+        if fmt == 'vdif':
+            self.read = self.fh.read_frameset
+            self.kwargs = {}
+        else:
+            self.read = self.fh.read_frame
+            if fmt == 'mark5b':
+                self.kwargs = dict(ref_mjd=header0.time.mjd, nchan=8, bps=2)
+            elif fmt == 'mark4':
+                self.kwargs = dict(ntrack=header0.ntrack,
+                                   decade=header0.decade)
+            else:
+                self.kwargs = {}
+
+    def teardown(self, fmt):
+        self.fh.close()
+        super(FrameRead, self).teardown(fmt)
+
+    def time_read_frame(self, fmt):
+        self.fh.seek(0)
+        self.read(**self.kwargs)
+
+    def time_read_frame_and_decode(self, fmt):
+        self.fh.seek(0)
+        self.read(**self.kwargs).data
+
+
+class StreamReadOptions(Stream):
+    """Read a stream fully, reading ahead or decoding in parallel."""
+    params = (['vdif', 'mark5b', 'mark4'],
+              ['default', 'prefetch', 'prefetch_decode', 'workers'])
+    param_names = ['format', 'option']
+    options = {'default': {},
+               'prefetch': dict(prefetch=4),
+               'prefetch_decode': dict(prefetch=4, prefetch_decode=True),
+               'workers': dict(workers=4)}
+
+    def setup(self, fmt, option):
+        super(StreamReadOptions, self).setup(fmt)
+        self.fh = self.stream.open(**self.options[option])
+
+    def teardown(self, fmt, option):
+        self.fh.close()
+        super(StreamReadOptions, self).teardown(fmt)
+
+    def time_read_sequential(self, fmt, option):
+        self.fh.seek(0)
+        self.fh.read()
+
+
+class StreamIterChunks(Stream):
+    """Iterate over a stream in blocks, with and without overlap."""
+    params = (list(FORMATS), [0, 4096])
+    param_names = ['format', 'overlap']
+
+    def setup(self, fmt, overlap):
+        super(StreamIterChunks, self).setup(fmt)
+        self.fh = self.stream.open()
+
+    def teardown(self, fmt, overlap):
+        self.fh.close()
+        super(StreamIterChunks, self).teardown(fmt)
+
+    def time_iter_chunks(self, fmt, overlap):
+        self.fh.seek(0)
+        for block in self.fh.iter_chunks(2**16, overlap=overlap):
+            pass
+
+
+class GSBMemmapRead(Stream):
+    """Read a GSB rawdump stream with and without memory mapping."""
+    params = [False, True]
+    param_names = ['memmap']
+
+    def setup(self, memmap):
+        super(GSBMemmapRead, self).setup('gsb')
+        self.fh = self.stream.open(memmap=memmap)
+
+    def teardown(self, memmap):
+        self.fh.close()
+        super(GSBMemmapRead, self).teardown()
+
+    def time_read_sequential(self, memmap):
+        self.fh.seek(0)
+        self.fh.read()
+
+
+class VDIFThreadRead(Stream):
+    """Read selected threads of a VDIF stream with 8 threads.
+
+    If not all threads are selected, the frames are read with positional
+    reads that skip the others.
+    """
+    params = [8, 4, 1]
+    param_names = ['nthread']
+
+    def setup(self, nthread):
+        super(VDIFThreadRead, self).setup('vdif')
+        self.fh = self.stream.open(thread_ids=list(range(nthread)))
+
+    def teardown(self, nthread):
+        self.fh.close()
+        super(VDIFThreadRead, self).teardown()
+
+    def time_read_sequential(self, nthread):
+        self.fh.seek(0)
+        self.fh.read()
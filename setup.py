@@ -71,8 +71,8 @@ scripts = [fname for fname in glob.glob(os.path.join('scripts', '*'))
 
 # Get configuration information from all of the various subpackages.
 # See the docstring for setup_helpers.update_package_files for more
-# details.
-package_info = get_package_info()
+# details.  The asv benchmarks are not part of the package.
+package_info = get_package_info(exclude=['benchmarks'])
 
 # Add the project-global data
 package_info['package_data'].setdefault(PACKAGENAME, [])